@@ -0,0 +1,313 @@
+"""Concurrent-session load test for the Streamlit app
+
+Starts `streamlit run src/app.py` headless and drives it over the same
+websocket protocol the browser uses, with N simulated users at once. Each
+user goes through the consent form, saves the patient form, opens
+Clinical Advice and generates the GP report, waiting for the background
+job to finish. A page render is one user interaction: from sending the
+widget change to the script run finishing.
+
+Every session count gets a fresh server so its peak RSS (the server plus
+its report workers) is not inflated by the previous level:
+
+    python benchmarks/load_test_app.py                              # 1, 4, 16 sessions
+    python benchmarks/load_test_app.py --sessions 1,8,32,64 --journeys 5 --output app_load.json
+
+Use the session count where p95 starts to climb steeply, and the RSS at
+that level, to set the container's concurrency and memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+sys.path.insert(0, SRC)
+
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+from tornado.websocket import websocket_connect  # noqa: E402
+
+from synthetic_cohort import generate_records  # noqa: E402
+
+SAMPLE_SECONDS = 0.05  # RSS sampling interval
+FINISHED_EARLY_FOR_RERUN = ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN
+REPORT_DONE = "Report generated successfully!"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(store_path):
+    """Launch the app headless and wait for its health check; returns (process, port)"""
+    port = _free_port()
+    command = [sys.executable, '-m', 'streamlit', 'run', os.path.join(SRC, 'app.py'),
+               '--server.headless', 'true', '--server.port', str(port),
+               '--browser.gatherUsageStats', 'false']
+    env = {**os.environ, 'PATIENT_STORE_PATH': store_path}
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).read()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("app did not start within 60 s")
+
+
+def _descendants(pid):
+    """Pids of every process below `pid` (Linux /proc)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid):
+    """Resident bytes of `pid` and its children (report workers)"""
+    if not os.path.isdir('/proc'):  # peak of all waited-for children, the best available
+        return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return _rss(pid) + sum(_rss(child) for child in _descendants(pid))
+
+
+class RSSSampler(threading.Thread):
+    """Background thread keeping the highest tree_rss(pid) seen"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = tree_rss(pid)
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(SAMPLE_SECONDS):
+            self.peak = max(self.peak, tree_rss(self.pid))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return max(self.peak, tree_rss(self.pid))
+
+
+class Session:
+    """One browser tab: a websocket to the app and the elements of its last run"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.elements = []
+
+    @classmethod
+    async def open(cls, port):
+        return cls(await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream"))
+
+    def close(self):
+        self.ws.close()
+
+    def widget(self, kind, label):
+        for element_kind, element in self.elements:
+            if element_kind == kind and element.label.startswith(label):
+                return element
+        raise LookupError(f"no {kind} '{label}' on the page")
+
+    def alerts(self):
+        return [element.body for kind, element in self.elements if kind == 'alert']
+
+    async def interact(self, *states):
+        """Send widget changes and read until the script run (and any reruns it asks for) finishes"""
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.widget_states.widgets.extend(states)
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise ConnectionError("app closed the connection")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':  # sent at the start of every script run
+                self.elements = []
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof('type')
+                self.elements.append((element_kind, getattr(element, element_kind)))
+            elif kind == 'script_finished' and forward.script_finished != FINISHED_EARLY_FOR_RERUN:
+                return
+
+
+async def journey(port, data, renders, reports):
+    """One user: consent, save the form, read advice, generate the report
+
+    Appends the seconds of each page render to `renders` and of the report
+    request to `reports`; returns True when the report came back.
+    """
+    session = await Session.open(port)
+
+    async def interact(*states, into=renders):
+        started = time.perf_counter()
+        await session.interact(*states)
+        into.append(time.perf_counter() - started)
+
+    try:
+        await interact()
+        await interact(WidgetState(id=session.widget('checkbox', "I consent").id, bool_value=True))
+        await interact(WidgetState(id=session.widget('button', "Confirm Consent").id, trigger_value=True))
+
+        widget = session.widget
+        slider = WidgetState(id=widget('slider', "HbA1c").id)
+        slider.double_array_value.data.append(min(max(int(data['hba1c']), 20), 150))
+        await interact(
+            WidgetState(id=widget('text_input', "Full Name").id, string_value=data['name']),
+            WidgetState(id=widget('number_input', "Age").id, int_value=min(max(int(data['age']), 18), 100)),
+            slider,
+            WidgetState(id=widget('number_input', "Weight").id,
+                        int_value=min(max(int(data['weight']), 30), 300)),
+            WidgetState(id=widget('text_input', "Blood Pressure").id, string_value=data['bp']),
+            WidgetState(id=widget('button', "Save & Calculate Risk").id, trigger_value=True),
+        )
+
+        navigation = widget('radio', "Navigation")
+        await interact(WidgetState(id=navigation.id, int_value=list(navigation.options).index("Clinical Advice")))
+        await interact(WidgetState(id=navigation.id, int_value=list(navigation.options).index("GP Report")))
+        # The page keeps rerunning itself until the queued report is ready
+        await interact(WidgetState(id=widget('button', "Generate Clinical Report").id, trigger_value=True),
+                       into=reports)
+        return REPORT_DONE in session.alerts()
+    finally:
+        session.close()
+
+
+async def _run_sessions(port, records, sessions, think):
+    renders, reports, failures = [], [], []
+
+    async def user(number):
+        for data in records[number::sessions]:
+            try:
+                if not await journey(port, data, renders, reports):
+                    failures.append(data['name'])
+            except Exception as e:
+                failures.append(f"{data['name']}: {type(e).__name__}: {e}")
+            if think:
+                await asyncio.sleep(think)
+
+    await asyncio.gather(*(user(number) for number in range(sessions)))
+    return renders, reports, failures
+
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def run_level(sessions, journeys, seed, think=0):
+    """`sessions` concurrent users against a fresh app, `journeys` patients each"""
+    records = generate_records(sessions * journeys + 1, seed)
+    for index, data in enumerate(records):
+        data['name'] = f"Load Test {index}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process, port = start_app(os.path.join(tmp, 'load_test.db'))
+        try:
+            # warm-up: imports, report workers, caches
+            asyncio.run(_run_sessions(port, [records.pop()], 1, 0))
+            idle = tree_rss(process.pid)
+            sampler = RSSSampler(process.pid)
+            sampler.start()
+            started = time.perf_counter()
+            renders, reports, failures = asyncio.run(_run_sessions(port, records, sessions, think))
+            seconds = time.perf_counter() - started
+            peak = sampler.stop()
+        finally:
+            process.terminate()
+            process.wait()
+
+    completed = len(records) - len(failures)
+    renders = [x * 1000 for x in renders]
+    reports = [x * 1000 for x in reports] or [0.0]
+    return {
+        'sessions': sessions,
+        'journeys': completed,
+        'failures': failures,
+        'seconds': round(seconds, 3),
+        'journeys_per_s': round(completed / seconds, 2),
+        'renders_per_s': round(len(renders) / seconds, 2),
+        'render_p50_ms': round(_percentile(renders, 50), 1),
+        'render_p95_ms': round(_percentile(renders, 95), 1),
+        'report_p95_ms': round(_percentile(reports, 95), 1),
+        'idle_rss_mb': round(idle / 2 ** 20, 1),
+        'peak_rss_mb': round(peak / 2 ** 20, 1),
+        'rss_per_session_mb': round((peak - idle) / 2 ** 20 / sessions, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with concurrent sessions")
+    parser.add_argument('--sessions', default='1,4,16',
+                        help="comma-separated concurrent session counts, one level each")
+    parser.add_argument('--journeys', type=int, default=3, help="patients per session")
+    parser.add_argument('--think', type=float, default=0.0,
+                        help="seconds each user pauses between patients")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="also write the results as JSON here")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'sessions':>8} {'journeys/s':>11} {'renders/s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'report p95':>11} {'peak RSS MB':>12} {'MB/session':>11} {'failed':>7}")
+    for sessions in (int(n) for n in args.sessions.split(',')):
+        result = run_level(sessions, args.journeys, args.seed, args.think)
+        results.append(result)
+        print(f"{sessions:>8} {result['journeys_per_s']:>11.2f} {result['renders_per_s']:>10.1f} "
+              f"{result['render_p50_ms']:>8.1f} {result['render_p95_ms']:>8.1f} "
+              f"{result['report_p95_ms']:>11.1f} {result['peak_rss_mb']:>12.1f} "
+              f"{result['rss_per_session_mb']:>11.2f} {len(result['failures']):>7}")
+        for failure in result['failures'][:5]:
+            print(f"{'':8} failed: {failure}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'journeys_per_session': args.journeys, 'think_seconds': args.think,
+                       'levels': results}, f, indent=2)
+    return 1 if any(result['failures'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
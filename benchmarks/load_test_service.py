@@ -0,0 +1,170 @@
+"""Load test for the headless scoring service, next to the Streamlit path
+
+Starts src/service.py on a free local port (or targets --url), drives it
+with --concurrency keep-alive connections and prints throughput and latency
+percentiles per endpoint. For comparison it then pushes patients through
+the Streamlit app in-process with streamlit.testing (save form, then
+generate the GP report) - the work one UI user triggers per patient.
+
+    python benchmarks/load_test_service.py
+    python benchmarks/load_test_service.py --requests 2000 --concurrency 64 --streamlit-patients 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+sys.path.insert(0, SRC)
+
+from synthetic_cohort import generate_records  # noqa: E402
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(workers):
+    """Launch the service in a subprocess and wait for /health; returns (process, url)"""
+    port = _free_port()
+    command = [sys.executable, os.path.join(SRC, 'service.py'), '--port', str(port)]
+    if workers:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/health", timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("service did not start within 30 s")
+
+
+async def _request(reader, writer, host, path, body):
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def _load(url, path, bodies, concurrency):
+    """Send every body once over `concurrency` connections; (seconds, latencies, failures)"""
+    parts = urlsplit(url)
+    queue = list(reversed(bodies))
+    latencies, failures = [], 0
+
+    async def connection():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+        try:
+            while queue:
+                body = queue.pop()
+                started = time.perf_counter()
+                status = await _request(reader, writer, parts.netloc, path, body)
+                latencies.append(time.perf_counter() - started)
+                failures += status != 200
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, failures
+
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def _report(label, count, seconds, latencies, failures):
+    latencies = [x * 1000 for x in latencies]
+    print(f"{label:28} {count:>6} req  {count / seconds:9.1f} req/s  "
+          f"p50 {_percentile(latencies, 50):7.2f} ms  p95 {_percentile(latencies, 95):7.2f} ms  "
+          f"p99 {_percentile(latencies, 99):7.2f} ms  failed {failures}")
+
+
+def run_service(url, records, concurrency, batch_size):
+    bodies = [json.dumps(r).encode() for r in records]
+    batches = [json.dumps({'patients': records[i:i + batch_size]}).encode()
+               for i in range(0, len(records), batch_size)]
+    for label, path, payload, per_request in (
+            ("service /v1/assess", '/v1/assess', bodies, 1),
+            (f"service /v1/assess/batch x{batch_size}", '/v1/assess/batch', batches, batch_size),
+            ("service /v1/report", '/v1/report', bodies, 1)):
+        seconds, latencies, failures = asyncio.run(_load(url, path, payload, concurrency))
+        _report(label, len(payload), seconds, latencies, failures)
+        if per_request > 1:
+            print(f"{'':28} {len(records) / seconds:>22.1f} patients/s")
+
+
+def run_streamlit(records):
+    """Save each patient through the form and generate the report, one UI session"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(SRC, 'app.py'), default_timeout=60)
+    at.session_state.consent = True
+    at.run()
+    latencies = []
+    started = time.perf_counter()
+    for data in records:
+        begun = time.perf_counter()
+        at.sidebar.radio[0].set_value("Patient Input").run()
+        numbers = {widget.label.split(' (')[0]: widget for widget in at.number_input}
+        numbers['Age'].set_value(min(max(int(data['age']), 18), 100))
+        at.slider[0].set_value(min(max(int(data['hba1c']), 20), 150))
+        numbers['Weight'].set_value(min(max(int(data['weight']), 30), 300))
+        at.text_input[1].input(data['bp'])
+        at.button[0].click().run()
+        at.sidebar.radio[0].set_value("GP Report").run()
+        at.button[0].click().run()
+        latencies.append(time.perf_counter() - begun)
+    seconds = time.perf_counter() - started
+    _report("streamlit save + report", len(records), seconds, latencies, len(at.exception))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the scoring service against the Streamlit path")
+    parser.add_argument('--url', help="existing service to target instead of starting one")
+    parser.add_argument('--requests', type=int, default=500, help="patients sent to each endpoint")
+    parser.add_argument('--concurrency', type=int, default=16, help="open connections")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help="PDF workers for a started service")
+    parser.add_argument('--streamlit-patients', type=int, default=20,
+                        help="patients pushed through the Streamlit app (0 to skip)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    records = generate_records(args.requests, args.seed)
+    process, url = (None, args.url) if args.url else start_service(args.workers)
+    try:
+        run_service(url, records, args.concurrency, args.batch_size)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    if args.streamlit_patients:
+        run_streamlit(records[:args.streamlit_patients])
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""Incremental re-scoring on a large stored cohort
+
+Fills a temporary patient store with a seeded synthetic cohort scored under
+the current rule set, publishes a copy of that rule set with one threshold
+moved, and times rescore.py bringing the store up to it. Then every
+patient's current assessment is re-evaluated in full under the new rules -
+the cost incremental re-scoring avoids - and checked against the store,
+which must show no mismatches.
+
+    python benchmarks/rescore_check.py                             # 1,000,000 patients
+    python benchmarks/rescore_check.py --patients 100000 --change systolic
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+sys.path.insert(0, SRC)
+RULES = tempfile.mkdtemp(prefix='rescore-rules-')
+os.environ['DIABETES_RULES_DIR'] = RULES  # read by rule_engine on import
+
+import rule_engine  # noqa: E402
+from patient_store import PatientStore  # noqa: E402
+from rescore import _patient_data, rescore  # noqa: E402
+from synthetic_cohort import generate_records  # noqa: E402
+
+CHUNK = 50_000
+
+
+def _prediabetes_threshold(spec):
+    spec['advice']['hba1c']['bands'][1]['min'] -= 1
+
+
+def _systolic(spec):
+    spec['score']['systolic']['bands'][0]['min'] -= 5
+
+
+def _activity_text(spec):
+    spec['advice']['activity']['30-150 mins'] = ["Good activity level - keep up 150+ mins/week"]
+
+
+# Single-threshold (or single-text) edits to the newest rule set
+CHANGES = {
+    'prediabetes-threshold': _prediabetes_threshold,
+    'systolic': _systolic,
+    'activity-text': _activity_text,
+}
+
+
+def fill(store, patients, seed):
+    rules = rule_engine.get_rules()
+    for start in range(0, patients, CHUNK):
+        records = generate_records(min(CHUNK, patients - start), seed + start)
+        store.record_many([
+            (f"P{start + i:07d}", data, *rules.evaluate(data), '2024-04-01')
+            for i, data in enumerate(records)
+        ])
+    return rules
+
+
+def publish(rules, change):
+    """Write `rules` with `change` applied as the next version; returns its version"""
+    spec = copy.deepcopy(rules.spec)
+    CHANGES[change](spec)
+    spec['version'] = str(int(rules.version) + 1)
+    spec['description'] = f"{rules.version} with {change} moved"
+    with open(os.path.join(RULES, f"v{spec['version']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(spec, f)
+    rule_engine.RELOAD_INTERVAL = 0  # pick the new file up on the next get_rules()
+    return spec['version']
+
+
+def verify(store, version):
+    """(patients, mismatches, seconds) of a full re-evaluation against the store"""
+    rules = rule_engine.get_rules(version)
+    patients = mismatches = 0
+    started = time.perf_counter()
+    for rows in store.latest_matching(chunk=CHUNK):
+        for row in rows:
+            risk_score, advice = rules.evaluate(_patient_data(row))
+            patients += 1
+            mismatches += (risk_score, advice) != (row['risk_score'], row['advice'])
+    return patients, mismatches, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time incremental re-scoring after a rule change")
+    parser.add_argument('--patients', type=int, default=1_000_000)
+    parser.add_argument('--change', choices=sorted(CHANGES), default='prediabetes-threshold')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for name in os.listdir(os.path.join(SRC, 'rules')):
+        shutil.copy(os.path.join(SRC, 'rules', name), RULES)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PatientStore(os.path.join(tmp, 'rescore.db'))
+        try:
+            started = time.perf_counter()
+            rules = fill(store, args.patients, args.seed)
+            print(f"{args.patients:,} patients stored under rules {rules.version} "
+                  f"in {time.perf_counter() - started:.1f} s")
+
+            version = publish(rules, args.change)
+            started = time.perf_counter()
+            summary = rescore(store, version)
+            seconds = time.perf_counter() - started
+            print(f"incremental to rules {version} ({args.change}): {summary['selected']:,} selected "
+                  f"({summary['selected'] / args.patients:.1%}), {summary['rewritten']:,} rewritten, "
+                  f"{len(summary['changes']):,} changed priority/referral/tier in {seconds:.2f} s")
+
+            patients, mismatches, full_seconds = verify(store, version)
+            print(f"full re-evaluation of {patients:,} patients: {full_seconds:.2f} s, "
+                  f"{mismatches} mismatches with the store")
+        finally:
+            store.close()
+            shutil.rmtree(RULES, ignore_errors=True)
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
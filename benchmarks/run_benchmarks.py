@@ -0,0 +1,336 @@
+"""Offline performance benchmarks with a regression gate
+
+Times each stage on seeded synthetic cohorts of increasing size, writes the
+results to JSON and exits non-zero if any stage got slower per patient than
+the baseline by more than --threshold. benchmarks/baseline.json is a --quick
+run on a developer machine; a missing baseline is a failure, not a pass.
+
+Timings only compare on the machine that recorded them, so CI gates with
+--ratios instead: each fast path against its reference stage from the same
+run (RATIOS), which holds on any runner.
+
+    python benchmarks/run_benchmarks.py                      # full run, compare with baseline
+    python benchmarks/run_benchmarks.py --quick              # smaller sizes, for a quick check
+    python benchmarks/run_benchmarks.py --quick --save-baseline  # record a new baseline
+    python benchmarks/run_benchmarks.py --quick --ratios     # same-run ratios only (CI)
+"""
+import argparse
+import atexit
+import csv
+import functools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+from fpdf import FPDF
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'src'))
+# Time the renders themselves, not reads from the on-disk report cache
+os.environ.setdefault('REPORT_CACHE_DIR', '')
+
+from advice_engine import generate_advice  # noqa: E402
+from clinical_rules import calculate_risk_score  # noqa: E402
+from cohort_advice import generate_advice_batch  # noqa: E402
+from cohort_scoring import calculate_risk_scores  # noqa: E402
+from local_services import ServiceIndex, build_index, read_districts  # noqa: E402
+from medications import get_matcher  # noqa: E402
+from report_content import RESOURCES  # noqa: E402
+from report_export import fhir_json, html_summary  # noqa: E402
+from report_generator import _pdf_text, generate_report  # noqa: E402
+from risk_table import lookup_risk_scores  # noqa: E402
+from synthetic_cohort import generate_cohort  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(HERE, 'results.json')
+
+# Sizes below this many seconds are too noisy to gate on
+MIN_GATED_SECONDS = 0.005
+SERVICE_SITES = 50_000  # synthetic services in the lookup index, far more than the bundled sample
+
+
+def _records(cohort):
+    return cohort.to_dict('records')
+
+
+def _scalar_scores(records):
+    for data in records:
+        calculate_risk_score(data)
+
+
+def _scalar_advice(records):
+    for data in records:
+        generate_advice(data)
+
+
+def _report_inputs(cohort):
+    return [(data, generate_advice(data), calculate_risk_score(data)) for data in _records(cohort)]
+
+
+def _reports(inputs):
+    for data, advice, risk_score in inputs:
+        generate_report(data, advice, risk_score)
+
+
+def _untemplated_report(data, advice, risk_score):
+    """The report laid out call by call, as before report_template: the comparison for report_pdf"""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.set_text_color(0, 94, 184)
+    pdf.cell(0, 10, "NHS Diabetes Prevention Report", ln=True, align='C')
+    pdf.set_font("Arial", size=10)
+    pdf.cell(0, 8, f"Generated: {datetime.now().strftime('%d/%m/%Y')}", ln=True, align='C')
+    pdf.line(10, 30, 200, 30)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 15, "Patient Information", ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(40, 8, "Name:", ln=0)
+    pdf.cell(0, 8, _pdf_text(data.get('name', '')), ln=True)
+    pdf.cell(40, 8, "Date of Birth:", ln=0)
+    pdf.cell(0, 8, f"Age: {data.get('age', '')}", ln=True)
+    pdf.cell(40, 8, "Ethnic Group:", ln=0)
+    pdf.cell(0, 8, _pdf_text(data.get('ethnicity', '')), ln=True)
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "Clinical Summary", ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(60, 8, "10-Year Diabetes Risk:", ln=0)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 8, f"{risk_score}%", ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.cell(0, 8, "Clinical Parameters:", ln=True)
+    for column in ("HbA1c", "Blood Pressure", "Weight"):
+        pdf.cell(45, 8, column, border=1)
+    pdf.cell(45, 8, "Activity", border=1, ln=True)
+    pdf.cell(45, 8, f"{data.get('hba1c', '')} mmol/mol", border=1)
+    pdf.cell(45, 8, _pdf_text(data.get('bp', '')), border=1)
+    pdf.cell(45, 8, f"{data.get('weight', '')} kg", border=1)
+    pdf.cell(45, 8, _pdf_text(data.get('activity', '')), border=1, ln=True)
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "Clinical Recommendations", ln=True)
+    pdf.set_font("Arial", size=12)
+    for i, recommendation in enumerate(advice["recommendations"]):
+        pdf.cell(10, 8, f"{i + 1}.", ln=0)
+        pdf.multi_cell(0, 8, _pdf_text(recommendation), new_x="LMARGIN", new_y="NEXT")
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "NHS Support Resources", ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.multi_cell(0, 8, "\n" + "".join(f"    - {resource}\n" for resource in RESOURCES) + "    ")
+    return bytes(pdf.output())
+
+
+def _untemplated_reports(inputs):
+    with warnings.catch_warnings():  # Arial substitution and ln= deprecation, as the old code emitted
+        warnings.simplefilter('ignore')
+        for data, advice, risk_score in inputs:
+            _untemplated_report(data, advice, risk_score)
+
+
+def _fhir_reports(inputs):
+    for data, advice, risk_score in inputs:
+        fhir_json(data, advice, risk_score)
+
+
+def _html_reports(inputs):
+    for data, advice, risk_score in inputs:
+        html_summary(data, advice, risk_score)
+
+
+def _frame(cohort):
+    return cohort
+
+
+def _medication_lists(cohort):
+    return cohort['meds'].tolist()
+
+
+def _medication_matches(lists):
+    """Every list through the automaton, bypassing the per-text cache"""
+    matcher = get_matcher()
+    for meds in lists:
+        matcher.match(meds)
+
+
+@functools.lru_cache(maxsize=None)
+def _service_index():
+    """Index over SERVICE_SITES synthetic services scattered around the district centroids"""
+    districts = read_districts()
+    rng = np.random.default_rng(0)
+    centres = np.array(list(districts.values()))[rng.integers(len(districts), size=SERVICE_SITES)]
+    sites = centres + rng.normal(scale=0.2, size=centres.shape)
+    directory = tempfile.mkdtemp(prefix='service-bench-')
+    atexit.register(shutil.rmtree, directory, True)
+    services_csv = os.path.join(directory, 'services.csv')
+    with open(services_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'lat', 'lon'])
+        writer.writerows((f"Site {i}", f"{lat:.5f}", f"{lon:.5f}") for i, (lat, lon) in enumerate(sites))
+    build_index(services_csv, directory)
+    services = [{'name': f"Site {i}"} for i in range(SERVICE_SITES)]
+    return ServiceIndex(directory, services, districts)
+
+
+def _service_queries(cohort):
+    index = _service_index()
+    codes = list(index.districts)
+    return index, [codes[i % len(codes)] for i in range(len(cohort))]
+
+
+def _service_lookups(inputs):
+    index, postcodes = inputs
+    for postcode in postcodes:
+        index.near_postcode(postcode, k=3)
+
+
+# stage -> (prepare inputs from the cohort, timed function, full sizes, --quick sizes)
+STAGES = {
+    'risk_score_batch': (_frame, calculate_risk_scores,
+                         (1, 100, 10_000, 1_000_000), (1, 100, 10_000)),
+    'risk_score_table': (_frame, lookup_risk_scores,
+                         (1, 100, 10_000, 1_000_000), (1, 100, 10_000)),
+    'advice_batch': (_frame, generate_advice_batch,
+                     (1, 100, 10_000, 1_000_000), (1, 100, 10_000)),
+    'risk_score_scalar': (_records, _scalar_scores, (1, 100, 10_000, 100_000), (1, 100, 1_000)),
+    'advice_scalar': (_records, _scalar_advice, (1, 100, 10_000, 100_000), (1, 100, 1_000)),
+    'report_pdf': (_report_inputs, _reports, (1, 100, 1_000, 10_000), (1, 10, 100)),
+    'report_pdf_untemplated': (_report_inputs, _untemplated_reports, (1, 100, 1_000, 10_000), (1, 10, 100)),
+    'report_fhir': (_report_inputs, _fhir_reports, (1, 100, 1_000, 10_000), (1, 10, 100)),
+    'report_html': (_report_inputs, _html_reports, (1, 100, 1_000, 10_000), (1, 10, 100)),
+    'medication_match': (_medication_lists, _medication_matches,
+                         (1, 100, 10_000, 100_000), (1, 100, 10_000)),
+    'service_lookup': (_service_queries, _service_lookups, (1, 100, 10_000), (1, 100, 1_000)),
+}
+
+# (stage, reference stage, highest allowed ratio of their per-patient times),
+# each stage taken at its largest size in the run
+RATIOS = (
+    ('risk_score_batch', 'risk_score_scalar', 1.0),
+    ('risk_score_table', 'risk_score_scalar', 1.0),
+    ('report_pdf', 'report_pdf_untemplated', 1.0),
+)
+
+
+def time_stage(func, inputs, repeat):
+    """Best wall time of `repeat` runs (inputs are prepared outside the timing)"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(inputs)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(quick=False, stages=None, seed=0):
+    results = {}
+    for name, (prepare, func, sizes, quick_sizes) in STAGES.items():
+        if stages and name not in stages:
+            continue
+        results[name] = {}
+        for size in (quick_sizes if quick else sizes):
+            inputs = prepare(generate_cohort(size, seed))
+            repeat = 5 if size <= 1_000 else 1
+            seconds = time_stage(func, inputs, repeat)
+            results[name][str(size)] = {
+                'seconds': seconds,
+                'us_per_patient': seconds / size * 1e6,
+            }
+            print(f"{name:20} {size:>9,}  {seconds:9.4f} s  {seconds / size * 1e6:10.2f} us/patient")
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'quick': quick,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def regressions(current, baseline, threshold):
+    """[(stage, size, baseline us, current us)] for stages slower than allowed"""
+    slower = []
+    for stage, sizes in current['results'].items():
+        for size, result in sizes.items():
+            before = baseline.get('results', {}).get(stage, {}).get(size)
+            if not before or before['seconds'] < MIN_GATED_SECONDS:
+                continue
+            if result['us_per_patient'] > before['us_per_patient'] * (1 + threshold):
+                slower.append((stage, size, before['us_per_patient'], result['us_per_patient']))
+    return slower
+
+
+def _largest_size(sizes):
+    return sizes[max(sizes, key=int)]['us_per_patient']
+
+
+def ratio_failures(current):
+    """[(stage, reference, ratio, allowed)] for RATIOS over their limit in this run"""
+    failures = []
+    results = current['results']
+    for stage, reference, allowed in RATIOS:
+        if stage not in results or reference not in results:
+            continue
+        ratio = _largest_size(results[stage]) / _largest_size(results[reference])
+        print(f"{stage} / {reference}: {ratio:.2f} (allowed {allowed:.2f})")
+        if ratio > allowed:
+            failures.append((stage, reference, ratio, allowed))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scoring, advice and report stages")
+    parser.add_argument('--quick', action='store_true', help="smaller cohort sizes")
+    parser.add_argument('--stage', action='append', choices=sorted(STAGES),
+                        help="only run this stage (repeatable)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="where to write results JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown per patient before failing (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="write these results as the new baseline instead of comparing")
+    parser.add_argument('--ratios', action='store_true',
+                        help="gate on RATIOS measured in this run instead of the baseline")
+    args = parser.parse_args(argv)
+
+    current = run(quick=args.quick, stages=args.stage, seed=args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+
+    if args.ratios:
+        failures = ratio_failures(current)
+        for stage, reference, ratio, allowed in failures:
+            print(f"REGRESSION {stage}: {ratio:.2f}x {reference} per patient, allowed {allowed:.2f}x")
+        return 1 if failures else 0
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 2
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    slower = regressions(current, baseline, args.threshold)
+    for stage, size, before, after in slower:
+        print(f"REGRESSION {stage} @ {size}: {before:.2f} -> {after:.2f} us/patient")
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
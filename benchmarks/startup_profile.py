@@ -0,0 +1,129 @@
+"""Cold-start profile of the Streamlit app with an import-time budget
+
+Runs the app's first render in a fresh interpreter under `python -X
+importtime`, then reports the slowest modules the app itself pulled in and
+the time to first render. Streamlit's own modules are left out of the
+count wherever they load (its start-up, and modules such as
+streamlit.emojis it imports on first render), so the budget tracks our
+code. Exits non-zero when the app's import time goes over --budget-ms or
+when a module that should load lazily (--lazy, default fpdf and pandas)
+was imported on first render. The budget defaults to STARTUP_BUDGET_MS
+(150); tests/test_startup.py runs the lazy-module checks under pytest.
+
+    python benchmarks/startup_profile.py
+    python benchmarks/startup_profile.py --page "Clinical Advice" --budget-ms 150
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', 'src')
+
+DEFAULT_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 150))
+LAZY_MODULES = ('fpdf', 'pandas')
+MARKER = "--- app start ---"
+
+# Runs in the child interpreter: everything after MARKER is imported by the app
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {src!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.session_state.consent = True
+print({marker!r}, file=sys.stderr, flush=True)
+started = time.perf_counter()
+at.run()
+if {page!r}:
+    at.sidebar.radio[0].set_value({page!r}).run()
+first_render = time.perf_counter() - started
+print(json.dumps({{'first_render': first_render, 'modules': sorted(sys.modules),
+                  'exceptions': [str(e.value) for e in at.exception]}}))
+"""
+
+
+def parse_importtime(lines):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    rows = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def _streamlit(module):
+    return module == 'streamlit' or module.startswith('streamlit.')
+
+
+def app_imports(rows):
+    """[(module, self_us, cumulative_us)] per top-level import, Streamlit's modules left out
+
+    -X importtime lists a module after everything it imported, so the rows
+    since the previous top-level import are that import's subtree.
+    """
+    imports, subtree_us = [], 0
+    for name, self_us, _, depth in rows:
+        if not _streamlit(name):
+            subtree_us += self_us
+        if depth == 0:
+            if not _streamlit(name):
+                imports.append((name, self_us, subtree_us))
+            subtree_us = 0
+    return imports
+
+
+def profile(page=None):
+    """Import rows for the app's first render, time to first render and loaded modules"""
+    code = CHILD.format(src=SRC, app=os.path.join(SRC, 'app.py'), marker=MARKER, page=page or '')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+    stderr = result.stderr.splitlines()
+    app_lines = stderr[stderr.index(MARKER) + 1:] if MARKER in stderr else []
+    rows = parse_importtime(app_lines)
+    summary = json.loads(result.stdout.splitlines()[-1])
+    return rows, summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the app's cold-start imports")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum import time of the app's own dependencies")
+    parser.add_argument('--lazy', action='append', default=None,
+                        help="module that must not be imported on first render (repeatable)")
+    parser.add_argument('--page', help="sidebar page to render after the first run")
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list")
+    args = parser.parse_args(argv)
+
+    rows, summary = profile(args.page)
+    top_level = app_imports(rows)
+    import_ms = sum(cumulative for _, _, cumulative in top_level) / 1000
+    modules = sum(not _streamlit(name) for name, _, _, _ in rows)
+
+    print(f"{'module':40} {'self ms':>9} {'total ms':>9}")
+    for name, self_us, cumulative_us in sorted(top_level, key=lambda r: -r[2])[:args.top]:
+        print(f"{name:40} {self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}")
+    print(f"\napp imports:      {import_ms:8.1f} ms ({modules} modules, budget {args.budget_ms:.0f} ms)")
+    print(f"first render:     {summary['first_render'] * 1000:8.1f} ms")
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print(f"FAIL app import time {import_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    loaded = set(summary['modules'])
+    for module in args.lazy or LAZY_MODULES:
+        if module in loaded:
+            print(f"FAIL {module} was imported on first render")
+            failed = True
+    for message in summary['exceptions']:
+        print(f"FAIL app raised: {message}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
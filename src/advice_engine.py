@@ -1,7 +1,13 @@
 # COMPLETELY REPLACE this file with:
 from clinical_rules import calculate_risk_score
+from medications import medication_classes
 
-def generate_advice(data):
+def generate_advice(data, rules=None):
+    """Advice dict for one patient, as first shipped (rule set v1)
+
+    Pass a RuleSet to add its medication review section (rule sets from v2
+    on); the review text and classes are read from the rule set.
+    """
     advice = {
         "priority": "LOW", 
         "summary": "", 
@@ -61,4 +67,13 @@ def generate_advice(data):
     if risk_score > 10:
         advice["recommendations"].append(f"High cardiovascular risk ({risk_score}%) - Consider statin therapy")
     
+    # Diabetes-relevant drugs in the medication list
+    medications = rules.spec['advice'].get('medications', {}) if rules else {}
+    if medications:
+        classes = medication_classes(data.get('meds'))
+        for name, rule in medications.items():
+            if name in classes:
+                advice["recommendations"].extend(rule.get('recommendations', ()))
+                advice["referral"] = advice["referral"] or rule.get('referral', False)
+    
     return advice
@@ -1,9 +1,11 @@
 import streamlit as st
-import time
 import logging
-from advice_engine import generate_advice
-from report_generator import generate_report
-from clinical_rules import calculate_risk_score
+import uuid
+from patient import HEIGHT, PatientRecord
+from metrics import start_log_reporter, start_metrics_server, timed
+from patient_store import get_store
+from session_graph import PATIENT_GRAPH, sources
+from report_jobs import FAILED, QueueFull, get_queue, job_key
 
 # Configure logger
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +15,8 @@ logger = logging.getLogger(__name__)
 NHS_BLUE = "#005EB8"
 NHS_DARK_BLUE = "#003087"
 
+REPORT_POLL_SECONDS = 0.5  # longest wait between checks on a queued report
+
 # App configuration
 st.set_page_config(
     page_title="NHS Diabetes Prevention",
@@ -62,6 +66,14 @@ def apply_nhs_styles():
         unsafe_allow_html=True
     )
 
+def current_patient():
+    """Validated record from the last save, or the raw form data before that"""
+    return st.session_state.get('patient_record') or st.session_state.patient_data
+
+def derived(name):
+    """Risk score, advice, report etc. for the current patient, recomputed only when stale"""
+    return PATIENT_GRAPH.get(name, sources(current_patient()), st.session_state.derived)
+
 def initialize_session():
     """Initialize session state variables"""
     defaults = {
@@ -78,14 +90,20 @@ def initialize_session():
             'smoker': False,
             'family_history': False
         },
-        'risk_score': 0.0,
-        'advice_generated': False,
+        'derived': {},
         'report_generated': False
     }
     
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
+    # Stored assessments are keyed on this, never on the free-text name: the
+    # app has no login, so a session only ever reads back what it wrote
+    if 'store_id' not in st.session_state:
+        st.session_state.store_id = f"session-{uuid.uuid4().hex}"
+
+def give_consent():
+    st.session_state.consent = True
 
 def consent_form():
     """NHS-compliant consent form"""
@@ -104,9 +122,8 @@ def consent_form():
         """)
     
     if st.checkbox("I consent to the storage and processing of my health data"):
-        if st.button("Confirm Consent"):
-            st.session_state.consent = True
-            st.experimental_rerun()
+        # Set in the click callback, so the run the click triggers already shows the app
+        st.button("Confirm Consent", on_click=give_consent)
     else:
         st.warning("You must provide consent to use this service")
 
@@ -188,14 +205,23 @@ def patient_input_page():
         if st.form_submit_button("Save & Calculate Risk"):
             with st.spinner("Calculating diabetes risk..."):
                 try:
-                    # Calculate risk score
-                    st.session_state.risk_score = calculate_risk_score(
+                    # Validate and parse the inputs once
+                    st.session_state.patient_record = PatientRecord.from_dict(
                         st.session_state.patient_data
                     )
-                    st.session_state.advice_generated = False
+                    
+                    # Calculate risk score
+                    risk_score = derived('risk_score')
+                    
+                    # Keep the assessment so trends can be shown on later visits
+                    with timed("store"):
+                        get_store().record(
+                            st.session_state.store_id, st.session_state.patient_record,
+                            risk_score, derived('advice')
+                        )
                     st.success("Data saved successfully!")
-                    time.sleep(1)
-                    st.experimental_rerun()
+                except ValueError as e:
+                    st.error(f"Please check your inputs: {e}")
                 except Exception as e:
                     logger.error(f"Risk calculation failed: {str(e)}")
                     st.error("Error calculating risk score. Please check your inputs.")
@@ -208,20 +234,17 @@ def clinical_advice_page():
         st.warning("Please complete the Patient Input form first")
         return
     
-    # Calculate risk if not done
-    if not st.session_state.get('risk_score'):
-        with st.spinner("Calculating risk profile..."):
-            st.session_state.risk_score = calculate_risk_score(
-                st.session_state.patient_data
-            )
+    # Calculate risk (only reruns when one of its inputs changed)
+    with st.spinner("Calculating risk profile..."):
+        risk_score = derived('risk_score')
     
     # Display risk score with NHS color coding
     st.subheader("Diabetes Risk Assessment")
     risk_level = "LOW"
-    if st.session_state.risk_score >= 20:
+    if risk_score >= 20:
         risk_level = "HIGH"
         risk_class = "risk-high"
-    elif st.session_state.risk_score >= 10:
+    elif risk_score >= 10:
         risk_level = "MEDIUM"
         risk_class = "risk-medium"
     else:
@@ -229,24 +252,40 @@ def clinical_advice_page():
     
     st.markdown(f"""
     <div class='{risk_class}'>
-        <h3>10-Year Diabetes Risk: {st.session_state.risk_score}% ({risk_level} RISK)</h3>
+        <h3>10-Year Diabetes Risk: {risk_score}% ({risk_level} RISK)</h3>
     </div>
     """, unsafe_allow_html=True)
+    bmi = derived('bmi')
+    if bmi:
+        st.caption(f"BMI {bmi:.1f} (assuming a height of {HEIGHT} m)")
+    medications = derived('medications')
+    if medications:
+        st.caption("Medications flagged for review: "
+                   + ", ".join(medication.label for medication in medications))
+    
+    # Trend across this session's saved assessments (last 12 only, read through the patient index)
+    history = get_store().history(st.session_state.store_id, ('hba1c', 'weight', 'risk_score'), limit=12)
+    if len(history) > 1:
+        st.subheader("Your Trend")
+        st.line_chart({
+            'HbA1c (mmol/mol)': [row['hba1c'] for row in history],
+            'Weight (kg)': [row['weight'] for row in history],
+            '10-yr risk (%)': [row['risk_score'] for row in history],
+        })
+        st.caption(f"{len(history)} assessments from {history[0]['recorded_at'][:10]} "
+                   f"to {history[-1]['recorded_at'][:10]}")
     
-    # Generate advice if not already done
-    if not st.session_state.advice_generated or st.button("Regenerate Advice"):
-        with st.spinner("Generating personalized advice..."):
-            try:
-                st.session_state.advice = generate_advice(st.session_state.patient_data)
-                st.session_state.advice_generated = True
-            except Exception as e:
-                logger.error(f"Advice generation failed: {str(e)}")
-                st.error("Error generating advice. Please try again.")
+    # Generate advice (only reruns when one of its inputs changed)
+    advice = None
+    with st.spinner("Generating personalized advice..."):
+        try:
+            advice = derived('advice')
+        except Exception as e:
+            logger.error(f"Advice generation failed: {str(e)}")
+            st.error("Error generating advice. Please try again.")
     
     # Display advice
-    if st.session_state.advice_generated:
-        advice = st.session_state.advice
-        
+    if advice:
         st.subheader("Clinical Recommendations")
         st.info(advice["summary"])
         
@@ -265,15 +304,23 @@ def clinical_advice_page():
             - Local GP diabetes clinic
             """)
             
+            postcode = st.text_input("Your postcode", placeholder="e.g., SE1 7EH")
             if st.button("Find Local Services"):
-                st.info("Searching nearby NHS services...")
-                # Simulated service lookup
-                time.sleep(1)
-                st.success("""
-                **Services near you:**
-                - St Thomas' Hospital Diabetes Clinic (0.8 miles)
-                - Guy's Health Centre Prevention Programme (1.2 miles)
-                """)
+                # Offline lookup over the bundled service list; numpy loads on first use
+                from local_services import get_service_index
+
+                with timed("service_lookup"):
+                    services = get_service_index().near_postcode(postcode, k=3)
+                if services is None:
+                    st.warning("Please enter a valid UK postcode")
+                else:
+                    st.success("**Services near you:**\n" + "\n".join(
+                        f"- {service['name']}, {service['address']} {service['postcode']} "
+                        f"({service['distance_miles']} miles)"
+                        for service in services
+                    ))
+    
+    what_if_explorer()
     
     # Lifestyle Resources
     st.subheader("NHS Prevention Resources")
@@ -284,6 +331,63 @@ def clinical_advice_page():
     - [Diabetes UK Resources](https://www.diabetes.org.uk/preventing-type-2-diabetes)
     """)
 
+def what_if_explorer():
+    """Risk under lifestyle changes, over the whole weight x HbA1c range"""
+    st.subheader("What If?")
+    if not st.toggle("Explore how changes would affect your risk"):
+        return
+    
+    # numpy/pandas/altair are only needed here, so load them on first use
+    import altair as alt
+    import numpy as np
+    import pandas as pd
+    from risk_table import what_if_surface
+    
+    patient = current_patient()
+    weight = float(patient.get('weight') or 70)
+    hba1c = float(patient.get('hba1c') or 40)
+    
+    changes = {}
+    col1, col2 = st.columns(2)
+    with col1:
+        weight_loss = st.slider("Lose weight (kg)", 0, 30, 5)
+    with col2:
+        if patient.get('smoker') and st.checkbox("Stop smoking", value=True):
+            changes['smoker'] = False
+        if patient.get('activity') == "<30 mins" and st.checkbox("Exercise 30-150 mins/week"):
+            changes['activity'] = "30-150 mins"
+    
+    # One vectorised table lookup for every weight/HbA1c combination
+    weights = weight + np.arange(-30, 11)
+    weights = weights[weights >= 30]
+    hba1c_values = np.arange(20, 101)
+    now = what_if_surface(patient, [weight], [hba1c])[0, 0]
+    surface = what_if_surface(patient, weights, hba1c_values, **changes)
+    after = what_if_surface(patient, [weight - weight_loss], [hba1c], **changes)[0, 0]
+    
+    st.metric("10-year risk after these changes", f"{after:.1f}%",
+              delta=f"{after - now:+.1f}%", delta_color="inverse")
+    
+    grid = pd.DataFrame({
+        'Weight (kg)': np.tile(weights, len(hba1c_values)),
+        'HbA1c (mmol/mol)': np.repeat(hba1c_values, len(weights)),
+        'Risk (%)': surface.ravel(),
+    })
+    heatmap = alt.Chart(grid).mark_rect().encode(
+        x=alt.X('Weight (kg):Q', bin=alt.Bin(step=1)),
+        y=alt.Y('HbA1c (mmol/mol):Q', bin=alt.Bin(step=1)),
+        color=alt.Color('Risk (%):Q', scale=alt.Scale(scheme='orangered')),
+        tooltip=['Weight (kg)', 'HbA1c (mmol/mol)', 'Risk (%)'],
+    )
+    marker = alt.Chart(pd.DataFrame({
+        'Weight (kg)': [weight - weight_loss], 'HbA1c (mmol/mol)': [hba1c],
+    })).mark_point(color=NHS_DARK_BLUE, size=120, filled=True).encode(
+        x='Weight (kg):Q', y='HbA1c (mmol/mol):Q',
+    )
+    st.altair_chart(heatmap + marker, use_container_width=True)
+    st.caption("Risk across weight and HbA1c with the changes above applied. "
+               "The dot marks your HbA1c at the chosen weight.")
+
 def gp_report_page():
     """Clinical report generation"""
     st.title("Clinical Report Generator")
@@ -292,48 +396,59 @@ def gp_report_page():
         st.warning("Please complete the Patient Input form first")
         return
     
-    # Generate report on demand
+    # Generate report on demand - rendered by the background queue, which
+    # merges identical requests from other sessions into the same job
     if st.button("Generate Clinical Report", key="generate_report"):
-        with st.spinner("Compiling NHS-compliant report..."):
-            try:
-                # Ensure latest risk score
-                if not st.session_state.get('risk_score'):
-                    st.session_state.risk_score = calculate_risk_score(
-                        st.session_state.patient_data
-                    )
-                
-                # Generate advice if needed
-                if not st.session_state.advice_generated:
-                    st.session_state.advice = generate_advice(st.session_state.patient_data)
-                    st.session_state.advice_generated = True
-                
-                # Create PDF
-                pdf_path = generate_report(
-                    st.session_state.patient_data, 
-                    st.session_state.advice,
-                    st.session_state.risk_score
-                )
-                
-                # Make downloadable
-                with open(pdf_path, "rb") as f:
-                    st.download_button(
-                        "📄 Download Full Report", 
-                        f, 
-                        file_name="nhs_diabetes_report.pdf",
-                        mime="application/pdf"
-                    )
-                
-                st.session_state.report_generated = True
-                st.success("Report generated successfully!")
-                
-            except Exception as e:
-                logger.error(f"Report generation failed: {str(e)}")
-                st.error("Error generating report. Please try again.")
+        try:
+            st.session_state.report_job = get_queue().submit(
+                current_patient(), derived('advice'), derived('risk_score')
+            )
+        except QueueFull:
+            st.warning("Many reports are being generated right now. Please try again in a moment.")
+        except Exception as e:
+            logger.error(f"Report submission failed: {str(e)}")
+            st.error("Error generating report. Please try again.")
+
+    # Structured record for GP systems, built once per result
+    st.download_button(
+        "🗂️ Download FHIR Record (JSON)",
+        derived('fhir'),
+        file_name="nhs_diabetes_report.json",
+        mime="application/fhir+json"
+    )
+
+    # Poll the job; a report for inputs that have since changed is not offered
+    job_id = st.session_state.get('report_job')
+    job = get_queue().get(job_id) if job_id else None
+    if job is not None and job.key != job_key(current_patient()):
+        job = None
+    if job is not None:
+        if not job.future.done():
+            st.info(f"Compiling NHS-compliant report ({job.status})...")
+            # Returns as soon as the job finishes, then reruns to show the result
+            job.wait(REPORT_POLL_SECONDS)
+            st.rerun()
+        elif job.status == FAILED:
+            logger.error(f"Report generation failed: {job.error}")
+            st.error("Error generating report. Please try again.")
+        else:
+            from report_generator import DEFAULT_FILENAME
+            
+            # Make downloadable
+            st.download_button(
+                "📄 Download Full Report", 
+                job.result(), 
+                file_name=DEFAULT_FILENAME,
+                mime="application/pdf"
+            )
+            
+            st.session_state.report_generated = True
+            st.success("Report generated successfully!")
     
     # Preview when report exists
     if st.session_state.report_generated:
         st.subheader("Report Preview")
-        advice = st.session_state.advice
+        advice = derived('advice')
         
         with st.expander("Clinical Summary"):
             st.write(advice["summary"])
@@ -404,4 +519,8 @@ def main():
     """)
 
 if __name__ == "__main__":
-    main()
+    # Both are started once per process, not once per rerun
+    start_log_reporter()
+    start_metrics_server()
+    with timed("page_render"):
+        main()
@@ -0,0 +1,185 @@
+"""Bulk GP report generation across a process pool
+
+Reports are streamed into a ZIP archive (or a directory) as each worker
+finishes, so only the PDFs currently in flight are ever held in memory.
+A record that fails to render is logged and skipped; the batch carries on.
+
+    python src/bulk_reports.py patients.csv reports.zip --workers 8
+"""
+import argparse
+import logging
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from report_generator import generate_report
+from result_cache import assess
+
+logger = logging.getLogger(__name__)
+
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9_-]+')
+
+
+def _safe_id(patient_id):
+    """patient_id reduced to letters, digits, '-' and '_', or None when nothing is left"""
+    if patient_id is None or patient_id != patient_id:  # missing or NaN
+        return None
+    if isinstance(patient_id, float) and patient_id.is_integer():  # an ID column pandas read as float
+        patient_id = int(patient_id)
+    return _UNSAFE.sub('_', str(patient_id).strip()).strip('_')[:64] or None
+
+
+def report_name(index, data, suffix='.pdf'):
+    """File name for a record's report - its patient_id when present, else row number
+
+    The ID is client or CSV supplied, so it is reduced to a plain basename:
+    "../../x" becomes "x_report.pdf", never a path.
+    """
+    return f"{_safe_id(data.get('patient_id')) or f'{index:06d}'}_report{suffix}"
+
+
+class UniqueNames:
+    """Tracks the names written to one archive or directory; a repeat gets its row number added"""
+
+    def __init__(self):
+        self.used = set()
+
+    def claim(self, name, index):
+        stem, dot, extension = name.rpartition('.')
+        candidate, n = name, 1
+        while candidate in self.used:
+            candidate = f"{stem}_{index:06d}{'_' + str(n) if n > 1 else ''}{dot}{extension}"
+            n += 1
+        self.used.add(candidate)
+        return candidate
+
+
+def _render_one(job):
+    """Worker: score, advise and render one record (errors returned, not raised)
+
+    Scoring goes through the per-process result cache, so repeated profiles
+    in a practice list are only evaluated once per worker.
+    """
+    index, data = job
+    try:
+        risk_score, advice = assess(data)
+        return index, report_name(index, data), generate_report(data, advice, risk_score), None
+    except Exception as e:
+        return index, None, None, f"{type(e).__name__}: {e}"
+
+
+class _ZipSink:
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)
+
+    def write(self, name, pdf_bytes):
+        self.archive.writestr(name, pdf_bytes)
+
+    def close(self):
+        self.archive.close()
+
+
+class _DirectorySink:
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, name, pdf_bytes):
+        if os.path.basename(name) != name:
+            raise ValueError(f"Report name {name!r} is not a plain file name")
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(pdf_bytes)
+
+    def close(self):
+        pass
+
+
+def _open_sink(output):
+    if str(output).lower().endswith('.zip'):
+        return _ZipSink(output)
+    return _DirectorySink(output)
+
+
+def generate_reports(records, output, workers=None, max_in_flight=None,
+                     progress=None, progress_every=100):
+    """Render a report for every record and stream them into `output`
+
+    `records` is any iterable of patient dicts and is consumed lazily.
+    `output` ending in .zip is written as a ZIP archive, anything else as a
+    directory. `progress(stats)` is called every `progress_every` records.
+    Returns the final stats dict: written, failed, errors, seconds,
+    reports_per_second.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 4
+    stats = {'written': 0, 'failed': 0, 'errors': [], 'seconds': 0.0, 'reports_per_second': 0.0}
+    started = time.perf_counter()
+    sink = _open_sink(output)
+    names = UniqueNames()
+
+    def collect(done):
+        for future in done:
+            index, name, pdf_bytes, error = future.result()
+            if error:
+                stats['failed'] += 1
+                stats['errors'].append((index, error))
+                logger.error(f"Report {index} failed: {error}")
+            else:
+                sink.write(names.claim(name, index), pdf_bytes)
+                stats['written'] += 1
+            finished = stats['written'] + stats['failed']
+            stats['seconds'] = time.perf_counter() - started
+            stats['reports_per_second'] = finished / stats['seconds'] if stats['seconds'] else 0.0
+            if progress and finished % progress_every == 0:
+                progress(stats)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for job in enumerate(records):
+                pending.add(pool.submit(_render_one, job))
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        sink.close()
+
+    if progress and (stats['written'] + stats['failed']) % progress_every:
+        progress(stats)
+    return stats
+
+
+def _read_records(path, chunksize=1000):
+    import pandas as pd
+
+    # As text: a column with blanks would otherwise be read as float ("9434765919.0")
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype={'patient_id': str}):
+        yield from chunk.to_dict('records')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate GP reports for a patient CSV")
+    parser.add_argument("input", help="CSV with one patient per row")
+    parser.add_argument("output", help="ZIP file (*.zip) or directory to write reports to")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    def log_progress(stats):
+        logger.info(f"{stats['written']} written, {stats['failed']} failed, "
+                    f"{stats['reports_per_second']:.1f} reports/s")
+
+    stats = generate_reports(_read_records(args.input), args.output,
+                             workers=args.workers, progress=log_progress)
+    return 1 if stats['failed'] and not stats['written'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,11 @@
+def parse_bp(bp):
+    """Split a 'systolic/diastolic' reading into ints, or None if unreadable"""
+    try:
+        systolic, diastolic = map(int, bp.split('/'))
+    except Exception:
+        return None
+    return systolic, diastolic
+
 def calculate_risk_score(data):
     """QDiabetes®-inspired risk calculation (simplified for MVP)"""
     score = 0
@@ -24,12 +32,11 @@ def calculate_risk_score(data):
     elif ethnicity == "Black African": score += 4
     
     # Blood pressure
-    try:
-        systolic, _ = map(int, bp.split('/'))
+    reading = parse_bp(bp)
+    if reading:
+        systolic, _ = reading
         if systolic >= 140: score += 3
         elif systolic >= 160: score += 5
-    except:
-        pass
     
     # Lifestyle factors
     if data.get('smoker'): score += 3
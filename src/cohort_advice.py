@@ -0,0 +1,243 @@
+"""Batch advice - a rule set's generate_advice evaluated over a whole cohort
+
+Each row is reduced to three compact columns: a priority code, a referral
+flag and a bitmask of recommendation codes. Text is only produced by
+render_advice, for the rows that are actually shown or printed.
+
+The codes are read from the rule set's advice section (AdviceCodes), one
+per recommendation text in the order RuleSet.advise appends them, so a new
+rule version changes the batch advice without a code change. Codes are
+built on first use and cached per compiled rule set, like risk_table.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from clinical_rules import parse_bp
+from cohort_scoring import _equals, _records, _size, _truthy, bp_columns
+from medications import medication_classes
+from patient_columns import PatientColumns
+from risk_table import _field, band_index, lookup_risk_scores
+from rule_engine import get_rules
+
+MASK_BITS = 64  # recommendations are an uint64 bitmask
+
+
+class AdviceCodes:
+    """Recommendation codes and HbA1c outcomes of one RuleSet's advice section
+
+    Bit n of a recommendations mask is set when code n applies to the row;
+    codes are numbered in the order RuleSet.advise appends their text, so
+    rendering the set bits in ascending order gives the same list.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.version = rules.version
+        advice = rules.spec['advice']
+        self._defaults = advice['defaults']
+        self.recommendations = []  # text per code
+        self._templated = set()  # codes whose text quotes the patient's values
+
+        hba1c = advice['hba1c']
+        self._hba1c = hba1c['bands']
+        self._extra = hba1c['otherwise'].get('bands', [])
+        # Outcome per HbA1c band, the otherwise outcome last: (priority, summary, referral, mask)
+        self.outcomes = tuple(
+            (band['priority'], band['summary'], band.get('referral', False),
+             self._add(band.get('recommendations', ())))
+            for band in (*self._hba1c, hba1c['otherwise'])
+        )
+        priorities = [outcome[0] for outcome in self.outcomes]
+        if len(set(priorities)) != len(priorities):
+            raise ValueError(f"Rule set {self.version}: batch advice needs one HbA1c outcome per priority")
+        self.priorities = tuple(priorities)
+        # Mask per extra band of the otherwise outcome, 0 for none
+        self._extra_masks = np.array([self._add(band['recommendations']) for band in self._extra] + [0],
+                                     dtype=np.uint64)
+        self._outcome_referrals = np.array([outcome[2] for outcome in self.outcomes])
+        self._outcome_masks = np.array([outcome[3] for outcome in self.outcomes], dtype=np.uint64)
+
+        hypertension = advice['hypertension']
+        self._hypertension = (hypertension['systolic_min'], hypertension['diastolic_min'],
+                              hypertension['referral_systolic_min'])
+        self._hypertension_mask = self._add([hypertension['recommendation']], templated=True)
+        self._ethnicity_groups = tuple(advice['ethnicity']['groups'])
+        self._ethnicity_mask = self._add([advice['ethnicity']['recommendation']], templated=True)
+        self._activity = tuple((activity, self._add(texts)) for activity, texts in advice['activity'].items())
+        self._flags = tuple((name, self._add(rule.get('recommendations', ())), rule.get('referral', False))
+                            for name, rule in advice['flags'].items())
+        risk = advice['risk']
+        self._risk_summary = risk['summary']
+        self._risk_above = risk['above']
+        self._risk_mask = self._add([risk['recommendation']], templated=True)
+        self._medications = {name: (self._add(rule.get('recommendations', ())), rule.get('referral', False))
+                             for name, rule in advice.get('medications', {}).items()}
+
+    def _add(self, texts, templated=False):
+        """Give each text the next code; returns the mask of the new codes"""
+        mask = 0
+        for text in texts:
+            code = len(self.recommendations)
+            if code >= MASK_BITS:
+                raise ValueError(f"Rule set {self.version} has more than {MASK_BITS} recommendations")
+            self.recommendations.append(text)
+            if templated:
+                self._templated.add(code)
+            mask |= 1 << code
+        return mask
+
+    def _medication_masks(self, meds):
+        """Mask and referral of the medication reviews for each free-text medication list
+
+        Practice lists repeat the same prescriptions heavily, so each distinct
+        text is matched once and the result broadcast back.
+        """
+        codes, uniques = pd.factorize(pd.Series(meds, dtype=object), use_na_sentinel=False)
+        masks = np.zeros(len(uniques), dtype=np.uint64)
+        referrals = np.zeros(len(uniques), dtype=bool)
+        for i, text in enumerate(uniques):
+            for drug_class in medication_classes(text):
+                if drug_class in self._medications:
+                    mask, referral = self._medications[drug_class]
+                    masks[i] |= np.uint64(mask)
+                    referrals[i] |= referral
+        return masks[codes], referrals[codes]
+
+    def evaluate(self, cohort):
+        """(priority codes, referral, recommendation masks, risk scores) for every row"""
+        size = _size(cohort)
+        defaults = self._defaults
+
+        hba1c = _field(cohort, 'hba1c', size, defaults['hba1c'])
+        outcome = band_index(self._hba1c, hba1c)
+        referral = self._outcome_referrals[outcome]
+        mask = self._outcome_masks[outcome]
+        mask |= np.where(outcome == len(self._hba1c), self._extra_masks[band_index(self._extra, hba1c)],
+                         np.uint64(0))
+
+        # Cardiovascular risk - only checked when a BP reading was entered
+        if 'bp' in cohort:
+            systolic, diastolic = bp_columns(cohort, size)  # NaN (no reading) fails both tests
+            systolic_min, diastolic_min, referral_min = self._hypertension
+            hypertensive = (systolic >= systolic_min) | (diastolic >= diastolic_min)
+            mask |= np.where(hypertensive, np.uint64(self._hypertension_mask), np.uint64(0))
+            referral = referral | (hypertensive & (systolic >= referral_min))
+
+        ethnicity = _field(cohort, 'ethnicity', size, defaults['ethnicity'])
+        higher_risk = np.zeros(size, dtype=bool)
+        for group in self._ethnicity_groups:
+            higher_risk |= _equals(ethnicity, group)
+        mask |= np.where(higher_risk, np.uint64(self._ethnicity_mask), np.uint64(0))
+
+        activity = _field(cohort, 'activity', size, defaults['activity'])
+        for label, activity_mask in self._activity:
+            mask |= np.where(_equals(activity, label), np.uint64(activity_mask), np.uint64(0))
+
+        for name, flag_mask, flag_referral in self._flags:
+            flagged = _truthy(_field(cohort, name, size, False))
+            mask |= np.where(flagged, np.uint64(flag_mask), np.uint64(0))
+            if flag_referral:
+                referral = referral | flagged
+
+        risk_score = lookup_risk_scores(cohort, self.rules)
+        mask |= np.where(risk_score > self._risk_above, np.uint64(self._risk_mask), np.uint64(0))
+
+        if self._medications and 'meds' in cohort:
+            medication_masks, medication_referrals = self._medication_masks(_field(cohort, 'meds', size, None))
+            mask |= medication_masks
+            referral = referral | medication_referrals
+
+        return outcome.astype(np.uint8), referral, mask, risk_score
+
+    def codes(self, mask):
+        """Recommendation codes set in a mask, in RuleSet.advise order"""
+        mask = int(mask)
+        return [code for code in range(len(self.recommendations)) if mask >> code & 1]
+
+    def render(self, data, priority, referral, mask, risk_score):
+        """RuleSet.generate_advice dict for one row of batch output"""
+        risk_score = float(risk_score)
+        reading = parse_bp(data.get('bp')) or (None, None)
+        values = {
+            'systolic': reading[0],
+            'diastolic': reading[1],
+            'ethnicity': data.get('ethnicity', self._defaults['ethnicity']),
+            'risk_score': risk_score,
+        }
+        outcome_priority, summary = self.outcomes[int(priority)][:2]
+        return {
+            "priority": outcome_priority,
+            "summary": summary + self._risk_summary.format(risk_score=risk_score),
+            "recommendations": [self.recommendations[code].format(**values) if code in self._templated
+                                else self.recommendations[code] for code in self.codes(mask)],
+            "referral": bool(referral),
+        }
+
+
+@lru_cache(maxsize=8)
+def _advice_codes(rules):
+    return AdviceCodes(rules)
+
+
+def get_advice_codes(rules=None):
+    """AdviceCodes for `rules` (default the active rule set), built once per rule set"""
+    return _advice_codes(rules or get_rules())
+
+
+def generate_advice_batch(cohort, rules=None):
+    """Priority, referral and recommendation mask for every row in one pass
+
+    Accepts the same DataFrame / dict of columns / PatientColumns as
+    lookup_risk_scores and returns a DataFrame with columns priority (uint8
+    code into AdviceCodes.outcomes), referral (bool), recommendations
+    (uint64 bitmask) and risk_score, under `rules` (default the active
+    rule set).
+    """
+    index = cohort.index if isinstance(cohort, pd.DataFrame) else None
+    priority, referral, mask, risk_score = get_advice_codes(rules).evaluate(cohort)
+    return pd.DataFrame({
+        'priority': priority,
+        'referral': referral,
+        'recommendations': mask,
+        'risk_score': risk_score,
+    }, index=index)
+
+
+def render_advice(data, priority, referral, mask, risk_score, rules=None):
+    """Build the generate_advice dict for one row of batch output
+
+    `data` is that patient's input row, needed for the values quoted in the
+    hypertension and ethnicity recommendations; `rules` must be the rule set
+    the row was scored under.
+    """
+    return get_advice_codes(rules).render(data, priority, referral, mask, risk_score)
+
+
+def render_rows(cohort, advice, rows, rules=None):
+    """Render advice dicts for the selected row labels only"""
+    codes = get_advice_codes(rules)
+    rendered = []
+    for row in rows:
+        if isinstance(cohort, PatientColumns):
+            data = cohort.record(row)
+        elif isinstance(cohort, pd.DataFrame):
+            data = cohort.loc[row].to_dict()
+        else:
+            data = {name: values[row] for name, values in cohort.items()}
+        result = advice.loc[row]
+        rendered.append(codes.render(
+            data, result['priority'], result['referral'],
+            result['recommendations'], result['risk_score'],
+        ))
+    return rendered
+
+
+def advice_parity_mismatches(cohort, rules=None):
+    """Row positions where rendered batch advice differs from RuleSet.generate_advice"""
+    rules = rules or get_rules()
+    advice = generate_advice_batch(cohort, rules)
+    rendered = render_rows(cohort, advice, advice.index, rules)
+    expected = [rules.generate_advice(row) for row in _records(cohort)]
+    return np.flatnonzero([a != b for a, b in zip(rendered, expected)])
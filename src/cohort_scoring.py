@@ -0,0 +1,155 @@
+"""Vectorised cohort scoring - whole-column version of clinical_rules.calculate_risk_score"""
+import numpy as np
+import pandas as pd
+
+from clinical_rules import calculate_risk_score, parse_bp
+from patient import HEIGHT
+from patient_columns import PatientColumns
+
+# Same defaults calculate_risk_score falls back to when a field is missing
+DEFAULTS = {
+    'age': 45,
+    'hba1c': 40,
+    'ethnicity': 'White',
+    'bp': '120/80',
+    'weight': 70,
+    'smoker': False,
+    'family_history': False,
+    'activity': None,
+}
+
+MAX_POINTS = 35  # 9 age + 8 HbA1c + 6 ethnicity + 3 BP + 3 + 2 + 4 lifestyle
+
+
+def _final_risk(points, bmi_tier):
+    """Tail of calculate_risk_score: points -> capped, BMI-adjusted percentage"""
+    base_risk = min(points * 0.9, 50)
+    if bmi_tier == 2: base_risk *= 1.4
+    elif bmi_tier == 1: base_risk *= 1.2
+    return round(min(base_risk, 70), 1)
+
+
+# Points and BMI tier are both small integers, so the float maths and Python
+# rounding of the scalar path are tabulated once instead of re-done per row.
+_RISK_TABLE = np.array([
+    [_final_risk(points, tier) for tier in range(3)]
+    for points in range(MAX_POINTS + 1)
+])
+
+
+def _size(cohort):
+    if isinstance(cohort, (pd.DataFrame, PatientColumns)):
+        return len(cohort)
+    return len(next(iter(cohort.values())))
+
+
+def _column(cohort, name, size):
+    if name in cohort:
+        values = cohort[name]
+        return values.to_numpy() if hasattr(values, 'to_numpy') else np.asarray(values)
+    return np.full(size, DEFAULTS[name], dtype=object)
+
+
+def _numeric(values):
+    return np.asarray(values, dtype=float)
+
+
+def _truthy(values):
+    """Python truthiness per element (NaN counts as true, like bool(nan))"""
+    if values.dtype == object:
+        return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+    return values != 0
+
+
+def _equals(values, label):
+    return np.asarray(values, dtype=object) == label
+
+
+def parse_bp_column(bp):
+    """Systolic and diastolic columns from a BP string column (NaN where unreadable)
+
+    Readings repeat heavily across a practice list, so each distinct string is
+    parsed once with the scalar parser and broadcast back.
+    """
+    codes, uniques = pd.factorize(pd.Series(bp, dtype=object), use_na_sentinel=False)
+    parsed = [parse_bp(value) or (np.nan, np.nan) for value in uniques]
+    lookup = np.array(parsed, dtype=float).reshape(-1, 2)
+    return lookup[codes, 0], lookup[codes, 1]
+
+
+def bp_columns(cohort, size):
+    """Systolic and diastolic columns, parsed from 'bp' unless the cohort already holds them"""
+    if isinstance(cohort, PatientColumns):
+        return cohort.systolic, cohort.diastolic
+    return parse_bp_column(_column(cohort, 'bp', size))
+
+
+def parse_systolic(bp):
+    """Systolic column from a BP string column (NaN where unreadable)"""
+    return parse_bp_column(bp)[0]
+
+
+def bmi_tier(weight):
+    """0 = BMI <= 25, 1 = overweight, 2 = obese (same cut-offs as the scalar path)"""
+    bmi = _numeric(weight) / (HEIGHT ** 2)
+    return np.select([bmi > 30, bmi > 25], [2, 1], 0)
+
+
+def risk_points(cohort, size=None):
+    """Integer risk points per row, before the percentage conversion"""
+    if size is None:
+        size = _size(cohort)
+
+    age = _numeric(_column(cohort, 'age', size))
+    hba1c = _numeric(_column(cohort, 'hba1c', size))
+    ethnicity = _column(cohort, 'ethnicity', size)
+    systolic = bp_columns(cohort, size)[0]
+
+    # Age factor (peaks at 55-64)
+    points = np.select([age < 35, age < 45, age < 55, age < 65], [1, 3, 6, 9], 7)
+
+    # HbA1c (mmol/mol)
+    points += np.where((hba1c >= 42) & (hba1c <= 47), 4, np.where(hba1c >= 48, 8, 0))
+
+    # Ethnicity (NICE NG28 higher risk groups)
+    points += np.where(_equals(ethnicity, "South Asian"), 6,
+                       np.where(_equals(ethnicity, "Black African"), 4, 0))
+
+    # Blood pressure (the scalar >=160 branch is shadowed by >=140)
+    points += np.where(systolic >= 140, 3, 0)
+
+    # Lifestyle factors
+    points += np.where(_truthy(_column(cohort, 'smoker', size)), 3, 0)
+    points += np.where(_truthy(_column(cohort, 'family_history', size)), 2, 0)
+    points += np.where(_equals(_column(cohort, 'activity', size), "<30 mins"), 4, 0)
+    return points
+
+
+def calculate_risk_scores(cohort):
+    """Risk score for every row of a DataFrame or dict of column arrays
+
+    Returns a Series aligned to the DataFrame index, or a float array for
+    column dicts. Values match calculate_risk_score row for row.
+    """
+    size = _size(cohort)
+    points = risk_points(cohort, size)
+    tier = bmi_tier(_column(cohort, 'weight', size))
+    scores = _RISK_TABLE[points, tier]
+    if isinstance(cohort, pd.DataFrame):
+        return pd.Series(scores, index=cohort.index, name='risk_score')
+    return scores
+
+
+def _records(cohort):
+    """Per-row inputs for the scalar functions"""
+    if isinstance(cohort, PatientColumns):
+        return [cohort.record(i) for i in range(len(cohort))]
+    frame = cohort if isinstance(cohort, pd.DataFrame) else pd.DataFrame(cohort)
+    return frame.to_dict('records')
+
+
+def parity_mismatches(cohort):
+    """Row positions where the batch and scalar scores disagree (should be empty)"""
+    batch = np.asarray(calculate_risk_scores(cohort))
+    scalar = np.array([calculate_risk_score(row) for row in _records(cohort)])
+    return np.flatnonzero(batch != scalar)
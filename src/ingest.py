@@ -0,0 +1,212 @@
+"""Chunked scoring of practice extracts (CSV or Parquet)
+
+The extract is streamed in fixed-size chunks. Each chunk is normalised to
+the fields calculate_risk_score / generate_advice expect, scored in one
+vectorised pass under the active rule set and appended to the output CSV,
+so memory stays bounded by the chunk size whatever the size of the input.
+Every row carries the rules_version it was scored under.
+
+After every chunk a checkpoint (`<output>.checkpoint`) records how many
+rows and output bytes are committed, and the rule set version the run
+started with. `--resume` truncates any half-written chunk and carries on
+from there under that same version, so the output never mixes versions.
+
+    python src/ingest.py practice_extract.parquet scores.csv --chunksize 50000 --resume
+"""
+import argparse
+import json
+import logging
+import numbers
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from cohort_advice import generate_advice_batch, get_advice_codes
+from rule_engine import get_rules
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 50_000
+
+# Common extract headings -> patient_data keys
+COLUMN_ALIASES = {
+    'nhs_number': 'patient_id',
+    'id': 'patient_id',
+    'age_years': 'age',
+    'hba1c_mmol_mol': 'hba1c',
+    'weight_kg': 'weight',
+    'blood_pressure': 'bp',
+    'ethnic_group': 'ethnicity',
+    'physical_activity': 'activity',
+    'weekly_physical_activity': 'activity',
+    'current_smoker': 'smoker',
+    'smoking': 'smoker',
+    'family_history_of_diabetes': 'family_history',
+    'medications': 'meds',
+    'current_medications': 'meds',
+}
+
+PATIENT_FIELDS = ('patient_id', 'name', 'age', 'weight', 'bp', 'hba1c', 'ethnicity',
+                  'activity', 'meds', 'smoker', 'family_history')
+NUMERIC_FIELDS = ('age', 'weight', 'hba1c')
+BOOLEAN_FIELDS = ('smoker', 'family_history')
+TRUE_VALUES = {'y', 'yes', 'true', 't', '1'}
+
+
+def _column_key(name):
+    key = re.sub(r'[^a-z0-9]+', '_', str(name).strip().lower()).strip('_')
+    return COLUMN_ALIASES.get(key, key)
+
+
+def _truthy(value):
+    if pd.isna(value):
+        return False
+    if isinstance(value, (bool, np.bool_, numbers.Number)):
+        return bool(value)
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _to_bool(values):
+    if values.dtype == bool:
+        return values
+    return values.map(_truthy).astype(bool)
+
+
+def normalise_chunk(chunk):
+    """Rename, type and combine extract columns into patient_data fields
+
+    Fields missing from the extract are left out, so the scorers apply the
+    same defaults they use for an incomplete form.
+    """
+    chunk = chunk.rename(columns=_column_key)
+    if 'bp' not in chunk and {'systolic', 'diastolic'} <= set(chunk.columns):
+        systolic = pd.to_numeric(chunk['systolic'], errors='coerce').astype('Int64')
+        diastolic = pd.to_numeric(chunk['diastolic'], errors='coerce').astype('Int64')
+        bp = systolic.astype(str) + '/' + diastolic.astype(str)
+        chunk['bp'] = bp.where(systolic.notna() & diastolic.notna(), None)
+
+    patients = pd.DataFrame(index=chunk.index)
+    for field in PATIENT_FIELDS:
+        if field not in chunk:
+            continue
+        values = chunk[field]
+        if field in NUMERIC_FIELDS:
+            values = pd.to_numeric(values, errors='coerce')
+        elif field in BOOLEAN_FIELDS:
+            values = _to_bool(values)
+        elif field == 'bp':
+            values = values.astype(object).where(values.notna(), None)
+        patients[field] = values
+    return patients
+
+
+def score_chunk(patients, rules=None):
+    """Patient fields plus risk_score, priority, referral, recommendation mask and
+    rules_version, scored under `rules` (default the active rule set)"""
+    rules = rules or get_rules()
+    priorities = get_advice_codes(rules).priorities
+    advice = generate_advice_batch(patients, rules)
+    scored = patients.copy()
+    scored['risk_score'] = advice['risk_score']
+    scored['priority'] = [priorities[p] for p in advice['priority']]
+    scored['referral'] = advice['referral']
+    scored['recommendations'] = advice['recommendations']
+    scored['rules_version'] = rules.version
+    return scored
+
+
+def read_chunks(path, chunksize=DEFAULT_CHUNKSIZE, skip_rows=0):
+    """Yield DataFrame chunks of a CSV or Parquet extract, skipping `skip_rows` rows"""
+    if str(path).lower().endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet extracts need pyarrow (pip install pyarrow)")
+        remaining = skip_rows
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            if remaining >= batch.num_rows:
+                remaining -= batch.num_rows
+                continue
+            yield batch.to_pandas().iloc[remaining:]
+            remaining = 0
+    else:
+        skip = (lambda i: 0 < i <= skip_rows) if skip_rows else None
+        yield from pd.read_csv(path, chunksize=chunksize, skiprows=skip)
+
+
+def _checkpoint_path(output):
+    return f"{output}.checkpoint"
+
+
+def load_checkpoint(output):
+    try:
+        with open(_checkpoint_path(output)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_checkpoint(output, checkpoint):
+    path = _checkpoint_path(output)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def ingest(source, output, chunksize=DEFAULT_CHUNKSIZE, resume=False, progress=None):
+    """Score `source` chunk by chunk into the CSV at `output`
+
+    With `resume`, rows already committed by an earlier run are skipped and
+    output past the last checkpoint is discarded; the rest is scored under
+    the rule set version the checkpoint recorded. Returns the final
+    checkpoint dict (chunks, rows, output_bytes, rules_version).
+    """
+    checkpoint = load_checkpoint(output) if resume else None
+    if checkpoint and checkpoint['source'] != os.path.abspath(source):
+        raise ValueError(f"Checkpoint for {output} belongs to {checkpoint['source']}")
+    if checkpoint is None:
+        checkpoint = {'source': os.path.abspath(source), 'chunks': 0, 'rows': 0, 'output_bytes': 0,
+                      'rules_version': get_rules().version}
+    # Raises KeyError if the version the run started with is no longer available
+    rules = get_rules(checkpoint['rules_version'])
+
+    mode = 'r+b' if checkpoint['output_bytes'] else 'wb'
+    with open(output, mode) as out:
+        out.seek(checkpoint['output_bytes'])
+        out.truncate()
+        for chunk in read_chunks(source, chunksize, skip_rows=checkpoint['rows']):
+            scored = score_chunk(normalise_chunk(chunk), rules)
+            scored.to_csv(out, header=checkpoint['output_bytes'] == 0, index=False)
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint['chunks'] += 1
+            checkpoint['rows'] += len(chunk)
+            checkpoint['output_bytes'] = out.tell()
+            _save_checkpoint(output, checkpoint)
+            if progress:
+                progress(checkpoint)
+    return checkpoint
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a practice extract in chunks")
+    parser.add_argument("source", help="CSV or Parquet extract")
+    parser.add_argument("output", help="CSV file to write scores to")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the last committed chunk")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    def log_progress(checkpoint):
+        logger.info(f"chunk {checkpoint['chunks']}: {checkpoint['rows']} rows scored")
+
+    ingest(args.source, args.output, args.chunksize, args.resume, progress=log_progress)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
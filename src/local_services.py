@@ -0,0 +1,271 @@
+"""Nearest NHS diabetes services to a postcode, from a bundled offline dataset
+
+data/diabetes_services.csv lists the services with coordinates and
+data/postcode_districts.csv the centroid of each postcode district (the
+outward code, e.g. "SE1"). A postcode is resolved to its district centroid
+and the services nearest to that point are returned. The bundled files are
+a sample with approximate coordinates; an NHS service directory export and
+the ONS district centroids drop in with the same columns.
+
+The services are bucketed into a 0.1 degree latitude/longitude grid: the
+coordinates are stored sorted by grid cell, with a CSR-style offsets array
+giving each cell's slice. A query reads the cells in a growing window
+around the point and stops once the k-th nearest service is closer than
+any cell outside the window could be, so it only looks at the services
+nearby however many there are.
+
+The grid arrays are built once from the CSV into SERVICE_INDEX_DIR as .npy
+files (rebuilt when the CSV changes) and memory-mapped, so every process
+on the host shares one copy through the page cache.
+
+    python src/local_services.py build
+    python src/local_services.py query "SE1 7EH" -k 5
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+SERVICES_CSV = os.path.join(DATA_DIR, 'diabetes_services.csv')
+DISTRICTS_CSV = os.path.join(DATA_DIR, 'postcode_districts.csv')
+SERVICE_INDEX_DIR = os.environ.get('SERVICE_INDEX_DIR', os.path.join(DATA_DIR, 'service_index'))
+
+CELL_DEGREES = 0.1
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+KM_PER_MILE = 1.609344
+ARRAYS = ('lat', 'lon', 'order', 'cell_start')
+
+OUTWARD_CODE = re.compile(r'^([A-Z]{1,2}[0-9][0-9A-Z]?)([0-9][A-Z]{2})?$')
+
+
+def outward_code(postcode):
+    """'se1 7eh' -> 'SE1'; a bare district ('SW1') is returned as is; None if not a postcode"""
+    match = OUTWARD_CODE.match(re.sub(r'\s+', '', str(postcode or '')).upper())
+    return match.group(1) if match else None
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from (lat, lon) to each of lats/lons"""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (np.sin((lats - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_services(path=SERVICES_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def read_districts(path=DISTRICTS_CSV):
+    """{district: (lat, lon)}"""
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row['district'].upper(): (float(row['lat']), float(row['lon']))
+                for row in csv.DictReader(f)}
+
+
+def _write_atomic(path, write):
+    """Write `path` via a unique temporary renamed into place, so a concurrent
+    reader never maps half a file; made 0644 first, as mkstemp creates it 0600"""
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def build_index(services_csv=SERVICES_CSV, directory=SERVICE_INDEX_DIR):
+    """Write the grid arrays for `services_csv` into `directory`; returns the metadata"""
+    services = read_services(services_csv)
+    lat = np.array([float(row['lat']) for row in services])
+    lon = np.array([float(row['lon']) for row in services])
+    origin = (math.floor(lat.min() / CELL_DEGREES) * CELL_DEGREES,
+              math.floor(lon.min() / CELL_DEGREES) * CELL_DEGREES)
+    shape = (int((lat.max() - origin[0]) // CELL_DEGREES) + 1,
+             int((lon.max() - origin[1]) // CELL_DEGREES) + 1)
+    cells = (((lat - origin[0]) // CELL_DEGREES).astype(np.int64) * shape[1]
+             + ((lon - origin[1]) // CELL_DEGREES).astype(np.int64))
+    order = np.argsort(cells, kind='stable')
+    arrays = {
+        'lat': lat[order],
+        'lon': lon[order],
+        'order': order.astype(np.int32),  # CSV row of each indexed service
+        'cell_start': np.searchsorted(cells[order], np.arange(shape[0] * shape[1] + 1)).astype(np.int64),
+    }
+    meta = {'source': _digest(services_csv), 'count': len(services),
+            'origin': origin, 'shape': shape, 'cell_degrees': CELL_DEGREES}
+
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        _write_atomic(os.path.join(directory, f"{name}.npy"), lambda f, array=array: np.save(f, array))
+    _write_atomic(os.path.join(directory, 'meta.json'), lambda f: f.write(json.dumps(meta).encode()))
+    logger.info(f"Service index for {len(services)} services written to {directory}")
+    return meta
+
+
+class ServiceIndex:
+    """k-nearest services over the memory-mapped grid in `directory`"""
+
+    def __init__(self, directory, services, districts):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.origin = meta['origin']
+        self.shape = meta['shape']
+        self.cell = meta['cell_degrees']
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r'))
+        self.services = services
+        self.districts = districts
+        self._areas = None
+
+    def _window(self, lat, lon, reach):
+        """Candidate positions in the cells within `reach` cells of the point's cell,
+        and the distance (km) from the point to the nearest edge of that window"""
+        rows, cols = self.shape
+        row = math.floor((lat - self.origin[0]) / self.cell)
+        col = math.floor((lon - self.origin[1]) / self.cell)
+        top, bottom = max(row - reach, 0), min(row + reach, rows - 1)
+        left, right = max(col - reach, 0), min(col + reach, cols - 1)
+        if top > bottom or left > right:
+            slices = []
+        else:
+            starts = self.cell_start[np.arange(top, bottom + 1) * cols + left]
+            ends = self.cell_start[np.arange(top, bottom + 1) * cols + right + 1]
+            slices = [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+
+        covers_grid = row - reach <= 0 and row + reach >= rows - 1 and col - reach <= 0 and col + reach >= cols - 1
+        if covers_grid:
+            return slices, math.inf
+        south = self.origin[0] + (row - reach) * self.cell
+        north = self.origin[0] + (row + reach + 1) * self.cell
+        west = self.origin[1] + (col - reach) * self.cell
+        east = self.origin[1] + (col + reach + 1) * self.cell
+        # A degree of longitude is shortest at the window's edge farthest from the equator
+        shortest = math.cos(math.radians(min(max(abs(south), abs(north)), 90)))
+        margin = min((lat - south) * KM_PER_DEGREE, (north - lat) * KM_PER_DEGREE,
+                     (lon - west) * KM_PER_DEGREE * shortest, (east - lon) * KM_PER_DEGREE * shortest)
+        return slices, margin
+
+    def nearest(self, lat, lon, k=3):
+        """[(CSV row, distance km)] of the k services nearest to (lat, lon), closest first"""
+        k = min(k, len(self.lat))
+        if k <= 0:
+            return []
+        reach = 0
+        while True:
+            slices, margin = self._window(lat, lon, reach)
+            positions = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+            if len(positions) >= k:
+                distances = haversine_km(lat, lon, self.lat[positions], self.lon[positions])
+                nearest = np.argpartition(distances, k - 1)[:k]
+                nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+                # Anything outside the window is at least `margin` away
+                if distances[nearest[-1]] <= margin:
+                    return [(int(self.order[positions[i]]), float(distances[i])) for i in nearest]
+            reach = reach * 2 + 1
+
+    def locate(self, postcode):
+        """(lat, lon) of the postcode's district, else of its postcode area, else None"""
+        district = outward_code(postcode)
+        if district is None:
+            return None
+        if district in self.districts:
+            return self.districts[district]
+        if self._areas is None:
+            areas = {}
+            for code, point in self.districts.items():
+                areas.setdefault(re.match(r'[A-Z]+', code).group(), []).append(point)
+            self._areas = {area: tuple(np.mean(points, axis=0)) for area, points in areas.items()}
+        return self._areas.get(re.match(r'[A-Z]+', district).group())
+
+    def near_postcode(self, postcode, k=3):
+        """The k nearest services as dicts with distance_km and distance_miles; None if
+        the postcode cannot be placed"""
+        point = self.locate(postcode)
+        if point is None:
+            return None
+        return [
+            {**self.services[row], 'distance_km': round(km, 2), 'distance_miles': round(km / KM_PER_MILE, 1)}
+            for row, km in self.nearest(*point, k=k)
+        ]
+
+
+def load_index(services_csv=SERVICES_CSV, districts_csv=DISTRICTS_CSV, directory=SERVICE_INDEX_DIR):
+    """ServiceIndex for the CSVs, (re)building the on-disk grid when missing or stale"""
+    meta_path = os.path.join(directory, 'meta.json')
+    try:
+        with open(meta_path) as f:
+            fresh = json.load(f)['source'] == _digest(services_csv)
+    except (OSError, ValueError, KeyError):
+        fresh = False
+    if not fresh:
+        try:
+            build_index(services_csv, directory)
+        except OSError as e:  # read-only image: build somewhere writable instead
+            directory = os.path.join(tempfile.gettempdir(), 'diabetes-service-index')
+            logger.warning(f"Cannot write service index ({e}); using {directory}")
+            build_index(services_csv, directory)
+    return ServiceIndex(directory, read_services(services_csv), read_districts(districts_csv))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_service_index():
+    """Process-wide ServiceIndex over the bundled dataset, loaded on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = load_index()
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline NHS diabetes service lookup")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="(re)build the on-disk index")
+    build.add_argument('--services', default=SERVICES_CSV)
+    build.add_argument('--index-dir', default=SERVICE_INDEX_DIR)
+    query = commands.add_parser('query', help="nearest services to a postcode")
+    query.add_argument('postcode')
+    query.add_argument('-k', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        build_index(args.services, args.index_dir)
+        return 0
+    results = get_service_index().near_postcode(args.postcode, args.k)
+    if results is None:
+        print(f"Unknown postcode: {args.postcode}")
+        return 1
+    for service in results:
+        print(f"{service['distance_miles']:6.1f} mi  {service['name']}, {service['address']} {service['postcode']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
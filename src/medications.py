@@ -0,0 +1,253 @@
+"""Diabetes-relevant drugs recognised in the free-text "Current Medications" field
+
+data/medications.csv maps each term - generic name, brand or common
+misspelling - to its generic drug and to one of CLASSES: metformin (already
+on glucose-lowering treatment), statins (modestly raise HbA1c), systemic
+steroids and antipsychotics (both raise blood glucose).
+
+The terms are compiled once into an Aho-Corasick automaton with a full
+transition table, so matching reads each character of the text exactly
+once however many terms the dictionary holds. Text and terms are
+normalised the same way - lower case, punctuation to spaces, letters split
+from digits ("Metformin500mg" -> "metformin 500 mg") - and padded with
+spaces, so only whole words match ("nystatin" is not a statin).
+
+The list is read a clause at a time (split at commas, semicolons, "and",
+"+" and new lines) and a match is dropped when its clause says the drug is
+not being taken systemically - a route word such as "cream", "drops" or
+"inhaler" ("hydrocortisone cream 1%", "prednisolone eye drops", "topical
+hydrocortisone") - or not at all: a negation before it ("no metformin",
+"stopped metformin") or "stopped" after it.
+
+    python src/medications.py "Glucophage SR 500mg bd, atorvastatin 20mg"
+    python src/medications.py --file medication_lists.txt
+"""
+import argparse
+import csv
+import logging
+import os
+import re
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+MEDICATIONS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'medications.csv')
+MATCH_CACHE_SIZE = 8192  # distinct medication lists remembered; repeat prescriptions recur
+
+CLASSES = {
+    'metformin': "Metformin",
+    'statin': "Statin",
+    'steroid': "Corticosteroid",
+    'antipsychotic': "Antipsychotic",
+}
+
+_SEPARATORS = re.compile(r'[^a-z0-9]+|(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])')
+_CLAUSES = re.compile(r'[,;+\n]|\band\b')
+_CLAUSE_SEPARATORS = re.compile(r'[^a-z0-9;]+|(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])')
+
+# Words in a drug's clause that mean it is not taken by mouth / injection
+ROUTES = frozenset({'cream', 'creams', 'ointment', 'gel', 'lotion', 'foam', 'mousse', 'scalp',
+                    'drop', 'drops', 'eye', 'ear', 'nasal', 'spray', 'inhaler', 'inh', 'inhaled',
+                    'evohaler', 'accuhaler', 'turbohaler', 'nebules', 'enema', 'suppository',
+                    'suppositories', 'patch', 'patches', 'topical'})
+NEGATIONS = frozenset({'no', 'nil', 'not', 'stopped', 'discontinued', 'ceased'})
+ENDED = frozenset({'stopped', 'discontinued', 'ceased'})  # also after the drug: "metformin - stopped"
+_CONTEXT = ROUTES | NEGATIONS
+
+
+def normalise(text):
+    """' ' + lower-case words and numbers separated by single spaces + ' '"""
+    return f" {_SEPARATORS.sub(' ', text.lower()).strip()} "
+
+
+def _normalise_clauses(text):
+    """normalise(), keeping each clause break as a ';' word"""
+    return f" {_CLAUSE_SEPARATORS.sub(' ', _CLAUSES.sub(' ; ', text.lower())).strip()} "
+
+
+@dataclass(frozen=True, slots=True)
+class Medication:
+    drug: str  # generic name
+    drug_class: str  # key of CLASSES
+    term: str  # dictionary term that matched
+
+    @property
+    def label(self):
+        return f"{self.drug.capitalize()} ({CLASSES[self.drug_class]})"
+
+
+class MedicationMatcher:
+    """Aho-Corasick automaton over a {term: (drug, class)} dictionary"""
+
+    def __init__(self, dictionary):
+        self.entries = []
+        patterns = {}
+        for term, (drug, drug_class) in dictionary.items():
+            if drug_class not in CLASSES:
+                raise ValueError(f"Unknown medication class {drug_class!r} for {term!r}")
+            pattern = normalise(term)
+            if pattern.strip() and pattern not in patterns:
+                patterns[pattern] = len(self.entries)
+                self.entries.append(Medication(drug, drug_class, term))
+        self._lengths = {self.entries[entry]: len(pattern) for pattern, entry in patterns.items()}
+        # Route and negation words ride along in the automaton as None entries,
+        # so spotting a list that needs reading clause by clause costs no extra pass
+        self._targets = self.entries + [None]
+        for word in _CONTEXT:
+            patterns.setdefault(f" {word} ", len(self.entries))
+        self._compile(patterns)
+
+    def _compile(self, patterns):
+        # Trie of the patterns; outputs[state] = (pattern length, entry) pairs ending there
+        goto, outputs = [{}], [()]
+        for pattern, entry in patterns.items():
+            state = 0
+            for char in pattern:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state] += ((len(pattern), entry),)
+
+        # Breadth-first: fill in the missing transitions from each state's failure
+        # state, turning the trie into a DFA over the normalised alphabet
+        alphabet = sorted({char for pattern in patterns for char in pattern})
+        delta = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] += outputs[fail[state]]
+            for char in alphabet:
+                child = goto[state].get(char)
+                if child is None:
+                    target = delta[fail[state]].get(char, 0)
+                    if target:
+                        delta[state][char] = target
+                else:
+                    fail[child] = delta[fail[state]].get(char, 0)
+                    delta[state][char] = child
+                    queue.append(child)
+        self._delta = delta
+        self._outputs = outputs
+
+    def find(self, text):
+        """[(start, Medication)] for every dictionary term in `text`, in order of their end"""
+        return [(start, medication) for start, medication in self._scan(normalise(text)) if medication]
+
+    def _scan(self, text):
+        """find() over normalised text, with (start, None) for route and negation words"""
+        delta, outputs, entries = self._delta, self._outputs, self._targets
+        found = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                found.extend((end - length, entries[entry]) for length, entry in outputs[state])
+        return found
+
+    def _taken(self, text, start, medication):
+        """False when the match's clause has a route word around it or negates it"""
+        before = text[text.rfind(';', 0, start) + 1:start].split()
+        end = start + self._lengths[medication]
+        after = text[end:text.find(';', end) % (len(text) + 1)].split()
+        return not (NEGATIONS.intersection(before) or ENDED.intersection(after)
+                    or ROUTES.intersection(after) or ROUTES.intersection(before))
+
+    def match(self, text):
+        """Medications taken according to `text`, one per drug, in the order they first appear"""
+        normalised = normalise(text)
+        found = self._scan(normalised)
+        taken = None
+        if not all(medication for _, medication in found):
+            if not any(medication for _, medication in found):
+                return ()
+            # Only lists mentioning a route or negation need reading clause by clause
+            normalised = _normalise_clauses(text)
+            found = self._scan(normalised)
+            taken = self._taken
+        medications = {}
+        for start, medication in sorted(found, key=lambda found: found[0]):
+            if medication is None or medication.drug in medications:
+                continue
+            if taken is None or taken(normalised, start, medication):
+                medications[medication.drug] = medication
+        return tuple(medications.values())
+
+
+def read_dictionary(path=MEDICATIONS_CSV):
+    """{term: (drug, class)}; every generic name is also a term"""
+    dictionary = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            dictionary[row['term']] = (row['drug'], row['class'])
+            dictionary.setdefault(row['drug'], (row['drug'], row['class']))
+    return dictionary
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def get_matcher():
+    """Process-wide MedicationMatcher over the bundled dictionary, compiled on first use"""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None:
+            _matcher = MedicationMatcher(read_dictionary())
+            logger.info(f"Medication matcher compiled: {len(_matcher.entries)} terms, "
+                        f"{len(_matcher._delta)} states")
+        return _matcher
+
+
+@lru_cache(maxsize=MATCH_CACHE_SIZE)
+def _match(text):
+    return get_matcher().match(text)
+
+
+def match_medications(meds):
+    """Recognised Medications in a free-text medication list (() for blank or non-text)"""
+    if not isinstance(meds, str) or not meds.strip():
+        return ()
+    return _match(meds)
+
+
+def medication_classes(meds):
+    """Keys of CLASSES flagged in `meds`, in CLASSES order"""
+    flagged = {medication.drug_class for medication in match_medications(meds)}
+    return tuple(drug_class for drug_class in CLASSES if drug_class in flagged)
+
+
+def recognised_drugs(meds):
+    """The recognised generic names, sorted and comma-separated
+
+    Matches the same classes as `meds` itself, so it can stand in for the
+    free text wherever only the flags matter (cache keys).
+    """
+    return ', '.join(sorted({medication.drug for medication in match_medications(meds)}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Flag diabetes-relevant drugs in medication lists")
+    parser.add_argument('text', nargs='*', help="medication lists to check")
+    parser.add_argument('--file', help="file with one medication list per line ('-' for stdin)")
+    args = parser.parse_args(argv)
+
+    lists = list(args.text)
+    if args.file:
+        with (sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')) as f:
+            lists.extend(line.rstrip('\n') for line in f)
+    for meds in lists:
+        labels = ', '.join(medication.label for medication in match_medications(meds))
+        print(f"{meds}\t{labels or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
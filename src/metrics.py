@@ -0,0 +1,191 @@
+"""Per-stage latency histograms for the request path
+
+    with timed("risk_calc"):
+        ...
+
+Observations go into fixed-bucket histograms shared by every session in the
+process. They can be read as Prometheus text (render_prometheus), served on
+METRICS_PORT, or emitted as one structured log line per stage every
+METRICS_LOG_INTERVAL seconds with p50/p95/p99 - the easy option on Cloud
+Run, where the log line lands in Cloud Logging.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAME = "diabetes_stage_latency_seconds"
+COUNTER_NAME = "diabetes_events_total"
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-on-read latency histogram"""
+
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+def observe(stage, seconds):
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(event, n=1):
+    """Add `n` to the counter for `event` (cache hits, evictions, ...)"""
+    with _lock:
+        _counters[event] = _counters.get(event, 0) + n
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+@contextmanager
+def timed(stage):
+    """Record the wall time of the block under `stage` (also when it raises)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def summary():
+    """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms}}"""
+    with _lock:
+        return {
+            stage: {
+                'count': h.count,
+                'mean_ms': round(h.total / h.count * 1000, 3) if h.count else 0.0,
+                'p50_ms': round(h.quantile(0.50) * 1000, 3),
+                'p95_ms': round(h.quantile(0.95) * 1000, 3),
+                'p99_ms': round(h.quantile(0.99) * 1000, 3),
+            }
+            for stage, h in _histograms.items()
+        }
+
+
+def render_prometheus():
+    """All histograms in the Prometheus text exposition format"""
+    lines = [f"# HELP {METRIC_NAME} Wall time per request stage",
+             f"# TYPE {METRIC_NAME} histogram"]
+    with _lock:
+        for stage, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float('inf'),), h.counts):
+                cumulative += n
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {h.total}')
+            lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {h.count}')
+        if _counters:
+            lines += [f"# HELP {COUNTER_NAME} Event counts", f"# TYPE {COUNTER_NAME} counter"]
+            lines += [f'{COUNTER_NAME}{{event="{event}"}} {n}' for event, n in sorted(_counters.items())]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def log_summary():
+    for stage, stats in summary().items():
+        logger.info(json.dumps({'event': 'stage_latency', 'stage': stage, **stats}))
+    if _counters:
+        logger.info(json.dumps({'event': 'counters', **counters()}))
+
+
+_started = set()
+_start_lock = threading.Lock()
+
+
+def _start_once(name, target):
+    with _start_lock:
+        if name in _started:
+            return False
+        _started.add(name)
+    threading.Thread(target=target, name=f"metrics-{name}", daemon=True).start()
+    return True
+
+
+def start_log_reporter(interval=None):
+    """Log one structured line per stage every `interval` seconds (once per process)"""
+    interval = interval or float(os.environ.get('METRICS_LOG_INTERVAL', 60))
+
+    def report():
+        while True:
+            time.sleep(interval)
+            log_summary()
+
+    return _start_once('log', report)
+
+
+def start_metrics_server(port=None):
+    """Serve /metrics on `port` (default METRICS_PORT; no-op when unset)"""
+    port = port or os.environ.get('METRICS_PORT')
+    if not port:
+        return False
+
+    def serve():
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        ThreadingHTTPServer(('0.0.0.0', int(port)), MetricsHandler).serve_forever()
+
+    return _start_once('http', serve)
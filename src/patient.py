@@ -0,0 +1,156 @@
+"""Typed patient records, validated and parsed once
+
+PatientRecord replaces the loose patient_data dict at the edges of the app:
+blood pressure is split into ints, ethnicity and activity become enums and
+BMI is derived, all when the record is built. It still answers the dict
+style .get() / ['field'] lookups, so every scorer, advice and report
+function accepts a record wherever it accepts a dict.
+
+PatientColumns, the array-backed form for cohorts, lives in patient_columns
+so that importing this module does not pull in numpy.
+"""
+import math
+from dataclasses import dataclass
+from enum import Enum
+from numbers import Real
+
+from clinical_rules import parse_bp
+
+HEIGHT = 1.75  # Assumed height used for BMI throughout the app
+
+
+class Ethnicity(Enum):
+    WHITE = "White"
+    SOUTH_ASIAN = "South Asian"
+    BLACK_AFRICAN = "Black African"
+    MIXED_OTHER = "Mixed/Other"
+
+
+class Activity(Enum):
+    LOW = "<30 mins"
+    MODERATE = "30-150 mins"
+    HIGH = "150+ mins"
+
+
+ETHNICITIES = tuple(Ethnicity)
+ACTIVITIES = tuple(Activity)
+
+FIELDS = ('name', 'age', 'weight', 'bp', 'hba1c', 'ethnicity', 'activity', 'meds',
+          'smoker', 'family_history')
+
+# Same starting values as the input form
+DEFAULTS = {
+    'name': '',
+    'age': 45,
+    'weight': 70,
+    'bp': '120/80',
+    'hba1c': 40,
+    'ethnicity': 'White',
+    'activity': '30-150 mins',
+    'meds': '',
+    'smoker': False,
+    'family_history': False,
+}
+
+
+def _number(field, value):
+    if isinstance(value, bool) or not isinstance(value, Real) or not math.isfinite(value) or value < 0:
+        raise ValueError(f"{field} must be a non-negative number, got {value!r}")
+    return value
+
+
+def _enum(enum, field, value):
+    if isinstance(value, enum):
+        return value
+    try:
+        return enum(value)
+    except ValueError:
+        options = ", ".join(member.value for member in enum)
+        raise ValueError(f"{field} must be one of {options}, got {value!r}") from None
+
+
+def _reading(value):
+    """(systolic, diastolic), or (None, None) when no reading was entered"""
+    if value is None or value == '':
+        return None, None
+    reading = parse_bp(value)
+    if not reading:
+        raise ValueError(f"bp must look like 120/80, got {value!r}")
+    return reading
+
+
+@dataclass(frozen=True, slots=True)
+class PatientRecord:
+    name: str = ''
+    age: Real = 45
+    weight: Real = 70
+    systolic: int | None = 120
+    diastolic: int | None = 80
+    hba1c: Real = 40
+    ethnicity: Ethnicity = Ethnicity.WHITE
+    activity: Activity = Activity.MODERATE
+    meds: str = ''
+    smoker: bool = False
+    family_history: bool = False
+
+    @classmethod
+    def from_dict(cls, data):
+        """Validate and parse a patient_data dict; missing fields take the form defaults
+
+        Raises ValueError naming the first field that cannot be used.
+        """
+        values = {**DEFAULTS, **data}
+        systolic, diastolic = _reading(values['bp'])
+        return cls(
+            name=str(values['name'] or ''),
+            age=_number('age', values['age']),
+            weight=_number('weight', values['weight']),
+            systolic=systolic,
+            diastolic=diastolic,
+            hba1c=_number('hba1c', values['hba1c']),
+            ethnicity=_enum(Ethnicity, 'ethnicity', values['ethnicity']),
+            activity=_enum(Activity, 'activity', values['activity']),
+            meds=str(values['meds'] or ''),
+            smoker=bool(values['smoker']),
+            family_history=bool(values['family_history']),
+        )
+
+    @property
+    def bmi(self):
+        return self.weight / (HEIGHT ** 2)
+
+    @property
+    def bp(self):
+        return '' if self.systolic is None else f"{self.systolic}/{self.diastolic}"
+
+    @property
+    def bp_reading(self):
+        """Parsed (systolic, diastolic), or None when no reading was entered"""
+        return None if self.systolic is None else (self.systolic, self.diastolic)
+
+    # Read-only dict protocol, in patient_data terms
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        return value.value if isinstance(value, Enum) else value
+
+    def __contains__(self, key):
+        return key in FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in FIELDS else default
+
+    def keys(self):
+        return FIELDS
+
+    def to_dict(self):
+        return {key: self[key] for key in FIELDS}
+
+
+def __getattr__(name):
+    # `from patient import PatientColumns` keeps working without importing numpy up front
+    if name == 'PatientColumns':
+        from patient_columns import PatientColumns
+        return PatientColumns
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
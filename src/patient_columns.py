@@ -0,0 +1,90 @@
+"""Array-backed cohort of patient records: one numpy array per field"""
+import numpy as np
+
+from patient import ACTIVITIES, ETHNICITIES, FIELDS, PatientRecord
+
+
+class PatientColumns:
+    """Array-backed cohort of patient records (about 40 bytes per patient)
+
+    Supports `'field' in cohort` and `cohort['field']` with the same field
+    names as patient_data, so the cohort_scoring / cohort_advice batch
+    functions accept it directly.
+    """
+
+    __slots__ = ('age', 'weight', 'hba1c', 'systolic', 'diastolic', 'ethnicity', 'activity',
+                 'smoker', 'family_history', 'name', 'meds')
+
+    def __init__(self, age, weight, hba1c, systolic, diastolic, ethnicity, activity,
+                 smoker, family_history, name=None, meds=None):
+        self.age = np.asarray(age, dtype=np.float64)
+        self.weight = np.asarray(weight, dtype=np.float64)
+        self.hba1c = np.asarray(hba1c, dtype=np.float64)
+        self.systolic = np.asarray(systolic, dtype=np.float32)  # NaN = no reading
+        self.diastolic = np.asarray(diastolic, dtype=np.float32)
+        self.ethnicity = np.asarray(ethnicity, dtype=np.uint8)  # index into ETHNICITIES
+        self.activity = np.asarray(activity, dtype=np.uint8)  # index into ACTIVITIES
+        self.smoker = np.asarray(smoker, dtype=bool)
+        self.family_history = np.asarray(family_history, dtype=bool)
+        self.name = name
+        self.meds = meds
+
+    @classmethod
+    def from_records(cls, records, keep_text=False):
+        """Build from PatientRecords or patient_data dicts (dicts are validated)"""
+        records = [r if isinstance(r, PatientRecord) else PatientRecord.from_dict(r) for r in records]
+        nan = float('nan')
+        return cls(
+            age=[r.age for r in records],
+            weight=[r.weight for r in records],
+            hba1c=[r.hba1c for r in records],
+            systolic=[nan if r.systolic is None else r.systolic for r in records],
+            diastolic=[nan if r.diastolic is None else r.diastolic for r in records],
+            ethnicity=[ETHNICITIES.index(r.ethnicity) for r in records],
+            activity=[ACTIVITIES.index(r.activity) for r in records],
+            smoker=[r.smoker for r in records],
+            family_history=[r.family_history for r in records],
+            name=np.array([r.name for r in records], dtype=object) if keep_text else None,
+            meds=np.array([r.meds for r in records], dtype=object) if keep_text else None,
+        )
+
+    def __len__(self):
+        return len(self.age)
+
+    def __contains__(self, key):
+        if key in ('name', 'meds'):
+            return getattr(self, key) is not None
+        return key in FIELDS
+
+    def __getitem__(self, key):
+        if key == 'ethnicity':
+            return np.array([e.value for e in ETHNICITIES], dtype=object)[self.ethnicity]
+        if key == 'activity':
+            return np.array([a.value for a in ACTIVITIES], dtype=object)[self.activity]
+        if key == 'bp':
+            raise KeyError("bp is held as the systolic / diastolic arrays")
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.__slots__
+                   if isinstance(getattr(self, name), np.ndarray))
+
+    def record(self, i):
+        """PatientRecord for row i"""
+        systolic, diastolic = self.systolic[i], self.diastolic[i]
+        return PatientRecord(
+            name=self.name[i] if self.name is not None else '',
+            age=float(self.age[i]),
+            weight=float(self.weight[i]),
+            systolic=None if np.isnan(systolic) else int(systolic),
+            diastolic=None if np.isnan(diastolic) else int(diastolic),
+            hba1c=float(self.hba1c[i]),
+            ethnicity=ETHNICITIES[self.ethnicity[i]],
+            activity=ACTIVITIES[self.activity[i]],
+            meds=self.meds[i] if self.meds is not None else '',
+            smoker=bool(self.smoker[i]),
+            family_history=bool(self.family_history[i]),
+        )
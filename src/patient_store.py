@@ -0,0 +1,334 @@
+"""Append-only SQLite store of patient assessments over time
+
+Every saved assessment becomes one row: the measurements that were entered,
+the risk score and advice computed from them, the rule set version and
+when it was recorded. Rows are never updated or deleted (triggers reject
+both), so the table is the patient's longitudinal record. Re-scoring an
+assessment under a new rule set appends a revision that `supersedes` it;
+trends and cohort queries read the current_assessments view, which leaves
+superseded rows out.
+
+Reads go through the (patient_id, recorded_at) and (recorded_at) indexes:
+a trend is the last N rows of one patient and a cohort question such as
+"whose risk rose above 20% this quarter" only looks at rows in that
+quarter and each patient's previous row.
+
+    python src/patient_store.py import scores.csv --recorded-at 2024-04-01
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timezone
+
+from clinical_rules import parse_bp
+from medications import medication_classes
+from rule_engine import get_rules
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = os.environ.get('PATIENT_STORE_PATH', 'patient_store.db')
+SCHEMA_VERSION = 2
+
+# Numeric measurements that can be read back as a trend
+TREND_FIELDS = ('age', 'weight', 'systolic', 'diastolic', 'hba1c', 'risk_score')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assessments (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    age REAL,
+    weight REAL,
+    systolic INTEGER,
+    diastolic INTEGER,
+    hba1c REAL,
+    ethnicity TEXT,
+    activity TEXT,
+    smoker INTEGER,
+    family_history INTEGER,
+    meds TEXT,
+    risk_score REAL NOT NULL,
+    priority TEXT,
+    referral INTEGER,
+    advice TEXT,
+    rules_version TEXT,
+    supersedes INTEGER
+);
+CREATE INDEX IF NOT EXISTS assessments_patient_time ON assessments (patient_id, recorded_at);
+CREATE INDEX IF NOT EXISTS assessments_time ON assessments (recorded_at);
+CREATE INDEX IF NOT EXISTS assessments_supersedes ON assessments (supersedes) WHERE supersedes IS NOT NULL;
+CREATE VIEW IF NOT EXISTS current_assessments AS
+SELECT * FROM assessments a WHERE NOT EXISTS (SELECT 1 FROM assessments r WHERE r.supersedes = a.id);
+CREATE TRIGGER IF NOT EXISTS assessments_no_update BEFORE UPDATE ON assessments
+BEGIN SELECT RAISE(ABORT, 'assessments are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS assessments_no_delete BEFORE DELETE ON assessments
+BEGIN SELECT RAISE(ABORT, 'assessments are append-only'); END;
+"""
+
+INSERT = """
+INSERT INTO assessments (patient_id, recorded_at, age, weight, systolic, diastolic, hba1c,
+                         ethnicity, activity, smoker, family_history, meds, risk_score,
+                         priority, referral, advice, rules_version, supersedes)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Each patient's most recent assessment (revisions share recorded_at and have the higher id)
+LATEST_MATCHING = """
+SELECT * FROM assessments a
+WHERE a.id > ? AND ({condition}) AND NOT EXISTS (
+    SELECT 1 FROM assessments b WHERE b.patient_id = a.patient_id
+    AND (b.recorded_at > a.recorded_at OR (b.recorded_at = a.recorded_at AND b.id > a.id))
+)
+ORDER BY a.id LIMIT ?
+"""
+
+# Each patient's assessments in [start, end) with the risk of the assessment before it
+RISK_ROSE_ABOVE = """
+WITH patients AS (
+    SELECT DISTINCT patient_id FROM current_assessments WHERE recorded_at >= :start AND recorded_at < :end
+), ordered AS (
+    SELECT a.patient_id, a.recorded_at, a.risk_score,
+           LAG(a.risk_score) OVER (PARTITION BY a.patient_id ORDER BY a.recorded_at) AS previous
+    FROM current_assessments a JOIN patients p ON a.patient_id = p.patient_id
+    WHERE a.recorded_at < :end
+)
+SELECT patient_id, MIN(recorded_at), MAX(previous), MAX(risk_score) FROM ordered
+WHERE recorded_at >= :start AND risk_score > :threshold AND previous <= :threshold
+GROUP BY patient_id ORDER BY patient_id
+"""
+
+
+def timestamp(value=None):
+    """UTC 'YYYY-MM-DD HH:MM:SS' text (SQLite's own datetime format) for a date/datetime"""
+    if value is None:
+        value = datetime.now(timezone.utc)
+    elif isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=' ', timespec='seconds')
+
+
+def quarter(day=None):
+    """(start, end) timestamps of the calendar quarter containing `day` (default today)"""
+    day = day or date.today()
+    first_month = (day.month - 1) // 3 * 3 + 1
+    start = date(day.year, first_month, 1)
+    end = date(day.year + 1, 1, 1) if first_month == 10 else date(day.year, first_month + 3, 1)
+    return timestamp(start), timestamp(end)
+
+
+def _number(value):
+    return None if value is None or value != value or value == '' else float(value)
+
+
+def _flag(value):
+    return None if value is None or value != value else int(bool(value))
+
+
+def _row(patient_id, data, risk_score, advice, recorded_at, rules_version, supersedes=None):
+    systolic, diastolic = parse_bp(data.get('bp')) or (None, None)
+    return (
+        str(patient_id), timestamp(recorded_at),
+        _number(data.get('age')), _number(data.get('weight')), systolic, diastolic,
+        _number(data.get('hba1c')), data.get('ethnicity'), data.get('activity'),
+        _flag(data.get('smoker')), _flag(data.get('family_history')), data.get('meds') or None,
+        float(risk_score),
+        advice.get('priority') if advice else None,
+        _flag(advice.get('referral')) if advice else None,
+        json.dumps(advice) if advice else None,
+        rules_version,
+        supersedes,
+    )
+
+
+def _has_medication_class(meds, drug_class):
+    return drug_class in medication_classes(meds)
+
+
+class PatientStore:
+    """One SQLite database file; safe to share between Streamlit sessions (threads)"""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # For rule-change queries: has_medication_class(meds, 'statin')
+        self._db.create_function('has_medication_class', 2, _has_medication_class, deterministic=True)
+        with self._lock, self._db:
+            if self._db.execute("PRAGMA user_version").fetchone()[0] == 1:
+                self._db.execute("ALTER TABLE assessments ADD COLUMN supersedes INTEGER")
+            self._db.executescript(SCHEMA)
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def record(self, patient_id, data, risk_score, advice=None, recorded_at=None, rules_version=None):
+        """Append one assessment scored under `rules_version` (default the active rule set);
+        returns its row id"""
+        row = _row(patient_id, data, risk_score, advice, recorded_at, rules_version or get_rules().version)
+        with self._lock, self._db:
+            return self._db.execute(INSERT, row).lastrowid
+
+    def record_many(self, assessments):
+        """Append (patient_id, data, risk_score, advice, recorded_at[, rules_version]) tuples
+        in one transaction
+
+        Tuples without a rules_version were scored under the active rule set.
+        Returns the number of rows written.
+        """
+        version = get_rules().version
+        rows = [_row(*assessment) if len(assessment) == 6 else _row(*assessment, version)
+                for assessment in assessments]
+        with self._lock, self._db:
+            self._db.executemany(INSERT, rows)
+        return len(rows)
+
+    def revise(self, revisions, rules_version):
+        """Append (assessment id, patient_id, data, risk_score, advice, recorded_at) re-scorings
+        under `rules_version`, each superseding that assessment; returns the number written"""
+        rows = [_row(patient_id, data, risk_score, advice, recorded_at, rules_version, assessment_id)
+                for assessment_id, patient_id, data, risk_score, advice, recorded_at in revisions]
+        with self._lock, self._db:
+            self._db.executemany(INSERT, rows)
+        return len(rows)
+
+    def latest_matching(self, condition='1', params=(), chunk=10_000):
+        """Each patient's most recent assessment if it matches the SQL `condition`
+
+        Yields lists of up to `chunk` row dicts (advice decoded) in id order.
+        Each chunk is its own query, so rows may be appended in between.
+        """
+        query = LATEST_MATCHING.format(condition=condition)
+        after = 0
+        while True:
+            with self._lock:
+                cursor = self._db.execute(query, (after, *params, chunk))
+                rows = cursor.fetchall()
+                names = [column[0] for column in cursor.description]
+            if not rows:
+                return
+            results = [dict(zip(names, row)) for row in rows]
+            for result in results:
+                result['advice'] = json.loads(result['advice']) if result['advice'] else None
+            yield results
+            after = results[-1]['id']
+
+    def rules_versions(self):
+        """Rule set versions that assessments were scored under"""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT DISTINCT rules_version FROM assessments")]
+
+    def history(self, patient_id, fields=('hba1c',), limit=10):
+        """The patient's last `limit` assessments, oldest first, as dicts of recorded_at + fields"""
+        unknown = set(fields) - set(TREND_FIELDS)
+        if unknown:
+            raise ValueError(f"Not a trend field: {', '.join(sorted(unknown))}")
+        columns = ', '.join(('recorded_at',) + tuple(fields))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {columns} FROM current_assessments WHERE patient_id = ? "
+                f"ORDER BY recorded_at DESC, id DESC LIMIT ?", (str(patient_id), limit),
+            ).fetchall()
+        keys = ('recorded_at',) + tuple(fields)
+        return [dict(zip(keys, row)) for row in reversed(rows)]
+
+    def latest(self, patient_id):
+        """Most recent assessment as a dict (advice decoded), or None"""
+        with self._lock:
+            cursor = self._db.execute(
+                "SELECT * FROM assessments WHERE patient_id = ? "
+                "ORDER BY recorded_at DESC, id DESC LIMIT 1", (str(patient_id),))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        result = dict(zip(names, row))
+        result['advice'] = json.loads(result['advice']) if result['advice'] else None
+        return result
+
+    def risk_rose_above(self, threshold, start=None, end=None):
+        """Patients whose risk went from <= threshold to above it within [start, end)
+
+        Defaults to the current quarter. Returns (patient_id, first recorded_at
+        above threshold, previous risk, highest risk) tuples.
+        """
+        if start is None or end is None:
+            start, end = quarter()
+        with self._lock:
+            return self._db.execute(RISK_ROSE_ABOVE, {
+                'start': timestamp(start), 'end': timestamp(end), 'threshold': threshold,
+            }).fetchall()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM assessments").fetchone()[0]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=None):
+    """Process-wide PatientStore for `path` (default PATIENT_STORE_PATH)"""
+    path = path or STORE_PATH
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = PatientStore(path)
+        return _stores[path]
+
+
+def import_scores(store, path, recorded_at=None, chunksize=10_000):
+    """Bulk-load an ingest.py output CSV; a recorded_at column overrides `recorded_at`
+
+    Each row is stored under the rules_version ingest scored it with.
+    """
+    import pandas as pd
+
+    from cohort_advice import get_advice_codes
+
+    written = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype={'patient_id': str, 'rules_version': str}):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        assessments = []
+        for data in chunk.to_dict('records'):
+            codes = get_advice_codes(get_rules(data['rules_version']))
+            advice = codes.render(data, codes.priorities.index(data['priority']), data['referral'],
+                                  data['recommendations'], data['risk_score'])
+            assessments.append((data['patient_id'], data, data['risk_score'], advice,
+                                data.get('recorded_at') or recorded_at, data['rules_version']))
+        written += store.record_many(assessments)
+        logger.info(f"{written} assessments imported")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Patient assessment store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help="bulk-load scores written by ingest.py")
+    load.add_argument('scores', help="CSV written by ingest.py (needs a patient_id column)")
+    load.add_argument('--recorded-at', help="assessment date for rows without recorded_at")
+    load.add_argument('--store', default=STORE_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    store = PatientStore(args.store)
+    try:
+        import_scores(store, args.scores, args.recorded_at)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
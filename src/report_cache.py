@@ -0,0 +1,228 @@
+"""Content-addressed on-disk cache of rendered GP report PDFs
+
+A report is fully determined by the text it prints, the report date, the
+rule set version and the template version, so the SHA-256 of those is its
+file name. Every process pointing at the same REPORT_CACHE_DIR - report
+workers, the scoring service, other instances on a shared volume - reuses
+the others' renders.
+
+The PDFs hold patient details, so the cache is off unless REPORT_CACHE_DIR
+is set; the directory is created readable by its owner only (0700).
+
+Files are written to a temporary name and renamed into place, so readers
+never see a partial PDF whichever process wrote it. A hit touches the
+file's mtime; a file unused for REPORT_CACHE_TTL_SECONDS is expired (the
+report date is part of the key, so it would not be hit again anyway), and
+once the directory grows past REPORT_CACHE_MAX_BYTES the least recently
+used files are deleted. Hits, misses, writes and evictions are counted in
+metrics (report_cache_*).
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+
+from metrics import count, counters
+from report_content import TEMPLATE_VERSION, flagged_medications
+from rule_engine import get_rules
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', '')  # empty: no disk cache
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_BYTES', 256 * 2 ** 20))
+REPORT_CACHE_TTL_SECONDS = int(os.environ.get('REPORT_CACHE_TTL_SECONDS', 24 * 3600))
+EVICT_TO = 0.9  # eviction trims the cache to this fraction of the limit
+SCAN_EVERY = 0.05  # re-measure the directory after writing this fraction of the limit
+STALE_TEMP_SECONDS = 3600  # leftovers of writers that died mid-write
+
+# Fields the report prints; the text ones go through _pdf_text, which strips them,
+# and meds is printed as its flagged drugs
+PRINTED_FIELDS = ('name', 'age', 'ethnicity', 'hba1c', 'bp', 'weight', 'activity', 'meds')
+STRIPPED_FIELDS = ('name', 'ethnicity', 'bp', 'activity')
+
+
+def report_key(data, advice, risk_score, rules_version=None, day=None):
+    """Hex SHA-256 of everything that ends up in the PDF"""
+    printed = []
+    for field in PRINTED_FIELDS:
+        if field == 'meds':  # only the recognised drugs are printed
+            printed.append(flagged_medications(data.get('meds')))
+            continue
+        text = str(data.get(field, ''))
+        printed.append(text.strip() if field in STRIPPED_FIELDS else text)
+    material = [
+        TEMPLATE_VERSION,
+        rules_version or get_rules().version,
+        (day or date.today()).isoformat(),
+        printed,
+        str(risk_score),
+        [str(recommendation) for recommendation in advice['recommendations']],
+    ]
+    return hashlib.sha256(json.dumps(material, ensure_ascii=False).encode()).hexdigest()
+
+
+class ReportCache:
+    """Directory of <key>.pdf files; expired after `ttl` seconds unused, LRU-evicted past max_bytes"""
+
+    def __init__(self, path=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_MAX_BYTES, ttl=REPORT_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        self._lock = threading.Lock()
+        self._written = max_bytes  # forces a scan on the first write
+
+    def _file(self, key):
+        # Two-character shards keep directories small
+        return os.path.join(self.path, key[:2], f"{key}.pdf")
+
+    def get(self, key):
+        """Cached PDF bytes, or None"""
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                expired = time.time() - os.fstat(f.fileno()).st_mtime > self.ttl
+                pdf = None if expired else f.read()
+        except FileNotFoundError:  # never written, or evicted by another process
+            count('report_cache_miss')
+            return None
+        except OSError as e:
+            logger.warning(f"Report cache read failed: {e}")
+            count('report_cache_miss')
+            return None
+        if expired:
+            self._remove(path)
+            count('report_cache_miss')
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:  # evicted meanwhile, or a read-only volume
+            pass
+        count('report_cache_hit')
+        return pdf
+
+    def put(self, key, pdf):
+        """Store `pdf` under `key` atomically; failures are logged, not raised"""
+        path = self._file(key)
+        try:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(pdf)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        except OSError as e:
+            logger.warning(f"Report cache write failed: {e}")
+            return
+        count('report_cache_write')
+        with self._lock:
+            self._written += len(pdf)
+            due = self._written >= self.max_bytes * SCAN_EVERY
+            if due:
+                self._written = 0
+        if due:
+            self.evict()
+
+    def _entries(self):
+        """(mtime, size, path) of every cached file; removes stale temporaries"""
+        entries = []
+        now = time.time()
+        for shard in os.scandir(self.path):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                    if entry.name.endswith('.tmp'):
+                        if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                            os.unlink(entry.path)
+                        continue
+                except OSError:  # removed by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:  # another process got there first
+            pass
+
+    def evict(self):
+        """Delete expired files, then least recently used ones until under EVICT_TO of the limit"""
+        oldest = time.time() - self.ttl
+        entries = []
+        total = evicted = 0
+        for mtime, size, path in self._entries():
+            if mtime < oldest:
+                self._remove(path)
+                evicted += 1
+            else:
+                entries.append((mtime, size, path))
+                total += size
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                self._remove(path)
+                total -= size
+                evicted += 1
+        if not evicted:
+            return 0
+        count('report_cache_evict', evicted)
+        logger.info(f"Report cache evicted {evicted} files, {total} bytes left")
+        return evicted
+
+
+def cache_stats():
+    """This process's hit/miss counters for the report cache"""
+    values = counters()
+    hits, misses = values.get('report_cache_hit', 0), values.get('report_cache_miss', 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'writes': values.get('report_cache_write', 0),
+        'evictions': values.get('report_cache_evict', 0),
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    """Process-wide ReportCache, or None when REPORT_CACHE_DIR is empty or unusable"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = False
+            if REPORT_CACHE_DIR:
+                try:
+                    _cache = ReportCache()
+                except OSError as e:
+                    logger.warning(f"Report cache disabled: {e}")
+        return _cache or None
+
+
+def cached_report(data, advice, risk_score):
+    """The cached PDF for these inputs, or None (also when the cache is off)"""
+    cache = get_report_cache()
+    return cache.get(report_key(data, advice, risk_score)) if cache else None
+
+
+def store_report(data, advice, risk_score, pdf):
+    cache = get_report_cache()
+    if cache:
+        cache.put(report_key(data, advice, risk_score), pdf)
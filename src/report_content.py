@@ -0,0 +1,22 @@
+"""Report wording shared by the PDF, FHIR and HTML outputs (no fpdf import)"""
+from medications import match_medications
+
+TEMPLATE_VERSION = 2  # Bump whenever the rendered PDF layout changes
+
+TITLE = "NHS Diabetes Prevention Report"
+
+RESOURCES = (
+    "NHS Diabetes Prevention Programme: https://preventing-diabetes.co.uk/",
+    "Diabetes UK Helpline: 0345 123 2399",
+    "NHS Weight Management Services",
+    "Active 10 Walking Tracker App",
+)
+
+
+def risk_level(risk_score):
+    return "High" if risk_score >= 20 else "Medium" if risk_score >= 10 else "Low"
+
+
+def flagged_medications(meds):
+    """'Metformin (Metformin), Atorvastatin (Statin)' for the recognised drugs, or 'None flagged'"""
+    return ', '.join(medication.label for medication in match_medications(meds)) or "None flagged"
@@ -0,0 +1,267 @@
+"""Structured alternatives to the PDF report: FHIR JSON bundle and one-page HTML
+
+Both take the same (data, advice, risk_score) as generate_report and need
+nothing beyond the standard library. For batch runs, write_ndjson streams
+one FHIR bundle per line (the FHIR bulk-data layout) and write_html_archive
+streams one HTML summary per patient into a ZIP, so memory stays flat
+however many patients are exported.
+
+    python src/report_export.py patients.csv bundles.ndjson --format fhir
+    python src/report_export.py patients.csv summaries.zip --format html
+"""
+import argparse
+import json
+import logging
+import math
+import uuid
+import zipfile
+from datetime import date, datetime, timezone
+from html import escape
+
+from clinical_rules import parse_bp
+from medications import match_medications
+from patient import HEIGHT
+from report_content import RESOURCES, TITLE, flagged_medications, risk_level
+
+logger = logging.getLogger(__name__)
+
+LOINC = "http://loinc.org"
+SNOMED = "http://snomed.info/sct"
+UCUM = "http://unitsofmeasure.org"
+OBSERVATION_CATEGORY = "http://terminology.hl7.org/CodeSystem/observation-category"
+
+SMOKING_STATUS = {True: ("77176002", "Smoker"), False: ("8392000", "Non-smoker")}
+CATEGORIES = {'laboratory': "Laboratory", 'vital-signs': "Vital Signs",
+              'social-history': "Social History", 'survey': "Survey"}
+
+
+def _value(data, field):
+    """Field value, or None when missing or NaN (CSV extracts)"""
+    value = data.get(field)
+    if value is None or value == '' or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+def _urn():
+    return f"urn:uuid:{uuid.uuid4()}"
+
+
+def _concept(system, code, display):
+    return {'coding': [{'system': system, 'code': code, 'display': display}], 'text': display}
+
+
+def _quantity(value, unit, code):
+    return {'value': value, 'unit': unit, 'system': UCUM, 'code': code}
+
+
+def _observation(subject, issued, category, loinc, display, **value):
+    return {
+        'resourceType': 'Observation',
+        'status': 'final',
+        'category': [_concept(OBSERVATION_CATEGORY, category, CATEGORIES[category])],
+        'code': _concept(LOINC, loinc, display),
+        'subject': {'reference': subject},
+        'issued': issued,
+        **value,
+    }
+
+
+def fhir_bundle(data, advice, risk_score, issued=None):
+    """FHIR R4 collection Bundle: Patient, measurement Observations, a
+    MedicationStatement per flagged drug, RiskAssessment and, when advice
+    recommends it, a referral ServiceRequest"""
+    issued = issued or datetime.now(timezone.utc).isoformat(timespec='seconds')
+    patient_url = _urn()
+    patient = {'resourceType': 'Patient'}
+    name = _value(data, 'name')
+    if name:
+        patient['name'] = [{'text': str(name).strip()}]
+    if _value(data, 'patient_id'):
+        patient['identifier'] = [{'system': "https://fhir.nhs.uk/Id/nhs-number",
+                                  'value': str(data['patient_id'])}]
+    ethnicity = _value(data, 'ethnicity')
+    if ethnicity:
+        patient['extension'] = [{'url': "https://fhir.hl7.org.uk/StructureDefinition/Extension-UKCore-EthnicCategory",
+                                 'valueCodeableConcept': {'text': ethnicity}}]
+
+    entries = [(patient_url, patient)]
+    basis = []
+
+    def observe(category, loinc, display, **value):
+        url = _urn()
+        entries.append((url, _observation(patient_url, issued, category, loinc, display, **value)))
+        basis.append({'reference': url})
+
+    age, hba1c, weight = _value(data, 'age'), _value(data, 'hba1c'), _value(data, 'weight')
+    if age is not None:
+        observe('survey', '30525-0', "Age", valueQuantity=_quantity(age, "years", "a"))
+    if hba1c is not None:
+        observe('laboratory', '4548-4', "Hemoglobin A1c", valueQuantity=_quantity(hba1c, "mmol/mol", "mmol/mol"))
+    if weight is not None:
+        observe('vital-signs', '29463-7', "Body weight", valueQuantity=_quantity(weight, "kg", "kg"))
+        observe('vital-signs', '39156-5', "Body mass index (assumed height)",
+                valueQuantity=_quantity(round(weight / HEIGHT ** 2, 1), "kg/m2", "kg/m2"))
+    reading = parse_bp(_value(data, 'bp'))
+    if reading:
+        observe('vital-signs', '85354-9', "Blood pressure panel", component=[
+            {'code': _concept(LOINC, '8480-6', "Systolic blood pressure"),
+             'valueQuantity': _quantity(reading[0], "mmHg", "mm[Hg]")},
+            {'code': _concept(LOINC, '8462-4', "Diastolic blood pressure"),
+             'valueQuantity': _quantity(reading[1], "mmHg", "mm[Hg]")},
+        ])
+    if _value(data, 'smoker') is not None:
+        observe('social-history', '72166-2', "Tobacco smoking status",
+                valueCodeableConcept=_concept(SNOMED, *SMOKING_STATUS[bool(data['smoker'])]))
+    if _value(data, 'activity'):
+        observe('social-history', '68516-4', "Weekly physical activity", valueString=data['activity'])
+    for medication in match_medications(_value(data, 'meds')):
+        entries.append((_urn(), {
+            'resourceType': 'MedicationStatement',
+            'status': 'active',
+            'medicationCodeableConcept': {'text': medication.drug},
+            'subject': {'reference': patient_url},
+            'dateAsserted': issued,
+            'note': [{'text': f"Recorded as {medication.term!r} in the medication list"}],
+        }))
+
+    entries.append((_urn(), {
+        'resourceType': 'RiskAssessment',
+        'status': 'final',
+        'subject': {'reference': patient_url},
+        'occurrenceDateTime': issued,
+        'basis': basis,
+        'prediction': [{
+            'outcome': {'text': "Type 2 diabetes within 10 years"},
+            'probabilityDecimal': round(float(risk_score) / 100, 4),
+            'qualitativeRisk': {'text': risk_level(risk_score)},
+        }],
+        'mitigation': "; ".join(advice['recommendations']),
+        'note': [{'text': advice['summary']}],
+    }))
+    if advice['referral']:
+        entries.append((_urn(), {
+            'resourceType': 'ServiceRequest',
+            'status': 'draft',
+            'intent': 'proposal',
+            'priority': 'urgent' if advice['priority'] == "HIGH" else 'routine',
+            'subject': {'reference': patient_url},
+            'code': {'text': "Clinical referral recommended (diabetes prevention)"},
+            'authoredOn': issued,
+        }))
+
+    return {
+        'resourceType': 'Bundle',
+        'type': 'collection',
+        'timestamp': issued,
+        'entry': [{'fullUrl': url, 'resource': resource} for url, resource in entries],
+    }
+
+
+def _json_default(value):
+    if hasattr(value, 'item'):  # numpy scalars from DataFrame rows
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serialisable")
+
+
+def fhir_json(data, advice, risk_score):
+    """The bundle as compact UTF-8 JSON bytes"""
+    return json.dumps(fhir_bundle(data, advice, risk_score), ensure_ascii=False,
+                      separators=(',', ':'), default=_json_default).encode()
+
+
+HTML_PAGE = """<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>
+<style>body{{font-family:Arial,sans-serif;max-width:760px;margin:2em auto;color:#212b32}}
+h1{{color:#005EB8;border-bottom:2px solid #005EB8}}table{{border-collapse:collapse;width:100%}}
+td,th{{border:1px solid #d8dde0;padding:6px;text-align:left}}.risk-{level_class}{{font-weight:bold}}</style>
+</head><body>
+<h1>{title}</h1><p>Generated on: {generated}</p>
+<h2>Patient Information</h2><p>Name: {name}<br>Age: {age}<br>Ethnic Group: {ethnicity}<br>
+Medications: {medications}</p>
+<h2>Clinical Summary</h2>
+<p class="risk-{level_class}">10-Year Diabetes Risk: {risk_score}% ({level} Risk)</p>
+<p>{summary}</p>
+<table><tr><th>HbA1c</th><th>Blood Pressure</th><th>Weight</th><th>Activity</th></tr>
+<tr><td>{hba1c} mmol/mol</td><td>{bp}</td><td>{weight} kg</td><td>{activity}</td></tr></table>
+<h2>Clinical Recommendations</h2><ol>{recommendations}</ol>{referral}
+<h2>NHS Support Resources</h2><ul>{resources}</ul>
+</body></html>
+"""
+
+
+def html_summary(data, advice, risk_score):
+    """Single-page HTML version of the GP report"""
+    def text(field):
+        value = _value(data, field)
+        return escape(str(value)) if value is not None else ''
+
+    level = risk_level(risk_score)
+    return HTML_PAGE.format(
+        title=escape(TITLE),
+        generated=date.today().strftime('%d/%m/%Y'),
+        name=text('name'), age=text('age'), ethnicity=text('ethnicity'),
+        medications=escape(flagged_medications(_value(data, 'meds'))),
+        level=level, level_class=level.lower(), risk_score=risk_score,
+        summary=escape(advice['summary']),
+        hba1c=text('hba1c'), bp=text('bp'), weight=text('weight'), activity=text('activity'),
+        recommendations=''.join(f"<li>{escape(r)}</li>" for r in advice['recommendations']),
+        referral="<p><strong>Clinical referral recommended.</strong></p>" if advice['referral'] else '',
+        resources=''.join(f"<li>{escape(r)}</li>" for r in RESOURCES),
+    )
+
+
+def write_ndjson(reports, stream):
+    """Write one FHIR bundle per line for each (data, advice, risk_score); returns the count"""
+    count = 0
+    for data, advice, risk_score in reports:
+        stream.write(fhir_json(data, advice, risk_score))
+        stream.write(b'\n')
+        count += 1
+    return count
+
+
+def write_html_archive(reports, path):
+    """Stream one HTML summary per (data, advice, risk_score) into a ZIP; returns the count"""
+    from bulk_reports import UniqueNames, report_name
+
+    count = 0
+    names = UniqueNames()
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for index, (data, advice, risk_score) in enumerate(reports):
+            name = names.claim(report_name(index, data, '.html'), index)
+            archive.writestr(name, html_summary(data, advice, risk_score))
+            count += 1
+    return count
+
+
+def _assessed(records):
+    from result_cache import assess
+
+    for data in records:
+        risk_score, advice = assess(data)
+        yield data, advice, risk_score
+
+
+def main(argv=None):
+    from bulk_reports import _read_records
+
+    parser = argparse.ArgumentParser(description="Export structured reports for a patient CSV")
+    parser.add_argument("input", help="CSV with one patient per row")
+    parser.add_argument("output", help="NDJSON file (fhir) or ZIP file (html)")
+    parser.add_argument("--format", choices=('fhir', 'html'), default='fhir')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    reports = _assessed(_read_records(args.input))
+    if args.format == 'fhir':
+        with open(args.output, 'wb') as out:
+            count = write_ndjson(reports, out)
+    else:
+        count = write_html_archive(reports, args.output)
+    logger.info(f"{count} {args.format} reports written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
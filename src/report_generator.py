@@ -1,78 +1,87 @@
 from fpdf import FPDF
-from datetime import date
 
-def generate_report(data, advice, risk_score):
+from report_cache import cached_report, store_report
+from report_content import flagged_medications, risk_level
+from report_template import COLUMN_WIDTH, FONT, NEXT_LINE, get_template
+
+DEFAULT_FILENAME = "nhs_diabetes_report.pdf"
+
+def _pdf_text(text):
+    """Drop characters the core PDF fonts cannot encode (e.g. advice emoji)"""
+    return str(text).encode('latin-1', 'ignore').decode('latin-1').strip()
+
+def build_report(data, advice, risk_score):
+    """Lay out the full GP report and return the unsaved FPDF document"""
+    template = get_template()
     pdf = FPDF()
     pdf.add_page()
     
     # NHS Header
-    pdf.set_font("Arial", 'B', 16)
-    pdf.set_text_color(0, 94, 184)  # NHS blue
-    pdf.cell(0, 10, "NHS Diabetes Prevention Report", ln=True, align='C')
-    pdf.set_font("Arial", size=10)
-    pdf.cell(0, 8, f"Generated: {date.today().strftime('%d/%m/%Y')}", ln=True, align='C')
-    pdf.line(10, 30, 200, 30)
+    template.header(pdf)
     
     # Patient Details
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 15, "Patient Information", ln=True)
-    pdf.set_font("Arial", size=12)
-    pdf.cell(40, 8, "Name:", ln=0)
-    pdf.cell(0, 8, data.get('name', ''), ln=True)
-    pdf.cell(40, 8, "Date of Birth:", ln=0)
-    pdf.cell(0, 8, f"Age: {data.get('age', '')}", ln=True)
-    pdf.cell(40, 8, "Ethnic Group:", ln=0)
-    pdf.cell(0, 8, data.get('ethnicity', ''), ln=True)
+    template.section_title(pdf, "Patient Information", height=15)
+    pdf.cell(40, 8, "Name:")
+    pdf.cell(0, 8, _pdf_text(data.get('name', '')), **NEXT_LINE)
+    pdf.cell(40, 8, "Date of Birth:")
+    pdf.cell(0, 8, f"Age: {data.get('age', '')}", **NEXT_LINE)
+    pdf.cell(40, 8, "Ethnic Group:")
+    pdf.cell(0, 8, _pdf_text(data.get('ethnicity', '')), **NEXT_LINE)
+    pdf.cell(40, 8, "Medications:")
+    pdf.cell(0, 8, _pdf_text(flagged_medications(data.get('meds'))), **NEXT_LINE)
     
     # Clinical Summary
     pdf.add_page()
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Clinical Summary", ln=True)
-    pdf.set_font("Arial", size=12)
+    template.section_title(pdf, "Clinical Summary")
     
     # Risk Score
-    risk_level = "High" if risk_score >= 20 else "Medium" if risk_score >= 10 else "Low"
-    pdf.cell(60, 8, "10-Year Diabetes Risk:", ln=0)
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 8, f"{risk_score}% ({risk_level} Risk)", ln=True)
-    pdf.set_font("Arial", size=12)
+    level = risk_level(risk_score)
+    pdf.cell(60, 8, "10-Year Diabetes Risk:")
+    pdf.set_font(FONT, 'B', 12)
+    pdf.cell(0, 8, f"{risk_score}% ({level} Risk)", **NEXT_LINE)
+    pdf.set_font(FONT, size=12)
     
     # Key Metrics Table
-    pdf.cell(0, 8, "Clinical Parameters:", ln=True)
-    col_width = 45
-    pdf.cell(col_width, 8, "HbA1c", border=1)
-    pdf.cell(col_width, 8, "Blood Pressure", border=1)
-    pdf.cell(col_width, 8, "Weight", border=1)
-    pdf.cell(col_width, 8, "Activity", border=1, ln=True)
-    
-    pdf.cell(col_width, 8, f"{data.get('hba1c', '')} mmol/mol", border=1)
-    pdf.cell(col_width, 8, data.get('bp', ''), border=1)
-    pdf.cell(col_width, 8, f"{data.get('weight', '')} kg", border=1)
-    pdf.cell(col_width, 8, data.get('activity', ''), border=1, ln=True)
+    pdf.cell(0, 8, "Clinical Parameters:", **NEXT_LINE)
+    template.parameter_header(pdf)
+    pdf.cell(COLUMN_WIDTH, 8, f"{data.get('hba1c', '')} mmol/mol", border=1)
+    pdf.cell(COLUMN_WIDTH, 8, _pdf_text(data.get('bp', '')), border=1)
+    pdf.cell(COLUMN_WIDTH, 8, f"{data.get('weight', '')} kg", border=1)
+    pdf.cell(COLUMN_WIDTH, 8, _pdf_text(data.get('activity', '')), border=1, **NEXT_LINE)
     
     # Recommendations
     pdf.add_page()
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Clinical Recommendations", ln=True)
-    pdf.set_font("Arial", size=12)
+    template.section_title(pdf, "Clinical Recommendations")
     
     for i, rec in enumerate(advice["recommendations"]):
-        pdf.cell(10, 8, f"{i+1}.", ln=0)
-        pdf.multi_cell(0, 8, rec)
+        template.recommendation(pdf, i + 1, _pdf_text(rec))
     
     # NHS Resources
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "NHS Support Resources", ln=True)
-    pdf.set_font("Arial", size=12)
-    pdf.multi_cell(0, 8, """
-    - NHS Diabetes Prevention Programme: https://preventing-diabetes.co.uk/
-    - Diabetes UK Helpline: 0345 123 2399
-    - NHS Weight Management Services
-    - Active 10 Walking Tracker App
-    """)
+    template.resources_page(pdf)
     
-    # Save file
-    pdf_path = "nhs_diabetes_report.pdf"
-    pdf.output(pdf_path)
-    return pdf_path
+    return pdf
+
+def render_report(data, advice, risk_score):
+    """Render the report in memory and return a zero-copy view of the PDF bytes"""
+    return memoryview(build_report(data, advice, risk_score).output())
+
+def generate_report(data, advice, risk_score, output=None):
+    """Render the GP report
+
+    With no `output` the PDF is built in memory and returned as bytes, so
+    concurrent sessions never share a file. Pass a path to save it there
+    (the path is returned) or a writable binary stream to write into.
+    Identical reports are served from the shared on-disk report cache.
+    """
+    pdf_bytes = cached_report(data, advice, risk_score)
+    if pdf_bytes is None:
+        pdf_bytes = render_report(data, advice, risk_score)
+        store_report(data, advice, risk_score, pdf_bytes)
+    if output is None:
+        return bytes(pdf_bytes)
+    if hasattr(output, 'write'):
+        output.write(pdf_bytes)
+        return output
+    with open(output, "wb") as f:
+        f.write(pdf_bytes)
+    return output
@@ -0,0 +1,216 @@
+"""Background queue for GP report rendering
+
+Sessions submit a report and get a job id back straight away; the PDF is
+rendered by a worker pool and the page polls for it. Jobs are keyed on the
+normalised patient inputs, the rule set version and the report date, so a
+request identical to one already queued, running or recently finished is
+merged into that job instead of being rendered again. A report already in
+the on-disk report cache (report_cache) completes its job straight away
+without taking a worker or a queue slot.
+
+REPORT_WORKERS sets the pool size and REPORT_QUEUE_DEPTH how many jobs may
+be waiting or running at once; beyond that submit() raises QueueFull and
+the page asks the clinician to retry, rather than every session stalling
+behind one long queue. REPORT_POOL=thread swaps the process pool for
+threads (smaller footprint, but renders then share the GIL with the app).
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import date
+from multiprocessing import get_context
+
+from clinical_rules import parse_bp
+from medications import recognised_drugs
+from metrics import observe
+from patient import PatientRecord
+from report_cache import cached_report, store_report
+from rule_engine import get_rules
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 2))
+REPORT_QUEUE_DEPTH = int(os.environ.get('REPORT_QUEUE_DEPTH', 32))
+REPORT_POOL = os.environ.get('REPORT_POOL', 'process')
+FINISHED_JOBS_KEPT = 256  # finished jobs held for polling and merging
+
+# Fields the report or its risk/advice read
+KEY_FIELDS = ('name', 'age', 'weight', 'bp', 'hba1c', 'ethnicity', 'activity', 'meds',
+              'smoker', 'family_history')
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class QueueFull(RuntimeError):
+    """REPORT_QUEUE_DEPTH jobs are already waiting or running"""
+
+
+def _normalise(field, value):
+    if field == 'bp':
+        return parse_bp(value) if value else None
+    if field in ('smoker', 'family_history'):
+        return bool(value)
+    if field == 'meds':  # the report and advice only use the recognised drugs
+        return recognised_drugs(value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def job_key(data, rules_version=None, day=None):
+    """Dedup key: normalised report inputs, rule set version and report date"""
+    return (
+        tuple(_normalise(field, data.get(field)) for field in KEY_FIELDS),
+        rules_version or get_rules().version,
+        day or date.today(),
+    )
+
+
+def _render(data, advice, risk_score):
+    """Worker: render and store in the report cache (submit() already missed it)
+
+    Returns (pdf_bytes, render seconds); the parent records the time, as
+    metrics in a spawned worker would never be seen.
+    """
+    from report_generator import render_report
+
+    started = time.perf_counter()
+    pdf_bytes = bytes(render_report(data, advice, risk_score))
+    seconds = time.perf_counter() - started
+    store_report(data, advice, risk_score, pdf_bytes)
+    return pdf_bytes, seconds
+
+
+class Job:
+    __slots__ = ('id', 'key', 'future', 'submitted', 'merged')
+
+    def __init__(self, key, future):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.future = future
+        self.submitted = time.monotonic()
+        self.merged = 0  # identical requests folded into this job
+
+    @property
+    def status(self):
+        if not self.future.done():
+            return RUNNING if self.future.running() else QUEUED
+        return FAILED if self.error else DONE
+
+    @property
+    def error(self):
+        """Why a finished job failed - its exception, or 'cancelled' - else None"""
+        if not self.future.done():
+            return None
+        if self.future.cancelled():
+            return "cancelled"
+        return self.future.exception()
+
+    def result(self, timeout=None):
+        """PDF bytes, waiting up to `timeout` seconds; re-raises a failed render's error"""
+        return self.future.result(timeout)[0]
+
+    def wait(self, timeout):
+        """True once finished, waiting at most `timeout` seconds"""
+        return bool(wait([self.future], timeout).done)
+
+
+class ReportQueue:
+    """Deduplicating front end to a report rendering pool"""
+
+    def __init__(self, workers=REPORT_WORKERS, max_depth=REPORT_QUEUE_DEPTH, pool=REPORT_POOL):
+        self.workers = workers
+        self.kind = pool
+        self.pool = self._new_pool()
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # id -> Job; finished jobs trimmed oldest first
+        self._by_key = {}
+        self._pending = 0
+
+    def _new_pool(self):
+        if self.kind == 'thread':
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='report')
+        # spawn: forking the multi-threaded Streamlit server is not safe
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+
+    def submit(self, data, advice, risk_score):
+        """Job id rendering this report, reusing an identical queued/running/recent job"""
+        key = job_key(data)
+        if not isinstance(data, PatientRecord):
+            data = dict(data)  # the session keeps editing its own dict
+        pdf_bytes = cached_report(data, advice, risk_score)
+        with self._lock:
+            job = self._by_key.get(key)
+            if job is not None and job.status != FAILED:
+                job.merged += 1
+                self._jobs.move_to_end(job.id)
+                return job.id
+            if pdf_bytes is not None:  # rendered before, here or by another process
+                future = Future()
+                future.set_running_or_notify_cancel()
+                future.set_result((pdf_bytes, None))  # no render to time
+            else:
+                if self._pending >= self.max_depth:
+                    raise QueueFull(f"{self._pending} reports already queued")
+                try:
+                    future = self.pool.submit(_render, data, advice, risk_score)
+                except BrokenExecutor:  # a worker died; jobs already on it have failed
+                    logger.warning("Report pool broken, starting a new one")
+                    self.pool = self._new_pool()
+                    future = self.pool.submit(_render, data, advice, risk_score)
+            job = Job(key, future)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+            self._pending += 1
+        future.add_done_callback(lambda _, job=job: self._finished(job))
+        return job.id
+
+    def _finished(self, job):
+        observe("report_job", time.monotonic() - job.submitted)
+        if job.error:
+            logger.error(f"Report job {job.id} failed: {job.error}")
+        elif job.future.result()[1] is not None:
+            observe("pdf_render", job.future.result()[1])
+        with self._lock:
+            self._pending -= 1
+            finished = [j for j in self._jobs.values() if j.future.done()]
+            for old in finished[:max(len(finished) - FINISHED_JOBS_KEPT, 0)]:
+                del self._jobs[old.id]
+                if self._by_key.get(old.key) is old:
+                    del self._by_key[old.key]
+
+    def get(self, job_id):
+        """The Job, or None once it has been trimmed"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            'pending': sum(not job.future.done() for job in jobs),
+            'kept': len(jobs),
+            'merged': sum(job.merged for job in jobs),
+            'max_depth': self.max_depth,
+        }
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Process-wide ReportQueue, created on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = ReportQueue()
+        return _queue
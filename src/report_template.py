@@ -0,0 +1,103 @@
+"""Static layout of the GP report, computed once per process and reused
+
+Only the patient cells, risk line and recommendation list change between
+reports. Everything else - fonts, header, parameter table columns and the
+"NHS Support Resources" page - is laid out here once, with line breaking
+done ahead of time so report_generator only has to emit fixed cells.
+"""
+import threading
+from datetime import date
+from functools import lru_cache
+
+from fpdf import FPDF
+from fpdf.enums import MethodReturnValue
+
+from report_content import RESOURCES, TITLE
+
+FONT = "helvetica"  # What "Arial" resolved to, without the per-call substitution warning
+LINE_HEIGHT = 8
+COLUMN_WIDTH = 45
+NUMBER_WIDTH = 10
+
+PARAMETER_COLUMNS = ("HbA1c", "Blood Pressure", "Weight", "Activity")
+RESOURCES_TEXT = "\n" + "".join(f"    - {resource}\n" for resource in RESOURCES) + "    "
+
+NEXT_LINE = {'new_x': "LMARGIN", 'new_y': "NEXT"}
+
+
+_measuring = threading.local()
+
+
+def _measuring_pdf():
+    """Scratch page for dry-run line breaking; one per thread, since measuring mutates it"""
+    pdf = getattr(_measuring, 'pdf', None)
+    if pdf is None:
+        pdf = _measuring.pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font(FONT, size=12)
+    return pdf
+
+
+@lru_cache(maxsize=1024)
+def split_lines(text, width):
+    """Line-break `text` at 12pt for a box `width` mm wide (cached per text)"""
+    lines = _measuring_pdf().multi_cell(width, LINE_HEIGHT, text, dry_run=True,
+                                        output=MethodReturnValue.LINES)
+    return tuple(lines)
+
+
+class ReportTemplate:
+    """Pre-laid-out static sections of the report"""
+
+    def __init__(self):
+        page = _measuring_pdf()
+        self.full_width = page.epw
+        self.recommendation_width = page.epw - NUMBER_WIDTH
+        self.resource_lines = split_lines(RESOURCES_TEXT, self.full_width)
+        self._generated_on = None
+        self._generated_line = ""
+
+    def generated_line(self):
+        today = date.today()
+        if today != self._generated_on:
+            self._generated_on = today
+            self._generated_line = f"Generated: {today.strftime('%d/%m/%Y')}"
+        return self._generated_line
+
+    def header(self, pdf):
+        pdf.set_font(FONT, 'B', 16)
+        pdf.set_text_color(0, 94, 184)  # NHS blue
+        pdf.cell(0, 10, TITLE, align='C', **NEXT_LINE)
+        pdf.set_font(FONT, size=10)
+        pdf.cell(0, 8, self.generated_line(), align='C', **NEXT_LINE)
+        pdf.line(10, 30, 200, 30)
+
+    def section_title(self, pdf, title, height=10):
+        pdf.set_font(FONT, 'B', 14)
+        pdf.cell(0, height, title, **NEXT_LINE)
+        pdf.set_font(FONT, size=12)
+
+    def parameter_header(self, pdf):
+        for column in PARAMETER_COLUMNS[:-1]:
+            pdf.cell(COLUMN_WIDTH, LINE_HEIGHT, column, border=1)
+        pdf.cell(COLUMN_WIDTH, LINE_HEIGHT, PARAMETER_COLUMNS[-1], border=1, **NEXT_LINE)
+
+    def recommendation(self, pdf, number, text):
+        """Numbered recommendation; only text that actually wraps goes through multi_cell"""
+        pdf.cell(NUMBER_WIDTH, LINE_HEIGHT, f"{number}.")
+        if len(split_lines(text, self.recommendation_width)) > 1:
+            pdf.multi_cell(self.recommendation_width, LINE_HEIGHT, text, **NEXT_LINE)
+        else:
+            pdf.cell(self.recommendation_width, LINE_HEIGHT, text, **NEXT_LINE)
+
+    def resources_page(self, pdf):
+        pdf.add_page()
+        self.section_title(pdf, "NHS Support Resources")
+        for line in self.resource_lines:
+            pdf.cell(self.full_width, LINE_HEIGHT, line, **NEXT_LINE)
+
+
+@lru_cache(maxsize=None)
+def get_template():
+    """Process-wide ReportTemplate, built on first use"""
+    return ReportTemplate()
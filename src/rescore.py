@@ -0,0 +1,377 @@
+"""Incremental re-scoring of stored assessments after a rule set change
+
+Comparing two rule set versions section by section gives the inputs whose
+score points or advice actually differ: the age / HbA1c / systolic / BMI
+ranges where a band's outcome moved, the ethnicities, activity levels,
+flags and medication classes whose points or advice text changed, the
+risk scores either side of a moved threshold. Those become one SQL
+condition, so only the patients whose latest assessment falls inside it
+are re-evaluated under the new rules; everyone else's stored result is
+already what the new rules would give. Changes the comparison cannot pin
+to an input (the conversion factors, the risk summary) select everyone.
+
+Assessments whose result changed get a revision appended to the store
+(see patient_store), and the diff report lists the patients whose
+priority, referral flag or risk tier changed.
+
+    python src/rescore.py --report changes.csv              # to the newest rule set
+    python src/rescore.py --to 2 --dry-run --report changes.csv
+"""
+import argparse
+import csv
+import logging
+import math
+import sys
+
+from medications import CLASSES
+from patient_store import STORE_PATH, PatientStore
+from report_content import risk_level
+from rule_engine import _advice_outcome, _compile_bands, _compile_points, get_rules
+
+logger = logging.getLogger(__name__)
+
+RESCORE_CHUNK = 10_000  # assessments read, evaluated and written per transaction
+
+BOUNDS = ('min', 'max', 'above', 'below')
+FLAG_COLUMNS = ('smoker', 'family_history')
+# Score / advice default -> column whose NULLs it stands in for
+DEFAULT_COLUMNS = {'age': 'age', 'hba1c': 'hba1c', 'ethnicity': 'ethnicity', 'weight': 'weight',
+                   'bp': 'systolic', 'activity': 'activity'}
+
+SCORE_SECTIONS = {'defaults', 'age', 'hba1c', 'ethnicity', 'systolic', 'flags', 'activity', 'conversion'}
+ADVICE_SECTIONS = {'defaults', 'hba1c', 'hypertension', 'ethnicity', 'activity', 'flags', 'risk',
+                   'medications'}
+REPORT_FIELDS = ('patient_id', 'recorded_at', 'old_rules_version', 'new_rules_version',
+                 'old_risk_score', 'new_risk_score', 'old_risk_tier', 'new_risk_tier',
+                 'old_priority', 'new_priority', 'old_referral', 'new_referral')
+
+
+class Selection:
+    """OR of SQL conditions on assessments columns: the rows a rule change can affect"""
+
+    def __init__(self):
+        self.conditions = []
+        self.params = []
+        self.reasons = []
+        self.everyone = False
+
+    def add(self, condition, params=(), reason=''):
+        self.conditions.append(condition)
+        self.params.extend(params)
+        if reason and reason not in self.reasons:
+            self.reasons.append(reason)
+
+    def add_everyone(self, reason):
+        self.everyone = True
+        self.reasons.append(reason)
+
+    def sql(self):
+        """(condition, params); '0' when nothing is affected"""
+        if self.everyone:
+            return '1', []
+        return ' OR '.join(f"({condition})" for condition in self.conditions) or '0', list(self.params)
+
+
+def _bounds(bands):
+    return [band[key] for band in bands for key in BOUNDS if key in band]
+
+
+def _regions(bounds):
+    """(low, high, closed) pieces of the number line between and at the bounds:
+    open intervals (low, high) and single points [low, low]"""
+    regions, previous = [], -math.inf
+    for point in sorted(set(bounds)):
+        regions.append((previous, point, False))
+        regions.append((point, point, True))
+        previous = point
+    regions.append((previous, math.inf, False))
+    return regions
+
+
+def _sample(low, high, closed):
+    """A value inside the region; band outcomes are constant across it"""
+    if closed:
+        return low
+    if math.isinf(low) and math.isinf(high):
+        return 0
+    if math.isinf(low):
+        return high - 1
+    if math.isinf(high):
+        return low + 1
+    return (low + high) / 2
+
+
+def changed_ranges(old, new, bounds):
+    """[(low, low_closed, high, high_closed)] ranges of x where old(x) != new(x)
+
+    `old` and `new` are band functions whose outcome only changes at `bounds`.
+    """
+    ranges, run = [], None
+    for low, high, closed in _regions(bounds):
+        x = _sample(low, high, closed)
+        if old(x) != new(x):
+            if run is None:
+                run = [low, closed, high, closed]
+            else:
+                run[2:] = [high, closed]
+        elif run is not None:
+            ranges.append(tuple(run))
+            run = None
+    if run is not None:
+        ranges.append(tuple(run))
+    return ranges
+
+
+def _range_condition(expression, low, low_closed, high, high_closed):
+    terms = []
+    if not math.isinf(low):
+        terms.append(f"{expression} {'>=' if low_closed else '>'} {low!r}")
+    if not math.isinf(high):
+        terms.append(f"{expression} {'<=' if high_closed else '<'} {high!r}")
+    return ' AND '.join(terms) or f"{expression} IS NOT NULL"
+
+
+def _add_ranges(selection, expression, old, new, bounds, reason, default=None, column=None):
+    """Select where the band functions disagree, and NULLs when they disagree on `default`"""
+    for low, low_closed, high, high_closed in changed_ranges(old, new, bounds):
+        selection.add(_range_condition(expression, low, low_closed, high, high_closed), reason=reason)
+    if default is not None and old(default) != new(default):
+        selection.add(f"{column or expression} IS NULL", reason=reason)
+
+
+def _add_values(selection, column, old, new, reason, missing=None, default=None):
+    """Select the column values whose entry differs between the old and new mappings"""
+    changed = sorted(key for key in set(old) | set(new) if old.get(key, missing) != new.get(key, missing))
+    if changed:
+        selection.add(f"{column} IN ({', '.join('?' * len(changed))})", changed, reason)
+    if default is not None and default in changed:
+        selection.add(f"{column} IS NULL", reason=reason)
+
+
+def _add_flags(selection, old, new, reason):
+    for name in sorted(set(old) | set(new)):
+        if old.get(name) != new.get(name) and name in FLAG_COLUMNS:
+            selection.add(f"{name} = 1", reason=reason)
+
+
+def _add_defaults(selection, old, new, reason):
+    for name in sorted(set(old) | set(new)):
+        if old.get(name) != new.get(name) and name in DEFAULT_COLUMNS:
+            selection.add(f"{DEFAULT_COLUMNS[name]} IS NULL", reason=reason)
+
+
+def _score_changes(selection, old, new):
+    if set(old) - SCORE_SECTIONS or set(new) - SCORE_SECTIONS:
+        selection.add_everyone("unrecognised score section")
+        return
+    _add_defaults(selection, old['defaults'], new['defaults'], "score defaults")
+    for name in ('age', 'hba1c', 'systolic'):
+        if old[name] != new[name]:
+            _add_ranges(selection, name, _compile_points(old[name]), _compile_points(new[name]),
+                        _bounds(old[name]['bands']) + _bounds(new[name]['bands']), f"{name} points",
+                        # no BP reading scores no systolic points, whatever the defaults
+                        default=None if name == 'systolic' else new['defaults'][name])
+    _add_values(selection, 'ethnicity', old['ethnicity'], new['ethnicity'], "ethnicity points",
+                missing=0, default=new['defaults']['ethnicity'])
+    _add_values(selection, 'activity', old['activity'], new['activity'], "activity points", missing=0)
+    _add_flags(selection, old['flags'], new['flags'], "flag points")
+
+    old_conversion = {key: value for key, value in old['conversion'].items() if key != 'bmi'}
+    new_conversion = {key: value for key, value in new['conversion'].items() if key != 'bmi'}
+    if old_conversion != new_conversion:
+        selection.add_everyone("risk conversion")
+    elif old['conversion']['bmi'] != new['conversion']['bmi']:
+        old_bmi, new_bmi = old['conversion']['bmi'], new['conversion']['bmi']
+        height_squared = new['conversion']['height'] ** 2
+        # Same expression as the rules, so SQLite rounds the BMI exactly as Python does
+        _add_ranges(selection, f"weight / {height_squared!r}",
+                    _compile_bands(old_bmi, [band['factor'] for band in old_bmi], None),
+                    _compile_bands(new_bmi, [band['factor'] for band in new_bmi], None),
+                    _bounds(old_bmi) + _bounds(new_bmi), "BMI factor",
+                    default=new['defaults']['weight'] / height_squared, column='weight')
+
+
+def _hba1c_advice(section):
+    bands, otherwise = section['bands'], section['otherwise']
+    extra = otherwise.get('bands', [])
+    outcome = _compile_bands(bands, [_advice_outcome(band) for band in bands], _advice_outcome(otherwise))
+    extra_recommendations = _compile_bands(extra, [tuple(band['recommendations']) for band in extra], ())
+    bounds = _bounds(bands) + _bounds(extra)
+    return (lambda x: (outcome(x), extra_recommendations(x))), bounds
+
+
+def _advice_changes(selection, old, new):
+    if set(old) - ADVICE_SECTIONS or set(new) - ADVICE_SECTIONS:
+        selection.add_everyone("unrecognised advice section")
+        return
+    _add_defaults(selection, old['defaults'], new['defaults'], "advice defaults")
+    if old['hba1c'] != new['hba1c']:
+        (old_advice, old_bounds), (new_advice, new_bounds) = _hba1c_advice(old['hba1c']), _hba1c_advice(new['hba1c'])
+        _add_ranges(selection, 'hba1c', old_advice, new_advice, old_bounds + new_bounds, "HbA1c advice",
+                    default=new['defaults']['hba1c'])
+
+    if old['hypertension'] != new['hypertension']:
+        # Anyone hypertensive under either version
+        systolic = min(old['hypertension']['systolic_min'], new['hypertension']['systolic_min'])
+        diastolic = min(old['hypertension']['diastolic_min'], new['hypertension']['diastolic_min'])
+        selection.add(f"systolic >= {systolic!r} OR diastolic >= {diastolic!r}", reason="hypertension advice")
+
+    old_ethnicity, new_ethnicity = old['ethnicity'], new['ethnicity']
+    if old_ethnicity != new_ethnicity:
+        groups = set(old_ethnicity['groups']) ^ set(new_ethnicity['groups'])
+        if old_ethnicity['recommendation'] != new_ethnicity['recommendation']:
+            groups |= set(old_ethnicity['groups']) | set(new_ethnicity['groups'])
+        _add_values(selection, 'ethnicity', dict.fromkeys(groups, 'old'), dict.fromkeys(groups, 'new'),
+                    "ethnicity advice", default=new['defaults']['ethnicity'])
+
+    _add_values(selection, 'activity', old['activity'], new['activity'], "activity advice",
+                default=new['defaults']['activity'])
+    _add_flags(selection, old['flags'], new['flags'], "flag advice")
+
+    old_risk, new_risk = old['risk'], new['risk']
+    if old_risk['summary'] != new_risk['summary']:
+        selection.add_everyone("risk summary")
+    elif old_risk['recommendation'] != new_risk['recommendation']:
+        selection.add(f"risk_score > {min(old_risk['above'], new_risk['above'])!r}", reason="risk advice")
+    elif old_risk['above'] != new_risk['above']:
+        low, high = sorted((old_risk['above'], new_risk['above']))
+        selection.add(f"risk_score > {low!r} AND risk_score <= {high!r}", reason="risk advice")
+
+    old_medications, new_medications = old.get('medications', {}), new.get('medications', {})
+    for drug_class in sorted(set(old_medications) | set(new_medications)):
+        if old_medications.get(drug_class) != new_medications.get(drug_class) and drug_class in CLASSES:
+            selection.add("has_medication_class(meds, ?)", (drug_class,), "medication advice")
+
+
+def affected(old_spec, new_spec):
+    """Selection of the assessments whose result can differ between two rule set specs
+
+    Risk scores in the stored rows are the old version's; they are only
+    compared against moved risk thresholds, which is exact for every row
+    whose score inputs are not selected anyway.
+    """
+    selection = Selection()
+    ignored = {'version', 'description'}
+    if {k: v for k, v in old_spec.items() if k not in ignored | {'score', 'advice'}} != \
+            {k: v for k, v in new_spec.items() if k not in ignored | {'score', 'advice'}}:
+        selection.add_everyone("unrecognised rule set section")
+        return selection
+    _score_changes(selection, old_spec['score'], new_spec['score'])
+    _advice_changes(selection, old_spec['advice'], new_spec['advice'])
+    return selection
+
+
+def _patient_data(row):
+    """patient_data dict for a stored assessment; NULL fields are left out so the defaults apply"""
+    data = {field: row[field] for field in ('age', 'weight', 'hba1c', 'ethnicity', 'activity')
+            if row[field] is not None}
+    for field in FLAG_COLUMNS:
+        if row[field] is not None:
+            data[field] = bool(row[field])
+    data['bp'] = f"{row['systolic']}/{row['diastolic']}" if row['systolic'] is not None else ''
+    data['meds'] = row['meds'] or ''
+    return data
+
+
+def _difference(row, risk_score, advice, rules_version):
+    """Diff report entry when priority, referral or risk tier changed, else None"""
+    old_referral = bool(row['referral']) if row['referral'] is not None else None
+    entry = {
+        'patient_id': row['patient_id'],
+        'recorded_at': row['recorded_at'],
+        'old_rules_version': row['rules_version'],
+        'new_rules_version': rules_version,
+        'old_risk_score': row['risk_score'],
+        'new_risk_score': risk_score,
+        'old_risk_tier': risk_level(row['risk_score']),
+        'new_risk_tier': risk_level(risk_score),
+        'old_priority': row['priority'],
+        'new_priority': advice['priority'],
+        'old_referral': old_referral,
+        'new_referral': advice['referral'],
+    }
+    if (entry['old_risk_tier'], entry['old_priority'], entry['old_referral']) == \
+            (entry['new_risk_tier'], entry['new_priority'], entry['new_referral']):
+        return None
+    return entry
+
+
+def rescore(store, version=None, dry_run=False, full=False, chunk=RESCORE_CHUNK):
+    """Bring every patient's latest assessment up to rule set `version` (default newest)
+
+    Returns a summary dict: the assessments selected and re-evaluated,
+    those rewritten (result changed) and `changes`, the diff report rows.
+    With dry_run nothing is written; with full every assessment not yet on
+    `version` is re-evaluated.
+    """
+    rules = get_rules(version)
+    summary = {'rules_version': rules.version, 'selected': 0, 'rewritten': 0, 'changes': []}
+    for old_version in store.rules_versions():
+        if old_version == rules.version:
+            continue
+        selection = Selection()
+        if full:
+            selection.add_everyone("full re-score")
+        else:
+            try:
+                selection = affected(get_rules(old_version).spec, rules.spec)
+            except (KeyError, ValueError):
+                selection.add_everyone(f"rule set {old_version} is no longer available")
+        condition, params = selection.sql()
+        logger.info(f"Rules {old_version} -> {rules.version}: "
+                    f"{', '.join(selection.reasons) or 'no input affected'}")
+        if condition == '0':
+            continue
+
+        for rows in store.latest_matching(f"rules_version IS ? AND ({condition})",
+                                          [old_version, *params], chunk):
+            revisions = []
+            for row in rows:
+                data = _patient_data(row)
+                risk_score, advice = rules.evaluate(data)
+                if risk_score == row['risk_score'] and advice == row['advice']:
+                    continue
+                revisions.append((row['id'], row['patient_id'], data, risk_score, advice, row['recorded_at']))
+                change = _difference(row, risk_score, advice, rules.version)
+                if change:
+                    summary['changes'].append(change)
+            summary['selected'] += len(rows)
+            summary['rewritten'] += len(revisions)
+            if revisions and not dry_run:
+                store.revise(revisions, rules.version)
+    logger.info(f"Re-scored {summary['selected']} assessments, {summary['rewritten']} rewritten, "
+                f"{len(summary['changes'])} with a changed priority, referral or risk tier")
+    return summary
+
+
+def write_report(changes, stream):
+    writer = csv.DictWriter(stream, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    writer.writerows(changes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score stored assessments affected by a rule change")
+    parser.add_argument('--to', dest='version', help="rule set version (default: the newest)")
+    parser.add_argument('--store', default=STORE_PATH)
+    parser.add_argument('--report', help="write the diff report CSV here ('-' for stdout)")
+    parser.add_argument('--dry-run', action='store_true', help="report without writing revisions")
+    parser.add_argument('--full', action='store_true', help="re-evaluate every assessment, not only the affected ones")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    store = PatientStore(args.store)
+    try:
+        summary = rescore(store, args.version, args.dry_run, args.full)
+    finally:
+        store.close()
+    if args.report == '-':
+        write_report(summary['changes'], sys.stdout)
+    elif args.report:
+        with open(args.report, 'w', newline='') as f:
+            write_report(summary['changes'], f)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
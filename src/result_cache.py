@@ -0,0 +1,84 @@
+"""Process-wide memo cache for risk scores and advice
+
+Risk and advice are pure functions of a few discrete patient fields and the
+rule set version, and screening clinics see the same profiles again and
+again. Results are cached here - shared by every Streamlit session in the
+process and by the per-record batch paths - keyed on a normalised
+fingerprint of those fields, with LRU eviction once RESULT_CACHE_SIZE
+entries are held.
+"""
+import os
+from functools import lru_cache
+
+from medications import recognised_drugs
+from rule_engine import get_rules
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 4096))
+
+# Only these fields influence the score or the advice
+INPUT_FIELDS = ('age', 'hba1c', 'ethnicity', 'bp', 'weight', 'activity')
+FLAG_FIELDS = ('smoker', 'family_history')
+
+
+def fingerprint(data):
+    """Hashable key for the fields that affect results
+
+    Missing fields stay missing (the rules apply different defaults), flags
+    are reduced to their truth value, numbers compare by value, so 50 and
+    50.0 share an entry, and the medication list is reduced to the drugs
+    recognised in it.
+    """
+    key = [(field, data[field]) for field in INPUT_FIELDS if field in data]
+    key.extend((field, bool(data[field])) for field in FLAG_FIELDS if field in data)
+    if 'meds' in data:
+        key.append(('meds', recognised_drugs(data['meds'])))
+    return tuple(key)
+
+
+@lru_cache(maxsize=RESULT_CACHE_SIZE)
+def _evaluate(key, version):
+    return get_rules(version).evaluate(dict(key))
+
+
+def _copy(result):
+    risk_score, advice = result
+    return risk_score, dict(advice, recommendations=list(advice["recommendations"]))
+
+
+def assess(data):
+    """(risk_score, advice) for a patient, served from the cache when possible
+
+    The advice dict is a fresh copy, so callers may modify it freely.
+    """
+    rules = get_rules()
+    try:
+        key = fingerprint(data)
+        hash(key)
+    except TypeError:  # unhashable field value - compute without caching
+        return rules.evaluate(data)
+    return _copy(_evaluate(key, rules.version))
+
+
+def cached_risk_score(data):
+    return assess(data)[0]
+
+
+def cached_advice(data):
+    return assess(data)[1]
+
+
+def cache_stats():
+    """Hit/miss counters and occupancy of the shared cache"""
+    info = _evaluate.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
+
+
+def clear_cache():
+    _evaluate.cache_clear()
@@ -0,0 +1,183 @@
+"""A rule set's risk score tabulated over its input bands
+
+Apart from weight, every input to the risk score only matters through the
+band it falls in, and weight only through its BMI band. A RiskTable holds
+the score for every combination of bands of one RuleSet - filled by scoring
+one representative patient per cell with the rule set itself - so scoring
+is reduced to finding each input's band and one indexed read.
+what_if_surface uses the same table to score a whole weight x HbA1c grid in
+a single vectorised lookup.
+
+The bands are read from the rule set's score section, first matching band
+wins as in rule_engine. Tables are built on first use and cached per
+compiled rule set, so a new rule version gets its own table;
+table_parity_mismatches checks a table against RuleSet.calculate_risk_score.
+"""
+import math
+from functools import lru_cache
+from itertools import product
+
+import numpy as np
+
+from cohort_scoring import _equals, _numeric, _records, _size, _truthy, parse_bp_column
+from patient_columns import PatientColumns
+from rule_engine import get_rules
+
+_COMPARE = {'min': np.greater_equal, 'max': np.less_equal, 'above': np.greater, 'below': np.less}
+_DIASTOLIC = 80  # representative readings only need a systolic value
+
+
+def band_index(bands, values, scale=1):
+    """Position of the first band each value/scale falls in; len(bands) = none (otherwise)"""
+    x = _numeric(values) / scale
+    if not bands:
+        return np.zeros(x.shape, dtype=np.intp)
+    conditions = []
+    for band in bands:
+        condition = np.ones(x.shape, dtype=bool)
+        for key, compare in _COMPARE.items():
+            if key in band:
+                condition &= compare(x, band[key])
+        conditions.append(condition)
+    return np.select(conditions, list(range(len(bands))), len(bands))
+
+
+def _representatives(bands, scale=1, integer=False):
+    """One input per band (and the otherwise band), None where no input lands"""
+    bounds = sorted({band[key] * scale for band in bands for key in _COMPARE if key in band}) or [0]
+    candidates = []
+    for bound in bounds:
+        if integer:
+            candidates += [math.floor(bound) - 1, math.floor(bound), math.ceil(bound), math.ceil(bound) + 1]
+        else:
+            candidates += [bound - 1, bound, bound + 1]
+    if not integer:
+        candidates += [(low + high) / 2 for low, high in zip(bounds, bounds[1:])]
+        candidates.append(math.nan)
+    found = [None] * (len(bands) + 1)
+    for value, index in zip(candidates, band_index(bands, candidates, scale)):
+        if found[index] is None:
+            found[index] = value
+    return found
+
+
+def _field(cohort, name, size, default):
+    if name in cohort:
+        values = cohort[name]
+        return values.to_numpy() if hasattr(values, 'to_numpy') else np.asarray(values)
+    return np.full(size, default, dtype=object)
+
+
+def _labels(labels, values):
+    """Index of each value in `labels`; len(labels) for anything else"""
+    return np.select([_equals(values, label) for label in labels], list(range(len(labels))), len(labels))
+
+
+class RiskTable:
+    """Risk score of one RuleSet for every combination of input bands"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.version = rules.version
+        score = rules.spec['score']
+        self._defaults = score['defaults']
+        self._age = score['age']['bands']
+        self._hba1c = score['hba1c']['bands']
+        self._systolic = score['systolic']['bands']
+        self._ethnicities = tuple(score['ethnicity'])
+        self._flags = tuple(score['flags'])
+        self._activities = tuple(score['activity'])
+        self._bmi = score['conversion']['bmi']
+        self._height_squared = score['conversion']['height'] ** 2
+
+        # {field: representative per band}, in axis order
+        self.axes = {
+            'age': _representatives(self._age),
+            'hba1c': _representatives(self._hba1c),
+            'ethnicity': [*self._ethnicities, self._other(self._ethnicities, self._defaults['ethnicity'])],
+            # after the systolic bands: no readable BP, which scores no BP points at all
+            'bp': [None if s is None else f"{s}/{_DIASTOLIC}"
+                   for s in _representatives(self._systolic, integer=True)] + [''],
+            **{flag: [False, True] for flag in self._flags},
+            'activity': [*self._activities, None],
+            'weight': _representatives(self._bmi, self._height_squared),
+        }
+        self.table = self._build()
+
+    @staticmethod
+    def _other(labels, default):
+        return default if default not in labels else ''
+
+    def _build(self):
+        """Dense score array indexed by band, in axes order (NaN where no input lands)"""
+        fields = tuple(self.axes)
+        table = np.full(tuple(len(values) for values in self.axes.values()), np.nan)
+        for index in product(*(range(len(values)) for values in self.axes.values())):
+            patient = {field: self.axes[field][i] for field, i in zip(fields, index)}
+            if all(patient[field] is not None for field in ('age', 'hba1c', 'bp', 'weight')):
+                table[index] = self.rules.calculate_risk_score(patient)
+        return table
+
+    def _systolic_column(self, cohort, size):
+        if isinstance(cohort, PatientColumns):
+            return cohort.systolic
+        return parse_bp_column(_field(cohort, 'bp', size, self._defaults['bp']))[0]
+
+    def band_indices(self, cohort, size=None):
+        """One band-index array per axis"""
+        if size is None:
+            size = _size(cohort)
+        systolic = self._systolic_column(cohort, size)
+        indices = {
+            'age': band_index(self._age, _field(cohort, 'age', size, self._defaults['age'])),
+            'hba1c': band_index(self._hba1c, _field(cohort, 'hba1c', size, self._defaults['hba1c'])),
+            'ethnicity': _labels(self._ethnicities, _field(cohort, 'ethnicity', size, self._defaults['ethnicity'])),
+            'bp': np.where(np.isnan(systolic), len(self._systolic) + 1, band_index(self._systolic, systolic)),
+            **{flag: _truthy(_field(cohort, flag, size, False)).astype(np.intp) for flag in self._flags},
+            'activity': _labels(self._activities, _field(cohort, 'activity', size, None)),
+            'weight': band_index(self._bmi, _field(cohort, 'weight', size, self._defaults['weight']),
+                                 self._height_squared),
+        }
+        return tuple(indices[field] for field in self.axes)
+
+    def lookup(self, cohort):
+        return self.table[self.band_indices(cohort)]
+
+
+@lru_cache(maxsize=8)
+def _risk_table(rules):
+    return RiskTable(rules)
+
+
+def get_risk_table(rules=None):
+    """RiskTable for `rules` (default the active rule set), built once per rule set"""
+    return _risk_table(rules or get_rules())
+
+
+def lookup_risk_scores(cohort, rules=None):
+    """Risk score per row of a DataFrame, column dict or PatientColumns, as a float array"""
+    return get_risk_table(rules).lookup(cohort)
+
+
+def table_parity_mismatches(cohort, rules=None):
+    """Row positions where the table and the rule set's own score disagree (should be empty)"""
+    rules = rules or get_rules()
+    table = lookup_risk_scores(cohort, rules)
+    scalar = np.array([rules.calculate_risk_score(row) for row in _records(cohort)])
+    return np.flatnonzero(table != scalar)
+
+
+def what_if_surface(data, weights, hba1c_values, rules=None, **changes):
+    """Risk for `data` over every weight (columns) x HbA1c (rows) combination
+
+    `changes` overrides other fields first, e.g. smoker=False to see the
+    surface after stopping smoking. Returns an array of shape
+    (len(hba1c_values), len(weights)).
+    """
+    table = get_risk_table(rules)
+    patient = {field: [value] for field, value in {**data, **changes}.items()
+               if field in table.axes and value is not None}
+    index = dict(zip(table.axes, (band[0] for band in table.band_indices(patient, 1))))
+    index['hba1c'] = band_index(table._hba1c, hba1c_values)[:, None]
+    index['weight'] = band_index(table._bmi, weights, table._height_squared)[None, :]
+    return table.table[tuple(index.values())]
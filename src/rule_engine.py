@@ -0,0 +1,337 @@
+"""Declarative, versioned clinical rules compiled into a single-pass evaluator
+
+Rule sets are JSON files in RULES_DIR (src/rules/ by default, override with
+DIABETES_RULES_DIR) holding every band, weight, advice text and referral
+trigger used by calculate_risk_score and generate_advice. A rule set is
+compiled once when loaded; RuleSet.evaluate then reads and parses each
+input a single time and returns the risk score and the advice together.
+
+Dropping a new `<version>.json` into RULES_DIR makes it the active rule set
+on the next get_rules() check, without a redeploy. Versions are dotted
+numbers ("2", "2.1"); a file that is half-written, malformed or has any
+other version is logged and skipped, and the last good rule set stays active.
+
+Band semantics (first matching band wins, otherwise the fallback applies):
+"min" / "max" are inclusive bounds, "below" / "above" are exclusive. Each
+band list is compiled into a single conditional expression.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from clinical_rules import parse_bp
+from medications import medication_classes
+from patient import PatientRecord
+
+RULES_DIR = os.environ.get(
+    'DIABETES_RULES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+)
+RELOAD_INTERVAL = 30  # seconds between checks of RULES_DIR for new revisions
+
+logger = logging.getLogger(__name__)
+
+_VERSION = re.compile(r'\d+(\.\d+)*')
+
+
+_BOUNDS = (('min', '{} <= x'), ('max', 'x <= {}'), ('above', 'x > {}'), ('below', 'x < {}'))
+
+
+def _band_condition(band):
+    """Python condition for a band's bounds, e.g. '35 <= x and x < 45'"""
+    terms = []
+    for key, template in _BOUNDS:
+        if key in band:
+            bound = band[key]
+            if isinstance(bound, bool) or not isinstance(bound, (int, float)) or not math.isfinite(bound):
+                raise ValueError(f"Band bound {key!r} must be a number, got {bound!r}")
+            terms.append(template.format(repr(bound)))
+    if not terms:
+        raise ValueError(f"Band {band!r} has no bounds")
+    return ' and '.join(terms)
+
+
+def _compile_bands(bands, values, otherwise):
+    """Compile a first-match band list into one function x -> value
+
+    Only the numeric bounds are written into the generated expression; the
+    values are bound as names, so the rule file cannot inject code.
+    """
+    namespace = {'otherwise': otherwise}
+    expression = 'otherwise'
+    for i in reversed(range(len(bands))):
+        namespace[f'v{i}'] = values[i]
+        expression = f"v{i} if {_band_condition(bands[i])} else {expression}"
+    return eval(f"lambda x: {expression}", namespace)
+
+
+def _compile_points(rule):
+    bands = rule['bands']
+    return _compile_bands(bands, [band['points'] for band in bands], rule['otherwise'])
+
+
+def _advice_outcome(band):
+    return (band['priority'], band['summary'], band.get('referral', False),
+            tuple(band.get('recommendations', ())))
+
+
+def _check_version(version):
+    version = str(version)
+    if not _VERSION.fullmatch(version):
+        raise ValueError(f"Rule set version must be a dotted number like '2' or '2.1', got {version!r}")
+    return version
+
+
+def _version_key(version):
+    return tuple(int(part) for part in _check_version(version).split('.'))
+
+
+class RuleSet:
+    """A compiled rule set; evaluate() gives (risk_score, advice)"""
+
+    def __init__(self, spec, source=None):
+        self.spec = spec
+        self.source = source
+        try:
+            self.version = _check_version(spec['version'])
+            self.description = spec.get('description', '')
+            self._compile_score(spec['score'])
+            self._compile_advice(spec['advice'])
+        except KeyError as e:
+            raise ValueError(f"Rule set {source or ''} is missing {e}") from None
+
+    def _compile_score(self, score):
+        self._score_defaults = score['defaults']
+        self._age_points = _compile_points(score['age'])
+        self._hba1c_points = _compile_points(score['hba1c'])
+        self._ethnicity_points = score['ethnicity']
+        self._systolic_points = _compile_points(score['systolic'])
+        self._flag_points = tuple(score['flags'].items())
+        self._activity_points = score['activity']
+        self._default_reading = parse_bp(self._score_defaults['bp'])
+
+        conversion = score['conversion']
+        self._points_factor = conversion['points_factor']
+        self._cap_before_bmi = conversion['cap_before_bmi']
+        self._height_squared = conversion['height'] ** 2
+        bmi = conversion['bmi']
+        self._bmi_factor = _compile_bands(bmi, [band['factor'] for band in bmi], None)
+        self._cap = conversion['cap']
+        self._decimals = conversion['decimals']
+
+    def _compile_advice(self, advice):
+        self._advice_defaults = advice['defaults']
+        hba1c = advice['hba1c']
+        otherwise = hba1c['otherwise']
+        self._hba1c_advice_otherwise = _advice_outcome(otherwise)
+        self._hba1c_advice = _compile_bands(
+            hba1c['bands'], [_advice_outcome(band) for band in hba1c['bands']],
+            self._hba1c_advice_otherwise,
+        )
+        extra = otherwise.get('bands', [])
+        self._hba1c_advice_extra = _compile_bands(
+            extra, [tuple(band['recommendations']) for band in extra], ()
+        )
+
+        hypertension = advice['hypertension']
+        self._hypertension = (hypertension['systolic_min'], hypertension['diastolic_min'],
+                              hypertension['recommendation'], hypertension['referral_systolic_min'])
+        self._ethnicity_groups = tuple(advice['ethnicity']['groups'])
+        self._ethnicity_text = advice['ethnicity']['recommendation']
+        self._activity_advice = {k: tuple(v) for k, v in advice['activity'].items()}
+        self._flag_advice = tuple(
+            (name, tuple(rule.get('recommendations', ())), rule.get('referral', False))
+            for name, rule in advice['flags'].items()
+        )
+        risk = advice['risk']
+        self._risk_summary = risk['summary']
+        self._risk_above = risk['above']
+        self._risk_text = risk['recommendation']
+        # Optional: rule sets before v2 have no medication advice
+        self._medication_advice = tuple(
+            (name, tuple(rule.get('recommendations', ())), rule.get('referral', False))
+            for name, rule in advice.get('medications', {}).items()
+        )
+
+    def risk_points(self, data, reading):
+        defaults = self._score_defaults
+        points = self._age_points(data.get('age', defaults['age']))
+        points += self._hba1c_points(data.get('hba1c', defaults['hba1c']))
+        points += self._ethnicity_points.get(data.get('ethnicity', defaults['ethnicity']), 0)
+        if reading:
+            points += self._systolic_points(reading[0])
+        for name, flag_points in self._flag_points:
+            if data.get(name):
+                points += flag_points
+        points += self._activity_points.get(data.get('activity'), 0)
+        return points
+
+    def risk_from_points(self, points, weight):
+        base_risk = min(points * self._points_factor, self._cap_before_bmi)
+        factor = self._bmi_factor(weight / self._height_squared)
+        if factor is not None:
+            base_risk *= factor
+        return round(min(base_risk, self._cap), self._decimals)
+
+    def evaluate(self, data):
+        """Risk score and advice dict for one patient, parsing each input once"""
+        if isinstance(data, PatientRecord):
+            reading = data.bp_reading
+        elif 'bp' in data:
+            reading = parse_bp(data['bp'])
+        else:
+            reading = self._default_reading
+        risk_score = self.risk_from_points(self.risk_points(data, reading),
+                                           data.get('weight', self._score_defaults['weight']))
+        return risk_score, self.advise(data, reading, risk_score)
+
+    def advise(self, data, reading, risk_score):
+        """Advice dict given the parsed BP reading and an already computed risk score"""
+        hba1c = data.get('hba1c', self._advice_defaults['hba1c'])
+        outcome = self._hba1c_advice(hba1c)
+        priority, summary, referral, recommendations = outcome
+        recommendations = list(recommendations)
+        if outcome is self._hba1c_advice_otherwise:
+            recommendations.extend(self._hba1c_advice_extra(hba1c))
+
+        # Cardiovascular risk - only when a reading was entered
+        if data.get('bp') and reading:
+            systolic, diastolic = reading
+            systolic_min, diastolic_min, text, referral_min = self._hypertension
+            if systolic >= systolic_min or diastolic >= diastolic_min:
+                recommendations.append(text.format(systolic=systolic, diastolic=diastolic))
+                if systolic >= referral_min:
+                    referral = True
+
+        ethnicity = data.get('ethnicity', self._advice_defaults['ethnicity'])
+        if ethnicity in self._ethnicity_groups:
+            recommendations.append(self._ethnicity_text.format(ethnicity=ethnicity))
+
+        activity = data.get('activity', self._advice_defaults['activity'])
+        recommendations.extend(self._activity_advice.get(activity, ()))
+
+        for name, flag_recommendations, flag_referral in self._flag_advice:
+            if data.get(name, False):
+                recommendations.extend(flag_recommendations)
+                referral = referral or flag_referral
+
+        summary += self._risk_summary.format(risk_score=risk_score)
+        if risk_score > self._risk_above:
+            recommendations.append(self._risk_text.format(risk_score=risk_score))
+
+        if self._medication_advice:
+            classes = medication_classes(data.get('meds'))
+            for name, medication_recommendations, medication_referral in self._medication_advice:
+                if name in classes:
+                    recommendations.extend(medication_recommendations)
+                    referral = referral or medication_referral
+
+        return {
+            "priority": priority,
+            "summary": summary,
+            "recommendations": recommendations,
+            "referral": referral,
+        }
+
+    def calculate_risk_score(self, data):
+        return self.evaluate(data)[0]
+
+    def generate_advice(self, data):
+        return self.evaluate(data)[1]
+
+
+def load_rule_set(path):
+    """Read and compile one rule set file"""
+    with open(path, encoding='utf-8') as f:
+        return RuleSet(json.load(f), source=path)
+
+
+def available_versions(directory=None):
+    """{version: path} for every readable rule set file in `directory`
+
+    Files that are not valid JSON (e.g. still being written) or have no
+    valid version are logged and left out.
+    """
+    directory = directory or RULES_DIR
+    versions = {}
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            try:
+                with open(entry.path, encoding='utf-8') as f:
+                    versions[_check_version(json.load(f)['version'])] = entry.path
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping rule set {entry.path}: {e!r}")
+    return versions
+
+
+_lock = threading.Lock()
+_compiled = {}  # (path, mtime) -> RuleSet
+_rejected = set()  # (path, mtime) that failed to compile, so they are logged once
+_versions = {}
+_checked_at = 0.0
+_active = None  # last rule set served as the newest
+
+
+def _compile(path):
+    """Compiled rule set at `path`, or None if it cannot be read or compiled"""
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError as e:
+        logger.warning(f"Skipping rule set {path}: {e!r}")
+        return None
+    if key not in _compiled and key not in _rejected:
+        try:
+            _compiled[key] = load_rule_set(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Rule set {path} does not compile: {e!r}")
+            _rejected.add(key)
+    return _compiled.get(key)
+
+
+def get_rules(version=None):
+    """Compiled rule set for `version`, or the newest one in RULES_DIR
+
+    The directory listing is re-checked at most every RELOAD_INTERVAL
+    seconds; a changed or new file is compiled on first use. If the newest
+    file cannot be compiled the last good rule set keeps being served.
+    """
+    global _versions, _checked_at, _active
+    with _lock:
+        now = time.monotonic()
+        if not _versions or now - _checked_at > RELOAD_INTERVAL:
+            _versions = available_versions()
+            _checked_at = now
+        if version is not None:
+            version = _check_version(version)
+            rules = _compile(_versions[version]) if version in _versions else None
+            if rules is None:
+                raise KeyError(f"No usable rule set version {version!r} in {RULES_DIR}")
+            return rules
+        if _versions:
+            rules = _compile(_versions[max(_versions, key=_version_key)])
+            if rules is not None:
+                _active = rules
+        if _active is None:
+            raise RuntimeError(f"No usable rule set in {RULES_DIR}")
+        return _active
+
+
+def parity_mismatches(records, rules=None):
+    """Indices of records where the compiled rules disagree with the scalar functions
+
+    The scalar advice takes its medication review from `rules`, so every
+    rule version can be checked.
+    """
+    from advice_engine import generate_advice
+    from clinical_rules import calculate_risk_score
+
+    rules = rules or get_rules()
+    mismatches = []
+    for i, data in enumerate(records):
+        expected = (calculate_risk_score(data), generate_advice(data, rules))
+        if rules.evaluate(data) != expected:
+            mismatches.append(i)
+    return mismatches
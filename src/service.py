@@ -0,0 +1,274 @@
+"""Headless scoring and report service for EHR integration
+
+A small asyncio HTTP/1.1 server (standard library only) that runs next to
+the Streamlit UI and exposes the same scoring, advice and report code
+without rerunning a UI script per request:
+
+    GET  /health             liveness and the active rule set version
+    GET  /metrics            per-stage latency histograms (Prometheus text)
+    POST /v1/assess          one patient_data object -> risk score and advice
+    POST /v1/assess/batch    {"patients": [...]} -> one result per patient
+    POST /v1/report          one patient_data object -> GP report PDF
+    POST /v1/report/batch    {"patients": [...]} -> ZIP of GP report PDFs
+
+Scoring is cheap and runs on the event loop through the shared result
+cache. PDF rendering is CPU bound and goes to a process pool, unless the
+report is already in the shared on-disk report cache. At most
+SERVICE_MAX_CONCURRENCY requests are handled at once; a request that
+cannot start within SERVICE_QUEUE_TIMEOUT seconds gets a 503.
+
+    python src/service.py --port 8081 --workers 4
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from bulk_reports import UniqueNames, _render_one, report_name
+from metrics import render_prometheus, timed
+from patient import PatientRecord
+from report_cache import cached_report
+from result_cache import assess
+from rule_engine import get_rules
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.environ.get('SERVICE_MAX_CONCURRENCY', 32))
+QUEUE_TIMEOUT = float(os.environ.get('SERVICE_QUEUE_TIMEOUT', 5))
+MAX_BATCH = int(os.environ.get('SERVICE_MAX_BATCH', 1000))
+MAX_BODY_BYTES = int(os.environ.get('SERVICE_MAX_BODY_BYTES', 10 * 1024 * 1024))
+KEEP_ALIVE_TIMEOUT = 30  # seconds an idle connection is kept open
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def _patient(data):
+    """Validated PatientRecord from a request object (HTTPError 422 if unusable)"""
+    if not isinstance(data, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "patient must be a JSON object")
+    try:
+        return PatientRecord.from_dict(data)
+    except ValueError as e:
+        raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e)) from None
+
+
+def _patients(body):
+    patients = body.get('patients') if isinstance(body, dict) else None
+    if not isinstance(patients, list):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'expected {"patients": [...]}')
+    if len(patients) > MAX_BATCH:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"at most {MAX_BATCH} patients per batch")
+    return patients
+
+
+def _assessment(record):
+    risk_score, advice = assess(record)
+    return {'risk_score': risk_score, 'advice': advice}
+
+
+class ScoringService:
+    """Request routing plus the shared report worker pool"""
+
+    def __init__(self, workers=None, max_concurrency=MAX_CONCURRENCY):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.requests = asyncio.Semaphore(max_concurrency)
+        # Keep the pool queue short so a burst of batch reports cannot starve single ones
+        self.renders = asyncio.Semaphore(self.workers * 2)
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('POST', '/v1/assess'): self.assess,
+            ('POST', '/v1/assess/batch'): self.assess_batch,
+            ('POST', '/v1/report'): self.report,
+            ('POST', '/v1/report/batch'): self.report_batch,
+        }
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    async def handle(self, method, path, body):
+        """(status, content type, payload bytes) for one request"""
+        route = self.routes.get((method, path.split('?', 1)[0]))
+        if route is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        try:
+            await asyncio.wait_for(self.requests.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "service busy, retry later") from None
+        try:
+            if method == 'POST':
+                try:
+                    body = json.loads(body or b'null')
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "body is not valid JSON") from None
+            return await route(body)
+        finally:
+            self.requests.release()
+
+    async def health(self, body):
+        return _json({'status': 'ok', 'rules_version': get_rules().version})
+
+    async def metrics(self, body):
+        return HTTPStatus.OK, 'text/plain; version=0.0.4', render_prometheus().encode()
+
+    async def assess(self, body):
+        with timed("service_assess"):
+            return _json(_assessment(_patient(body)))
+
+    async def assess_batch(self, body):
+        results = []
+        with timed("service_assess_batch"):
+            for data in _patients(body):
+                try:
+                    results.append(_assessment(_patient(data)))
+                except HTTPError as e:
+                    results.append({'error': str(e)})
+        return _json({'results': results})
+
+    async def _render(self, index, record):
+        risk_score, advice = assess(record)
+        pdf_bytes = cached_report(record, advice, risk_score)
+        if pdf_bytes is not None:
+            return index, report_name(index, record), pdf_bytes, None
+        async with self.renders:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, _render_one, (index, record))
+
+    async def report(self, body):
+        record = _patient(body)
+        with timed("service_report"):
+            _, _, pdf_bytes, error = await self._render(0, record)
+        if error:
+            logger.error(f"Report failed: {error}")
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "report generation failed")
+        return HTTPStatus.OK, 'application/pdf', pdf_bytes
+
+    async def report_batch(self, body):
+        patients = _patients(body)
+        buffer = io.BytesIO()
+        with timed("service_report_batch"), zipfile.ZipFile(buffer, 'w') as archive:
+            jobs, errors, names = [], [], UniqueNames()
+            for index, data in enumerate(patients):
+                try:
+                    jobs.append(self._render(index, _patient(data)))
+                except HTTPError as e:
+                    errors.append(f"{index}: {e}")
+            for index, _, pdf_bytes, error in await asyncio.gather(*jobs):
+                if error:
+                    errors.append(f"{index}: {error}")
+                else:
+                    archive.writestr(names.claim(report_name(index, patients[index]), index), pdf_bytes)
+            if errors:
+                archive.writestr('errors.txt', "\n".join(sorted(errors)) + "\n")
+        return HTTPStatus.OK, 'application/zip', buffer.getvalue()
+
+
+def _json(payload, status=HTTPStatus.OK):
+    return status, 'application/json', json.dumps(payload).encode()
+
+
+async def _read_request(reader):
+    """(method, path, headers, body), or None when the client closed the connection"""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, path, _ = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line") from None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get('content-length') or '0'
+    if not (length.isascii() and length.isdigit()):  # 1*DIGIT, so no sign, space or fraction
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed Content-Length")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), path, headers, body
+
+
+def _response(status, content_type, payload, keep_alive):
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + payload
+
+
+async def _serve_connection(service, reader, writer):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_TIMEOUT)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, content_type, payload = await service.handle(method, path, body)
+            except HTTPError as e:
+                status, content_type, payload = _json({'error': str(e)}, e.status)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            except Exception as e:
+                logger.error(f"Request failed: {e}")
+                status, content_type, payload = _json({'error': "internal error"},
+                                                      HTTPStatus.INTERNAL_SERVER_ERROR)
+            writer.write(_response(status, content_type, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8081, workers=None, ready=None):
+    """Run the service until cancelled; `ready(port)` is called once listening"""
+    service = ScoringService(workers=workers)
+    server = await asyncio.start_server(
+        lambda reader, writer: _serve_connection(service, reader, writer), host, port)
+    bound_port = server.sockets[0].getsockname()[1]
+    logger.info(f"Scoring service listening on http://{host}:{bound_port}")
+    if ready:
+        ready(bound_port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve risk scores, advice and GP reports over HTTP")
+    parser.add_argument("--host", default=os.environ.get('SERVICE_HOST', '127.0.0.1'))
+    parser.add_argument("--port", type=int, default=int(os.environ.get('SERVICE_PORT', 8081)))
+    parser.add_argument("--workers", type=int, default=None, help="PDF rendering processes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+"""Values derived from the patient inputs, recomputed only when their inputs change
+
+Each derived value declares the inputs it reads - patient fields or other
+derived values. Every value carries a version number that is bumped only
+when the value itself changes, and a derived value is recomputed only when
+the version of one of its inputs has moved. So editing the name leaves the
+risk score and advice alone, and retyping "120/80" as "120 / 80" stops at
+the BP parse because the reading is the same.
+
+The memo is a plain dict, kept per user in st.session_state.
+"""
+from clinical_rules import parse_bp
+from medications import match_medications
+from metrics import timed
+from patient import FIELDS, HEIGHT
+from result_cache import cached_risk_score
+from rule_engine import get_rules
+
+
+class DependencyGraph:
+    """Named derived values over a dict of source values"""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def derive(self, name, inputs, stage=None):
+        """Register the decorated function as `name`, called with its inputs as keyword arguments
+
+        `stage` names the metrics histogram its computation time goes to.
+        """
+        def register(compute):
+            self.nodes[name] = (tuple(inputs), compute, stage)
+            return compute
+        return register
+
+    def inputs(self, name):
+        return self.nodes[name][0]
+
+    def _source(self, name, sources, memo):
+        value = sources.get(name)
+        entry = memo.get(name)
+        if entry is None or entry[2] != value:
+            entry = memo[name] = (None, (entry[1] + 1) if entry else 0, value)
+        return entry[1], value
+
+    def resolve(self, name, sources, memo):
+        """(version, value) of `name`, recomputing only what is out of date"""
+        if name not in self.nodes:
+            return self._source(name, sources, memo)
+        inputs, compute, stage = self.nodes[name]
+        resolved = [self.resolve(dependency, sources, memo) for dependency in inputs]
+        versions = tuple(version for version, _ in resolved)
+        entry = memo.get(name)
+        if entry is not None and entry[0] == versions:
+            return entry[1], entry[2]
+
+        arguments = {dependency: value for dependency, (_, value) in zip(inputs, resolved)}
+        if stage:
+            with timed(stage):
+                value = compute(**arguments)
+        else:
+            value = compute(**arguments)
+        # Unchanged output keeps its version, so dependents are not recomputed
+        version = entry[1] if entry is not None and entry[2] == value else (entry[1] + 1 if entry else 0)
+        memo[name] = (versions, version, value)
+        return version, value
+
+    def get(self, name, sources, memo):
+        return self.resolve(name, sources, memo)[1]
+
+
+PATIENT_GRAPH = DependencyGraph()
+
+RISK_FIELDS = ('age', 'weight', 'hba1c', 'ethnicity', 'activity', 'smoker', 'family_history')
+
+
+def sources(patient):
+    """Source values for PATIENT_GRAPH from a PatientRecord or patient_data dict"""
+    values = {field: patient.get(field) for field in FIELDS}
+    values['rules_version'] = get_rules().version
+    return values
+
+
+def _with_reading(values, bp_reading):
+    values['bp'] = f"{bp_reading[0]}/{bp_reading[1]}" if bp_reading else ''
+    return values
+
+
+@PATIENT_GRAPH.derive('bmi', ('weight',))
+def _bmi(weight):
+    return weight / (HEIGHT ** 2) if weight else None
+
+
+@PATIENT_GRAPH.derive('bp_reading', ('bp',))
+def _bp_reading(bp):
+    return parse_bp(bp)
+
+
+@PATIENT_GRAPH.derive('risk_score', RISK_FIELDS + ('bp_reading', 'rules_version'), stage="risk_calc")
+def _risk_score(bp_reading, rules_version, **values):
+    return cached_risk_score(_with_reading(values, bp_reading))
+
+
+@PATIENT_GRAPH.derive('medications', ('meds',), stage="medication_match")
+def _medications(meds):
+    return match_medications(meds)
+
+
+# Advice reads the risk score rather than the fields behind it, and the
+# recognised drugs rather than the medication text
+@PATIENT_GRAPH.derive('advice', ('hba1c', 'bp_reading', 'ethnicity', 'activity', 'smoker',
+                                 'medications', 'risk_score', 'rules_version'), stage="advice")
+def _advice(bp_reading, medications, risk_score, rules_version, **values):
+    values['meds'] = ', '.join(medication.drug for medication in medications)
+    return get_rules(rules_version).advise(_with_reading(values, bp_reading), bp_reading, risk_score)
+
+
+# Built once per result: the bundle's resource ids and issue time would
+# otherwise change on every rerun that re-renders the download button
+@PATIENT_GRAPH.derive('fhir', FIELDS + ('advice', 'risk_score', 'rules_version'), stage="fhir_export")
+def _fhir(advice, risk_score, rules_version, **values):
+    from report_export import fhir_json
+
+    return fhir_json(values, advice, risk_score)
@@ -0,0 +1,66 @@
+"""Seeded synthetic patients for benchmarks and load tests
+
+Distributions are rough approximations of an adult GP list in England:
+ages skewed towards middle age, HbA1c mostly normal with a prediabetic and
+diabetic tail, correlated systolic/diastolic BP and national ethnicity and
+activity proportions. Medication lists are drawn from a small set of common
+repeat prescriptions written in GP free-text style. No real patient data is
+involved.
+"""
+import numpy as np
+import pandas as pd
+
+ETHNICITY_SHARES = {"White": 0.82, "South Asian": 0.09, "Black African": 0.04, "Mixed/Other": 0.05}
+ACTIVITY_SHARES = {"<30 mins": 0.25, "30-150 mins": 0.40, "150+ mins": 0.35}
+SMOKER_RATE = 0.13
+FAMILY_HISTORY_RATE = 0.25
+MEDICATION_COUNTS = {0: 0.45, 1: 0.2, 2: 0.15, 3: 0.1, 4: 0.06, 6: 0.04}
+PRESCRIPTIONS = (
+    "Ramipril 5mg od", "Amlodipine 10mg", "Omeprazole 20mg OD", "Levothyroxine 50mcg",
+    "Aspirin 75mg", "Sertraline 50mg", "Salbutamol inhaler prn", "Lansoprazole 30mg",
+    "Bisoprolol 2.5mg", "Co-codamol 30/500", "Metformin 500mg bd", "Glucophage SR 1g",
+    "Atorvastatin 20mg ON", "Simvastatin 40mg", "Lipitor 40mg", "Prednisolone 5mg",
+    "Quetiapine 100mg", "Olanzapine 10mg nocte", "metformin500mg", "atorvastatine 10mg",
+)
+
+
+def _medication_lists(rng, n):
+    counts = rng.choice(list(MEDICATION_COUNTS), n, p=list(MEDICATION_COUNTS.values()))
+    return [', '.join(rng.choice(PRESCRIPTIONS, count, replace=False)) for count in counts]
+
+
+def generate_cohort(n, seed=0):
+    """DataFrame of `n` patients with the patient_data fields"""
+    rng = np.random.default_rng(seed)
+    age = np.clip(rng.normal(52, 16, n), 18, 100).round().astype(int)
+    # Log-normal keeps most readings 32-41 with a long tail above 48
+    hba1c = np.clip(rng.lognormal(np.log(38), 0.16, n), 20, 150).round().astype(int)
+    systolic = np.clip(rng.normal(100 + 0.5 * age, 15), 85, 220).round().astype(int)
+    diastolic = np.clip(0.45 * systolic + rng.normal(22, 7, n), 45, 130).round().astype(int)
+    weight = np.clip(rng.normal(80, 16, n), 30, 300).round(1)
+
+    ethnicity = rng.choice(list(ETHNICITY_SHARES), n, p=list(ETHNICITY_SHARES.values()))
+    activity = rng.choice(list(ACTIVITY_SHARES), n, p=list(ACTIVITY_SHARES.values()))
+    smoker = rng.random(n) < SMOKER_RATE
+    family_history = rng.random(n) < FAMILY_HISTORY_RATE
+
+    return pd.DataFrame({
+        'name': [f"Patient {i}" for i in range(n)],
+        'age': age,
+        'weight': weight,
+        'bp': pd.Series(systolic).astype(str) + '/' + pd.Series(diastolic).astype(str),
+        'hba1c': hba1c,
+        'ethnicity': ethnicity,
+        'activity': activity,
+        'meds': _medication_lists(rng, n),  # drawn last so the other columns keep their values
+        'smoker': smoker,
+        'family_history': family_history,
+    })
+
+
+def generate_records(n, seed=0):
+    """The same cohort as a list of patient_data dicts with plain Python values"""
+    return [
+        {key: value.item() if hasattr(value, 'item') else value for key, value in row.items()}
+        for row in generate_cohort(n, seed).to_dict('records')
+    ]
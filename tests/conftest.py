@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app's modules are flat files in src/, imported as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
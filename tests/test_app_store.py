@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import patient_store
+
+APP = os.path.join(os.path.dirname(__file__), '..', 'src', 'app.py')
+
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'store.db')
+    monkeypatch.setattr(patient_store, 'STORE_PATH', path)
+    yield path
+    patient_store.get_store(path).close()
+
+
+def _session():
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state.consent = True
+    return at.run()
+
+
+def _save(at, name, hba1c):
+    at.text_input[0].set_value(name)
+    at.slider[0].set_value(hba1c)
+    return at.button[0].click().run()
+
+
+def test_assessments_are_keyed_on_the_session_not_the_name(store_path):
+    first, second = _session(), _session()
+    _save(first, "Jane Smith", 45)
+    _save(first, "Jane Smith", 45)
+    _save(second, "Jane Smith", 60)
+
+    store = patient_store.get_store(store_path)
+    assert store.count() == 3
+    assert [row['hba1c'] for row in store.history(first.session_state.store_id, limit=5)] == [45, 45]
+    assert [row['hba1c'] for row in store.history(second.session_state.store_id, limit=5)] == [60]
+    assert store.history("Jane Smith") == []
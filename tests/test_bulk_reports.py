@@ -0,0 +1,53 @@
+import os
+import zipfile
+
+import pytest
+
+from bulk_reports import UniqueNames, _read_records, generate_reports, report_name
+from report_export import write_html_archive
+
+
+@pytest.mark.parametrize('patient_id, name', [
+    ('9434765919', '9434765919_report.pdf'),
+    (9434765919.0, '9434765919_report.pdf'),
+    ('../../escape', 'escape_report.pdf'),
+    ('/etc/passwd', 'etc_passwd_report.pdf'),
+    ('..', '000007_report.pdf'),
+    ('', '000007_report.pdf'),
+    (None, '000007_report.pdf'),
+    (float('nan'), '000007_report.pdf'),
+    ('A B/C', 'A_B_C_report.pdf'),
+])
+def test_report_name_is_a_safe_basename(patient_id, name):
+    assert report_name(7, {'patient_id': patient_id}) == name
+
+
+def test_repeated_names_get_the_row_number():
+    names = UniqueNames()
+    assert names.claim('123_report.pdf', 0) == '123_report.pdf'
+    assert names.claim('123_report.pdf', 4) == '123_report_000004.pdf'
+    assert names.claim('123_report.pdf', 4) == '123_report_000004_2.pdf'
+
+
+def test_blank_ids_do_not_turn_the_column_into_floats(tmp_path):
+    path = tmp_path / 'patients.csv'
+    path.write_text("patient_id,age\n9434765919,50\n,60\n")
+    assert [record['patient_id'] for record in _read_records(path)][0] == '9434765919'
+
+
+def test_reports_stay_inside_the_output_directory(tmp_path):
+    records = [{'patient_id': '../../escape', 'hba1c': 45}, {'patient_id': '1', 'hba1c': 40},
+               {'patient_id': '1', 'hba1c': 50}]
+    output = tmp_path / 'out' / 'reports'
+    stats = generate_reports(records, str(output), workers=1)
+    assert stats['written'] == 3
+    assert sorted(os.listdir(output)) == ['1_report.pdf', '1_report_000002.pdf', 'escape_report.pdf']
+    assert sorted(os.listdir(tmp_path / 'out')) == ['reports']
+
+
+def test_html_archive_members_are_unique(tmp_path):
+    reports = [({'patient_id': '../x', 'name': 'A'}, {'recommendations': [], 'summary': '', 'referral': False,
+                                                     'priority': 'LOW'}, 5.0)] * 2
+    write_html_archive(reports, tmp_path / 'a.zip')
+    with zipfile.ZipFile(tmp_path / 'a.zip') as archive:
+        assert archive.namelist() == ['x_report.html', 'x_report_000001.html']
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from cohort_advice import advice_parity_mismatches, generate_advice_batch, render_rows
+from patient_columns import PatientColumns
+from rule_engine import get_rules
+from synthetic_cohort import generate_cohort, generate_records
+
+BASE = {'age': 50, 'hba1c': 40, 'ethnicity': 'White', 'bp': '120/80', 'weight': 70,
+        'activity': '30-150 mins', 'smoker': False, 'family_history': False, 'meds': ''}
+
+
+def _batch_advice(**changes):
+    cohort = pd.DataFrame([{**BASE, **changes}])
+    return render_rows(cohort, generate_advice_batch(cohort), cohort.index)[0]
+
+
+def generate_advice(data):
+    return get_rules().generate_advice(data)
+
+
+@pytest.mark.parametrize('version', ['1', '2'])
+def test_synthetic_cohort_matches_scalar(version):
+    assert len(advice_parity_mismatches(generate_cohort(20_000, seed=1), get_rules(version))) == 0
+
+
+def test_patient_columns_match_scalar():
+    columns = PatientColumns.from_records(generate_records(2_000, seed=2), keep_text=True)
+    assert len(advice_parity_mismatches(columns)) == 0
+
+
+@pytest.mark.parametrize('hba1c', [38, 39, 41, 42, 47, 47.5, 48])
+def test_hba1c_band_edges(hba1c):
+    assert _batch_advice(hba1c=hba1c) == generate_advice({**BASE, 'hba1c': hba1c})
+
+
+@pytest.mark.parametrize('bp', ['139/89', '140/80', '120/90', '159/95', '160/100', '', 'abc'])
+def test_hypertension_and_referral_edges(bp):
+    assert _batch_advice(bp=bp) == generate_advice({**BASE, 'bp': bp})
+
+
+@pytest.mark.parametrize('changes', [
+    {'ethnicity': 'South Asian'}, {'activity': '<30 mins'}, {'smoker': True},
+    {'meds': 'metformin 500mg, atorvastatin'}, {'age': 80, 'weight': 110, 'smoker': True},
+])
+def test_other_recommendations(changes):
+    assert _batch_advice(**changes) == generate_advice({**BASE, **changes})
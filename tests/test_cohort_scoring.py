@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from clinical_rules import calculate_risk_score
+from cohort_scoring import calculate_risk_scores, parity_mismatches
+from patient_columns import PatientColumns
+from synthetic_cohort import generate_cohort, generate_records
+
+BASE = {'age': 50, 'hba1c': 40, 'ethnicity': 'White', 'bp': '120/80', 'weight': 70,
+        'activity': '30-150 mins', 'smoker': False, 'family_history': False}
+
+
+def _batch_score(**changes):
+    return calculate_risk_scores(pd.DataFrame([{**BASE, **changes}]))[0]
+
+
+def test_synthetic_cohort_matches_scalar():
+    assert len(parity_mismatches(generate_cohort(20_000, seed=1))) == 0
+
+
+def test_patient_columns_match_scalar():
+    columns = PatientColumns.from_records(generate_records(2_000, seed=2))
+    assert len(parity_mismatches(columns)) == 0
+
+
+@pytest.mark.parametrize('hba1c', [41, 41.9, 42, 47, 47.5, 47.9, 48, 48.0, 120])
+def test_hba1c_band_edges(hba1c):
+    assert _batch_score(hba1c=hba1c) == calculate_risk_score({**BASE, 'hba1c': hba1c})
+
+
+def test_hba1c_between_bands_scores_as_normal():
+    # 42 <= x <= 47 and x >= 48 leave 47.5 in neither band
+    assert _batch_score(hba1c=47.5) == _batch_score(hba1c=40)
+
+
+@pytest.mark.parametrize('age', [34, 34.9, 35, 44, 45, 54, 55, 64, 65, 90])
+def test_age_band_edges(age):
+    assert _batch_score(age=age) == calculate_risk_score({**BASE, 'age': age})
+
+
+@pytest.mark.parametrize('bp', ['139/80', '140/80', '159/95', '160/100', '200/120'])
+def test_systolic_edges(bp):
+    assert _batch_score(bp=bp) == calculate_risk_score({**BASE, 'bp': bp})
+
+
+def test_systolic_160_is_shadowed_by_140():
+    # The scalar if-chain tests >= 140 first, so >= 160 never scores its 5 points
+    assert calculate_risk_score({**BASE, 'bp': '170/90'}) == calculate_risk_score({**BASE, 'bp': '145/90'})
+    assert _batch_score(bp='170/90') == _batch_score(bp='145/90')
+
+
+def test_nan_age_matches_scalar():
+    assert _batch_score(age=math.nan) == calculate_risk_score({**BASE, 'age': math.nan})
+
+
+@pytest.mark.parametrize('bp', ['', 'abc', '120/', '/80', '120-80', '120/80/60', None])
+def test_malformed_bp_matches_scalar(bp):
+    assert _batch_score(bp=bp) == calculate_risk_score({**BASE, 'bp': bp})
+
+
+def test_missing_columns_use_scalar_defaults():
+    cohort = {'age': np.array([30, 60]), 'hba1c': np.array([45, 50])}
+    expected = [calculate_risk_score({'age': 30, 'hba1c': 45}), calculate_risk_score({'age': 60, 'hba1c': 50})]
+    assert list(calculate_risk_scores(cohort)) == expected
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from ingest import ingest, normalise_chunk, score_chunk
+from patient_store import PatientStore, import_scores
+from rule_engine import get_rules
+from synthetic_cohort import generate_cohort
+
+
+def test_boolean_fields_from_numbers_strings_and_missing():
+    chunk = pd.DataFrame({'current_smoker': [1.0, 0.0, 2, True, 'Yes', ' y ', 'no', None, float('nan'), pd.NA]})
+    assert normalise_chunk(chunk)['smoker'].tolist() == [True, False, True, True, True, True, False, False, False,
+                                                        False]
+
+
+def test_nullable_boolean_column():
+    chunk = pd.DataFrame({'family_history': pd.array([True, pd.NA, False], dtype='boolean')})
+    assert normalise_chunk(chunk)['family_history'].tolist() == [True, False, False]
+
+
+def test_bp_skipped_when_either_side_missing():
+    chunk = pd.DataFrame({'systolic': [120, None, 130, 'x'], 'diastolic': [80, 80, None, 70]})
+    assert normalise_chunk(chunk)['bp'].tolist() == ['120/80', None, None, None]
+
+
+def _extract(path, rows=250):
+    cohort = generate_cohort(rows, seed=3)
+    cohort.insert(0, 'patient_id', [f"P{i:05d}" for i in range(rows)])
+    cohort.to_csv(path, index=False)
+
+
+def test_rows_carry_the_rules_version(tmp_path):
+    _extract(tmp_path / 'extract.csv')
+    ingest(str(tmp_path / 'extract.csv'), str(tmp_path / 'scores.csv'), chunksize=100)
+    scores = pd.read_csv(tmp_path / 'scores.csv', dtype={'rules_version': str})
+    assert set(scores['rules_version']) == {get_rules().version}
+
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path):
+    source = str(tmp_path / 'extract.csv')
+    _extract(source)
+    ingest(source, str(tmp_path / 'expected.csv'), chunksize=100)
+
+    def interrupt(checkpoint):
+        if checkpoint['chunks'] == 1:
+            raise KeyboardInterrupt
+
+    output = str(tmp_path / 'scores.csv')
+    with pytest.raises(KeyboardInterrupt):
+        ingest(source, output, chunksize=100, progress=interrupt)
+    with open(output, 'a') as f:
+        f.write("P99999,half-written row")  # a chunk cut off before its checkpoint
+    checkpoint = ingest(source, output, chunksize=100, resume=True)
+
+    assert checkpoint['rows'] == 250
+    assert (tmp_path / 'scores.csv').read_bytes() == (tmp_path / 'expected.csv').read_bytes()
+
+
+def test_import_keeps_the_version_rows_were_scored_under(tmp_path):
+    _extract(tmp_path / 'extract.csv', rows=20)
+    patients = normalise_chunk(pd.read_csv(tmp_path / 'extract.csv'))
+    score_chunk(patients, get_rules('1')).to_csv(tmp_path / 'scores.csv', index=False)
+    store = PatientStore(':memory:')
+    assert import_scores(store, str(tmp_path / 'scores.csv'), '2024-04-01') == 20
+    assert store.rules_versions() == ['1']
+    latest = store.latest('P00000')
+    assert latest['advice'] == get_rules('1').generate_advice(patients.iloc[0].to_dict())
@@ -0,0 +1,18 @@
+import os
+import stat
+
+from local_services import ARRAYS, build_index, load_index
+
+
+def test_index_files_are_world_readable(tmp_path):
+    directory = tmp_path / 'index'
+    build_index(directory=str(directory))
+    names = sorted(os.listdir(directory))
+    assert names == sorted([f"{name}.npy" for name in ARRAYS] + ['meta.json'])
+    for name in names:
+        assert stat.S_IMODE(os.stat(directory / name).st_mode) == 0o644
+
+
+def test_rebuilt_index_answers_queries(tmp_path):
+    index = load_index(directory=str(tmp_path))
+    assert len(index.nearest(51.5, -0.1, 3)) == 3
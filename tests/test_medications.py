@@ -0,0 +1,48 @@
+import pytest
+
+from medications import match_medications, medication_classes, recognised_drugs
+
+
+@pytest.mark.parametrize('meds, drugs', [
+    ("Glucophage SR 500mg bd, atorvastatin 20mg", ['atorvastatin', 'metformin']),
+    ("Metformin500mg bd", ['metformin']),
+    ("metfromin 1g", ['metformin']),
+    ("nystatin oral suspension", []),
+    ("Prednisolone 5mg, Salbutamol inhaler prn", ['prednisolone']),
+    ("beclometasone inhaler and prednisolone 30mg od", ['prednisolone']),
+    ("hydrocortisone 10mg tablets", ['hydrocortisone']),
+    ("", []),
+    (None, []),
+])
+def test_recognised_drugs(meds, drugs):
+    assert recognised_drugs(meds) == ', '.join(drugs)
+
+
+@pytest.mark.parametrize('meds', [
+    "hydrocortisone cream 1%",
+    "Hydrocortisone 1% ointment",
+    "prednisolone eye drops",
+    "Prednisolone 0.5% ear drops",
+    "topical hydrocortisone",
+    "dexamethasone eye drops qds",
+])
+def test_non_systemic_routes_are_not_flagged(meds):
+    assert medication_classes(meds) == ()
+
+
+@pytest.mark.parametrize('meds', [
+    "no metformin",
+    "Nil metformin",
+    "stopped metformin 2023",
+    "not on statins",
+    "metformin (stopped)",
+    "atorvastatin discontinued - myalgia",
+])
+def test_negated_drugs_are_not_flagged(meds):
+    assert match_medications(meds) == ()
+
+
+def test_route_and_negation_only_apply_to_their_clause():
+    meds = "no metformin; hydrocortisone cream, prednisolone 5mg, simvastatin 40mg"
+    assert [medication.drug for medication in match_medications(meds)] == ['prednisolone', 'simvastatin']
+    assert medication_classes(meds) == ('statin', 'steroid')
@@ -0,0 +1,49 @@
+import importlib
+import os
+import stat
+import time
+
+import report_cache
+from report_cache import ReportCache
+
+
+def test_cache_is_off_unless_configured(monkeypatch):
+    monkeypatch.delenv('REPORT_CACHE_DIR', raising=False)
+    try:
+        importlib.reload(report_cache)
+        assert report_cache.REPORT_CACHE_DIR == ''
+        assert report_cache.get_report_cache() is None
+    finally:
+        monkeypatch.undo()
+        importlib.reload(report_cache)
+
+
+def test_directories_are_private(tmp_path):
+    cache = ReportCache(str(tmp_path / 'reports'))
+    cache.put('ab' * 32, b'%PDF-1')
+    for path in (cache.path, os.path.dirname(cache._file('ab' * 32))):
+        assert stat.S_IMODE(os.stat(path).st_mode) & 0o077 == 0
+    assert cache.get('ab' * 32) == b'%PDF-1'
+
+
+def _age(cache, key, seconds):
+    then = time.time() - seconds
+    os.utime(cache._file(key), (then, then))
+
+
+def test_unused_entries_expire_on_read(tmp_path):
+    cache = ReportCache(str(tmp_path), ttl=60)
+    cache.put('cd' * 32, b'%PDF-2')
+    _age(cache, 'cd' * 32, 120)
+    assert cache.get('cd' * 32) is None
+    assert not os.path.exists(cache._file('cd' * 32))
+
+
+def test_evict_removes_expired_entries_under_the_size_limit(tmp_path):
+    cache = ReportCache(str(tmp_path), ttl=60)
+    cache.put('ef' * 32, b'%PDF-3')
+    cache.put('01' * 32, b'%PDF-4')
+    _age(cache, 'ef' * 32, 120)
+    assert cache.evict() == 1
+    assert cache.get('ef' * 32) is None
+    assert cache.get('01' * 32) == b'%PDF-4'
@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import Future
+
+from report_jobs import DONE, FAILED, Job, ReportQueue
+
+
+def _finished_future(result=None, exception=None):
+    future = Future()
+    future.set_running_or_notify_cancel()
+    if exception is None:
+        future.set_result(result)
+    else:
+        future.set_exception(exception)
+    return future
+
+
+def test_status_of_finished_jobs():
+    done = Job('k', _finished_future((b'%PDF', 0.01)))
+    assert done.status == DONE
+    assert done.result() == b'%PDF'
+    failed = Job('k', _finished_future(exception=RuntimeError("render failed")))
+    assert failed.status == FAILED
+    assert str(failed.error) == "render failed"
+
+
+def test_cancelled_job_is_failed():
+    future = Future()
+    future.cancel()
+    job = Job('k', future)
+    assert job.status == FAILED
+    assert job.error == "cancelled"
+
+
+def test_queue_survives_cancelled_jobs(monkeypatch):
+    monkeypatch.setattr('report_jobs.cached_report', lambda *args: None)
+    queue = ReportQueue(workers=1, max_depth=4, pool='thread')
+    release = threading.Event()
+    try:
+        busy = queue.pool.submit(release.wait)  # holds the only worker
+        job_id = queue.submit({'name': "A", 'hba1c': 45}, {}, 5.0)
+        job = queue.get(job_id)
+        assert job.future.cancel()
+        assert job.status == FAILED
+        assert queue.stats()['pending'] == 0
+        # A failed job is not merged into; the retry gets a new job
+        assert queue.submit({'name': "A", 'hba1c': 45}, {}, 5.0) != job_id
+    finally:
+        release.set()
+        busy.result()
+        queue.close()
+
+
+def test_render_time_is_observed_in_the_parent(monkeypatch):
+    monkeypatch.setattr('report_jobs.cached_report', lambda *args: None)
+    monkeypatch.setattr('report_jobs._render', lambda *args: (b'%PDF', 0.25))
+    observed = []
+    monkeypatch.setattr('report_jobs.observe', lambda stage, seconds: observed.append((stage, seconds)))
+    queue = ReportQueue(workers=1, max_depth=4, pool='thread')
+    try:
+        job = queue.get(queue.submit({'name': "A", 'hba1c': 45}, {}, 5.0))
+        assert job.result(timeout=5) == b'%PDF'
+        assert job.wait(5)
+    finally:
+        queue.close()
+    assert ('pdf_render', 0.25) in observed
@@ -0,0 +1,68 @@
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from patient_columns import PatientColumns
+from risk_table import get_risk_table, lookup_risk_scores, table_parity_mismatches, what_if_surface
+from rule_engine import RuleSet, get_rules
+from synthetic_cohort import generate_cohort, generate_records
+
+BASE = {'age': 50, 'hba1c': 40, 'ethnicity': 'White', 'bp': '120/80', 'weight': 70,
+        'activity': '30-150 mins', 'smoker': False, 'family_history': False}
+
+
+@pytest.mark.parametrize('version', ['1', '2'])
+def test_synthetic_cohort_matches_rules(version):
+    assert len(table_parity_mismatches(generate_cohort(20_000, seed=1), get_rules(version))) == 0
+
+
+def test_patient_columns_match_rules():
+    assert len(table_parity_mismatches(PatientColumns.from_records(generate_records(2_000, seed=2)))) == 0
+
+
+@pytest.mark.parametrize('changes', [
+    {'hba1c': 47.5}, {'hba1c': 42}, {'hba1c': 48},
+    {'age': 35}, {'age': 65}, {'age': math.nan},
+    {'bp': '160/100'}, {'bp': '140/80'}, {'bp': '139/95'},
+    {'bp': ''}, {'bp': 'abc'}, {'bp': '120/'}, {'bp': None},
+    {'weight': 76.5625}, {'weight': 91.875}, {'weight': 120},
+    {'ethnicity': 'South Asian'}, {'ethnicity': 'Other'}, {'activity': '<30 mins'},
+    {'smoker': True, 'family_history': True},
+])
+def test_band_edges(changes):
+    patient = {**BASE, **changes}
+    assert lookup_risk_scores(pd.DataFrame([patient]))[0] == get_rules().calculate_risk_score(patient)
+
+
+def test_missing_columns_use_rule_defaults():
+    cohort = {'hba1c': [50, 40]}
+    expected = [get_rules().calculate_risk_score({'hba1c': hba1c}) for hba1c in cohort['hba1c']]
+    assert lookup_risk_scores(cohort).tolist() == expected
+
+
+def test_table_follows_the_rule_set():
+    spec = copy.deepcopy(get_rules().spec)
+    spec['version'] = '99'
+    spec['score']['systolic']['bands'][0]['min'] = 130
+    rules = RuleSet(spec)
+    cohort = pd.DataFrame([{**BASE, 'bp': '135/80'}])
+    assert lookup_risk_scores(cohort, rules)[0] > lookup_risk_scores(cohort)[0]
+    assert len(table_parity_mismatches(generate_cohort(5_000, seed=3), rules)) == 0
+
+
+def test_table_is_built_once_per_rule_set():
+    assert get_risk_table() is get_risk_table(get_rules())
+    assert get_risk_table(get_rules('1')) is not get_risk_table(get_rules('2'))
+
+
+def test_what_if_surface_matches_rules():
+    patient = {**BASE, 'smoker': True, 'bp': '150/90'}
+    weights, hba1c_values = [55, 80, 95], np.arange(30, 60)
+    surface = what_if_surface(patient, weights, hba1c_values, smoker=False)
+    rules = get_rules()
+    expected = [[rules.calculate_risk_score({**patient, 'smoker': False, 'weight': w, 'hba1c': h})
+                 for w in weights] for h in hba1c_values]
+    assert surface.tolist() == expected
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import rule_engine
+from synthetic_cohort import generate_records
+
+RULES = os.path.join(os.path.dirname(__file__), '..', 'src', 'rules')
+
+
+@pytest.fixture
+def rules_dir(tmp_path, monkeypatch):
+    for name in os.listdir(RULES):
+        shutil.copy(os.path.join(RULES, name), tmp_path)
+    monkeypatch.setattr(rule_engine, 'RULES_DIR', str(tmp_path))
+    monkeypatch.setattr(rule_engine, 'RELOAD_INTERVAL', 0)
+    monkeypatch.setattr(rule_engine, '_versions', {})
+    monkeypatch.setattr(rule_engine, '_active', None)
+    return tmp_path
+
+
+def _spec(version):
+    with open(os.path.join(RULES, 'v2.json'), encoding='utf-8') as f:
+        spec = json.load(f)
+    spec['version'] = version
+    return spec
+
+
+@pytest.mark.parametrize('version', [None, '1', '2'])
+def test_rules_match_scalar(version):
+    records = generate_records(3_000, seed=7)
+    rules = rule_engine.get_rules(version) if version else None
+    assert rule_engine.parity_mismatches(records, rules) == []
+
+
+def test_medication_advice_only_from_v2():
+    data = {'hba1c': 40, 'meds': "atorvastatin 20mg"}
+    assert not any("statin listed" in text for text in rule_engine.get_rules('1').generate_advice(data)['recommendations'])
+    assert any("statin listed" in text for text in rule_engine.get_rules('2').generate_advice(data)['recommendations'])
+
+
+def test_scalar_advice_reviews_medications_only_with_rules():
+    from advice_engine import generate_advice
+
+    data = {'hba1c': 40, 'meds': "atorvastatin 20mg"}
+    assert not any("statin listed" in text for text in generate_advice(data)['recommendations'])
+    assert generate_advice(data, rule_engine.get_rules('2')) == rule_engine.get_rules('2').generate_advice(data)
+
+
+def test_half_written_file_is_skipped(rules_dir):
+    (rules_dir / 'v3.json').write_text('{"version": "3", "score": {')
+    assert rule_engine.available_versions() == {'1': str(rules_dir / 'v1.json'), '2': str(rules_dir / 'v2.json')}
+    assert rule_engine.get_rules().version == '2'
+
+
+def test_uncompilable_file_keeps_last_good_rules(rules_dir):
+    assert rule_engine.get_rules().version == '2'
+    spec = _spec('3')
+    del spec['score']['age']
+    (rules_dir / 'v3.json').write_text(json.dumps(spec))
+    assert rule_engine.get_rules().version == '2'
+    with pytest.raises(KeyError):
+        rule_engine.get_rules('3')
+
+
+def test_new_version_becomes_active(rules_dir):
+    (rules_dir / 'v10.json').write_text(json.dumps(_spec('10')))
+    assert rule_engine.get_rules().version == '10'
+
+
+@pytest.mark.parametrize('version', ['2a', 'v3', '', '2.', '1..2'])
+def test_invalid_versions_are_rejected(rules_dir, version):
+    (rules_dir / 'bad.json').write_text(json.dumps(_spec(version)))
+    assert sorted(rule_engine.available_versions()) == ['1', '2']
+    assert rule_engine.get_rules().version == '2'
+    with pytest.raises(ValueError):
+        rule_engine.RuleSet(_spec(version))
+
+
+def test_version_order_is_numeric():
+    assert sorted(['10', '2', '2.1', '1.9'], key=rule_engine._version_key) == ['1.9', '2', '2.1', '10']
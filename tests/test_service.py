@@ -0,0 +1,52 @@
+import asyncio
+import io
+import json
+import zipfile
+from http import HTTPStatus
+
+import pytest
+
+import service as service_module
+from service import HTTPError, ScoringService, _read_request
+
+
+def test_report_batch_member_names_are_safe_and_unique():
+    service = ScoringService(workers=1)
+    try:
+        body = json.dumps({'patients': [{'patient_id': '../../escape', 'hba1c': 45},
+                                        {'patient_id': 'A1', 'hba1c': 40},
+                                        {'patient_id': 'A1', 'hba1c': 50}]}).encode()
+        status, _, payload = asyncio.run(service.handle('POST', '/v1/report/batch', body))
+    finally:
+        service.close()
+    assert status == 200
+    with zipfile.ZipFile(io.BytesIO(payload)) as archive:
+        assert sorted(archive.namelist()) == ['A1_report.pdf', 'A1_report_000002.pdf', 'escape_report.pdf']
+
+
+def _read(raw):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await _read_request(reader)
+    return asyncio.run(read())
+
+
+@pytest.mark.parametrize('length', ['abc', '-1', '+5', '1.5', '5, 5'])
+def test_malformed_content_length_is_a_bad_request(length):
+    with pytest.raises(HTTPError) as error:
+        _read(f"POST /v1/score HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}".encode())
+    assert error.value.status == HTTPStatus.BAD_REQUEST
+
+
+def test_content_length_over_the_limit_is_too_large(monkeypatch):
+    monkeypatch.setattr(service_module, 'MAX_BODY_BYTES', 10)
+    with pytest.raises(HTTPError) as error:
+        _read(b"POST /v1/score HTTP/1.1\r\nContent-Length: 11\r\n\r\n")
+    assert error.value.status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def test_body_read_to_content_length():
+    assert _read(b"POST /v1/score HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}") == \
+        ('POST', '/v1/score', {'content-length': '2'}, b'{}')
@@ -0,0 +1,30 @@
+import json
+
+from patient import DEFAULTS
+from session_graph import PATIENT_GRAPH, sources
+
+
+def _get(name, patient, memo):
+    return PATIENT_GRAPH.get(name, sources(patient), memo)
+
+
+def test_fhir_record_is_built_once_per_result():
+    memo, patient = {}, dict(DEFAULTS, name="A Patient")
+    first = _get('fhir', patient, memo)
+    assert _get('fhir', dict(patient), memo) is first
+
+    changed = _get('fhir', dict(patient, hba1c=50), memo)
+    assert changed != first
+    bundle = json.loads(changed)
+    assessment = next(entry['resource'] for entry in bundle['entry']
+                      if entry['resource']['resourceType'] == 'RiskAssessment')
+    assert assessment['prediction'][0]['probabilityDecimal'] * 100 == _get('risk_score', dict(patient, hba1c=50), memo)
+
+
+def test_name_change_rebuilds_fhir_but_not_risk():
+    memo, patient = {}, dict(DEFAULTS, name="A Patient")
+    _get('fhir', patient, memo)
+    risk_version = memo['risk_score'][1]
+    renamed = _get('fhir', dict(patient, name="B Patient"), memo)
+    assert "B Patient" in renamed.decode()
+    assert memo['risk_score'][1] == risk_version
@@ -0,0 +1,35 @@
+"""Lazy loading on the app's first render
+
+The import-time budget is a wall-clock check and lives in
+benchmarks/startup_profile.py.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from startup_profile import LAZY_MODULES, app_imports, profile  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def first_render():
+    return profile()
+
+
+@pytest.mark.parametrize('module', LAZY_MODULES)
+def test_lazy_modules_not_imported(first_render, module):
+    _, summary = first_render
+    assert module not in summary['modules']
+
+
+def test_first_render_raises_nothing(first_render):
+    _, summary = first_render
+    assert summary['exceptions'] == []
+
+
+def test_streamlit_modules_left_out_of_import_time():
+    rows = [('streamlit.emojis', 70_000, 70_000, 0),
+            ('report_jobs', 200, 200, 1), ('streamlit.runtime', 5_000, 5_000, 1), ('app_module', 100, 5_300, 0)]
+    assert app_imports(rows) == [('app_module', 100, 300)]